@@ -1,8 +1,5 @@
 #!/bin/bash
-set -a
-source ../.env  # Correct path to .env file
-set +a
+# Extra arguments are passed on as filters, e.g. --since 2025-06-01 --mode online --complete true
+docker compose exec -T backend python manage.py export_rounds prisoners "$@" > data_prisoner.csv
 
-docker compose exec -T db psql -U postgres -d "$DB_NAME" < "../$SQL_FILE_PRISONERS" > data_prisoner.csv
-
-echo "SQL query executed, output saved to data_prisoner.csv"
+echo "Export written to data_prisoner.csv"
@@ -1,9 +1,5 @@
 #!/bin/bash
+# Extra arguments are passed on as filters, e.g. --since 2025-06-01 --mode online --complete true
+docker compose exec -T backend python manage.py export_rounds ultimatum "$@" > ultimatum_output_data.csv
 
-set -a
-source ../.env
-set +a
-
-docker compose exec -T db psql -U postgres -d "$DB_NAME" < "../$SQL_FILE_ULTIMATUM" > ultimatum_output_data.csv
-
-echo "SQL query executed, output saved to ultimatum_output_data.csv"
\ No newline at end of file
+echo "Export written to ultimatum_output_data.csv"
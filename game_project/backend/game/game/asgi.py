@@ -7,13 +7,15 @@ from the_game.routing import websocket_urlpatterns as pd_ws
 
 from ultimatum.routing import websocket_urlpatterns as ult_ws
 
+from game.routing import websocket_urlpatterns as watch_ws
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "game.settings")
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
-            pd_ws + ult_ws
+            pd_ws + ult_ws + watch_ws
         )
     ),
 })
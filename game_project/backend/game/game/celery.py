@@ -0,0 +1,13 @@
+"""
+Celery app of the project: `celery -A game worker --beat` runs the
+scheduled jobs of CELERY_BEAT_SCHEDULE (settings.py). Tasks live in the
+tasks.py of each app.
+"""
+import os
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'game.settings')
+
+app = Celery('game')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
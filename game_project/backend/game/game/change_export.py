@@ -0,0 +1,120 @@
+"""
+Incremental CSV exports of the newly completed matches of both games.
+
+The research exports (exports.py) write every match each time. Here each
+game has a watermark row (the_game.ExportWatermark, "changes:<game>"):
+the completion minute and primary key of the last match exported, the
+highest round primary key exported, and running totals. A run writes the
+rounds of the matches completed after the watermark, in the columns of
+the research export, then moves it forward. Completed matches are walked
+in (completion minute, primary key) order through the completion index
+of each match table, so a run reads only what is new.
+
+Matches are taken BATCH_MATCHES at a time, one CSV file per batch in
+<CHANGE_EXPORT_DIR>/<game>/, named after the last match of the batch.
+The watermark row is locked while a batch is written and only moved
+once the file has its final name. A run that dies after the rename but
+before the commit writes the same file again on the next run.
+
+Completion times are stored to the minute, so a run only takes the
+minutes that are over: a match finishing while it runs is left for the
+next run.
+
+Run it with `manage.py export_changes`, or let Celery beat run it every
+CHANGE_EXPORT_INTERVAL seconds (the_game/tasks.py).
+"""
+import csv
+import os
+import re
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from .exports import EXPORTS
+
+BATCH_MATCHES = 500
+
+
+class ChangeExport:
+    """The incremental export of one RoundExport."""
+
+    def __init__(self, export, directory):
+        self.export = export
+        self.directory = os.path.join(directory, export.game)
+        self.match_model = apps.get_model(export.model)._meta.get_field('match').related_model
+        # the match's own fields behind the export's 'match__...' paths
+        self.complete_field = export.complete_field.split('__', 1)[1]
+        self.completed_at_field = export.completed_at_field.split('__', 1)[1]
+
+    @property
+    def name(self):
+        return f"changes:{self.export.game}"
+
+    def pending(self, mark, before):
+        """
+        The next matches completed after the watermark and before the
+        minute `before`, as (primary key, completed at), in that order.
+        """
+        matches = self.match_model.objects.filter(**{
+            self.complete_field: True,
+            f"{self.completed_at_field}__lt": before,
+        })
+        if mark.completed_at:
+            matches = matches.filter(
+                Q(**{f"{self.completed_at_field}__gt": mark.completed_at}) |
+                Q(**{self.completed_at_field: mark.completed_at, 'pk__gt': mark.last_match_id})
+            )
+        return list(matches.order_by(self.completed_at_field, 'pk')
+                    .values_list('pk', self.completed_at_field)[:BATCH_MATCHES])
+
+    def run(self):
+        """Export every match completed since the last run; returns the totals."""
+        os.makedirs(self.directory, exist_ok=True)
+        before = timezone.now().strftime('%Y-%m-%d %H:%M')
+        totals = {'matches': 0, 'rows': 0, 'files': 0}
+        while True:
+            matches, rows = self.export_batch(before)
+            if not matches:
+                return totals
+            totals['matches'] += matches
+            totals['rows'] += rows
+            totals['files'] += 1
+
+    def export_batch(self, before):
+        """Write the next batch and move the watermark; returns (matches, rows)."""
+        watermarks = apps.get_model('the_game.ExportWatermark').objects
+        with transaction.atomic():
+            watermarks.get_or_create(name=self.name)
+            mark = watermarks.select_for_update().get(name=self.name)
+            batch = self.pending(mark, before)
+            if not batch:
+                return 0, 0
+
+            keys = [pk for pk, _ in batch]
+            last_pk, last_completed_at = batch[-1]
+            path = os.path.join(self.directory, f"{self.export.game}-"
+                                f"{re.sub(r'[^0-9]', '', last_completed_at)}-{last_pk}.csv")
+            tmp = os.path.join(self.directory, f".{os.path.basename(path)}.tmp")
+            rows = 0
+            with open(tmp, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(self.export.header)
+                for row in self.export.rows(matches=keys):
+                    writer.writerow(row)
+                    rows += 1
+            os.replace(tmp, path)
+
+            last_row = self.export.queryset(matches=keys).aggregate(last=Max('pk'))['last']
+            mark.completed_at, mark.last_match_id = last_completed_at, last_pk
+            mark.last_row_id = max(mark.last_row_id, last_row or 0)
+            mark.exported_matches += len(batch)
+            mark.exported_rows += rows
+            mark.save()
+        return len(batch), rows
+
+
+def export_changes(game, directory=None):
+    """Run the incremental export of `game` ("prisoners" or "ultimatum")."""
+    directory = directory or getattr(settings, 'CHANGE_EXPORT_DIR', 'exports')
+    return ChangeExport(EXPORTS[game], directory).run()
@@ -0,0 +1,164 @@
+"""
+Encoding of the match sockets' frames.
+
+Every frame used to go through stdlib json.dumps/json.loads. The codec of
+a socket is now picked once, when it connects:
+
+- JSON text frames by default, encoded with orjson when it is installed
+  (WEBSOCKET_JSON_ENCODER = "stdlib" forces the standard library).
+- MessagePack binary frames for clients that offer the "msgpack" WebSocket
+  subprotocol (Sec-WebSocket-Protocol), if msgpack is installed – it comes
+  with channels-redis.
+
+Group events carry their client frames already encoded as JSON text by
+the publisher (see encode_group_event): the handlers of the match's
+sockets and spectators forward them verbatim. MessagePack sockets decode
+and re-encode them, once per event for all such sockets in the process.
+"""
+import json
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:         # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:         # pragma: no cover
+    msgpack = None
+
+# re-encoded group event frames kept per match, enough for a burst of events
+FRAME_CACHE_SIZE = 32
+
+
+class StdlibJsonCodec:
+    name = "json"
+    subprotocol = "json"
+    binary = False
+
+    def encode(self, data):
+        return json.dumps(data)
+
+    def decode(self, frame):
+        return json.loads(frame)
+
+
+class OrjsonCodec(StdlibJsonCodec):
+
+    def encode(self, data):
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def decode(self, frame):
+        return orjson.loads(frame)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    subprotocol = "msgpack"
+    binary = True
+
+    def encode(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, frame):
+        try:
+            return msgpack.unpackb(frame, raw=False)
+        except Exception as exc:
+            # like json.JSONDecodeError, so callers handle one error type
+            raise ValueError(f"Invalid MessagePack frame: {exc}") from exc
+
+
+def json_codec():
+    """The JSON codec configured by WEBSOCKET_JSON_ENCODER."""
+    if orjson is not None and getattr(settings, "WEBSOCKET_JSON_ENCODER", "orjson") == "orjson":
+        return OrjsonCodec()
+    return StdlibJsonCodec()
+
+
+def negotiate_codec(subprotocols):
+    """
+    The codec for a socket offering `subprotocols`, and the subprotocol
+    to accept it with (None when the client offered none).
+    """
+    for offered in subprotocols or ():
+        if offered == MsgpackCodec.subprotocol and msgpack is not None:
+            return MsgpackCodec(), offered
+        if offered == StdlibJsonCodec.subprotocol:
+            return json_codec(), offered
+    return json_codec(), None
+
+
+class FrameCodecMixin:
+    """
+    For the match consumers: accept with accept_with_codec(), send direct
+    frames with send_frame() and group event frames with forward_frame().
+
+    An event published with group_publish() names its client frames in
+    event["frames"] (variant -> frame), or the consumer builds its one
+    frame with a `<event type>_frame(event)` method.
+    """
+
+    async def accept_with_codec(self):
+        self.codec, subprotocol = negotiate_codec(self.scope.get("subprotocols"))
+        await self.accept(subprotocol=subprotocol)
+
+    def decode_frame(self, text_data=None, bytes_data=None):
+        """The message of a client frame; ValueError if it can't be decoded."""
+        frame = bytes_data if bytes_data is not None else text_data
+        return self.codec.decode(frame)
+
+    async def send_encoded(self, frame):
+        if self.codec.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    async def send_frame(self, data):
+        await self.send_encoded(self.codec.encode(data))
+
+    # ───────────────────── group events ─────────────────────
+    async def group_publish(self, event):
+        await super().group_publish(self.encode_group_event(event))
+
+    def encode_group_event(self, event):
+        """
+        `event` as it goes through the channel layer: its client frames
+        encoded as JSON text, once for every socket and spectator of the
+        match, in place of the fields they were built from.
+        """
+        frames = event.get("frames")
+        if frames is None:
+            build = getattr(self, f"{event['type']}_frame", None)
+            if build is None:
+                return event            # nothing for the client (force_disconnect)
+            frames = {"frame": build(event)}
+            event = {key: event[key] for key in ("type", "seq") if key in event}
+        codec = json_codec()
+        return dict(event, frames={variant: codec.encode(data)
+                                   for variant, data in frames.items()})
+
+    async def forward_frame(self, event, variant="frame"):
+        """Send this socket the pre-encoded `variant` frame of a group event."""
+        if self.codec.name == "json":
+            await self.send_encoded(event["frames"][variant])
+        else:
+            await self.send_encoded(self.transcode_frame(event, variant))
+
+    def transcode_frame(self, event, variant):
+        """
+        The JSON frame re-encoded with this socket's codec, shared with the
+        match's other sockets using it (events are told apart by their
+        sequence number).
+        """
+        seq = event.get("seq")
+        key = (seq, variant, self.codec.name)
+        cache = self.actor.frames
+        frame = cache.get(key) if seq is not None else None
+        if frame is None:
+            frame = self.codec.encode(json_codec().decode(event["frames"][variant]))
+            if seq is not None:
+                cache[key] = frame
+                while len(cache) > FRAME_CACHE_SIZE:
+                    cache.pop(next(iter(cache)))
+        return frame
@@ -0,0 +1,149 @@
+"""
+Where the consumers' ORM calls run.
+
+DB_EXECUTOR_MODE = "thread_sensitive" (default) keeps channels'
+database_sync_to_async: every ORM call of the worker process goes through
+one thread, so moves of unrelated matches queue up behind each other.
+
+DB_EXECUTOR_MODE = "pool" runs them on a ThreadPoolExecutor of
+DB_EXECUTOR_POOL_SIZE threads instead. Django connections are per thread,
+so each pool thread keeps its own DB handle (reused across calls when
+CONN_MAX_AGE allows it). Calls of one match still run one at a time
+because they are issued from that match's actor.
+
+GAME_REPOSITORY_BACKEND picks how the consumers' repositories reach the
+database: "sync" wraps the ORM calls as above, "async" uses the native
+async ORM (aget/asave/arefresh_from_db/...), which needs Django 5.0 or
+newer; on older versions "async" falls back to "sync".
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import django
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Model.asave/adelete appeared in Django 4.2, Model.arefresh_from_db in 5.0
+ASYNC_ORM_AVAILABLE = django.VERSION >= (5, 0)
+
+
+class DBExecutor:
+    """A sized, non thread-sensitive executor for ORM calls, with queue metrics."""
+
+    def __init__(self, size):
+        self.size = size
+        self.pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self.queued = 0             # submitted, waiting for a free thread
+        self.running = 0
+        self.completed = 0
+        self.max_queued = 0
+        self.total_wait = 0.0       # seconds spent waiting for a thread
+        self.total_run = 0.0
+
+    async def run(self, func, *args, **kwargs):
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        context = contextvars.copy_context()
+        call = functools.partial(self._call, time.monotonic(), func, args, kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.pool, context.run, call
+        )
+
+    def _call(self, submitted_at, func, args, kwargs):
+        started_at = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait += started_at - submitted_at
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_run += time.monotonic() - started_at
+
+    def stats(self):
+        with self._lock:
+            completed = self.completed
+            return {
+                "mode": "pool",
+                "pool_size": self.size,
+                "queue_depth": self.queued,
+                "max_queue_depth": self.max_queued,
+                "running": self.running,
+                "completed": completed,
+                "avg_wait_ms": round(self.total_wait / completed * 1000, 3) if completed else 0,
+                "avg_run_ms": round(self.total_run / completed * 1000, 3) if completed else 0,
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor_mode():
+    return getattr(settings, "DB_EXECUTOR_MODE", "thread_sensitive")
+
+
+def get_db_executor():
+    """The process-wide pool, created on first use (None outside pool mode)."""
+    global _executor
+    if executor_mode() != "pool":
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = DBExecutor(getattr(settings, "DB_EXECUTOR_POOL_SIZE", 8))
+    return _executor
+
+
+def executor_stats():
+    executor = get_db_executor()
+    if executor is None:
+        return {"mode": executor_mode()}
+    return executor.stats()
+
+
+def db_sync_to_async(func):
+    """
+    Drop-in replacement for database_sync_to_async that honours
+    DB_EXECUTOR_MODE. Works as a decorator on functions and methods.
+    """
+    if executor_mode() != "pool":
+        return database_sync_to_async(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await get_db_executor().run(func, *args, **kwargs)
+    return wrapper
+
+
+_fallback_logged = False
+
+
+def repository_backend():
+    """"sync" or "async"; asking for async on an older Django falls back to sync."""
+    global _fallback_logged
+    backend = getattr(settings, "GAME_REPOSITORY_BACKEND", "sync")
+    if backend == "async" and not ASYNC_ORM_AVAILABLE:
+        if not _fallback_logged:
+            logger.warning("GAME_REPOSITORY_BACKEND=async needs Django 5.0+, "
+                           "running %s with the sync repositories", django.get_version())
+            _fallback_logged = True
+        return "sync"
+    return backend
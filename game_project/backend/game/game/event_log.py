@@ -0,0 +1,213 @@
+"""
+Append-only event log of the matches of both games.
+
+Round rows are updated in place and their derived columns recomputed, so
+they don't keep what happened in which order. Every match now also
+appends its events – join, move, response, round settled, abort – to its
+game's log table (the_game.GameMatchEvent, ultimatum.UltimatumMatchEvent).
+The log is keyed by the match id string and the match's primary key, not
+a foreign key, so the log of an aborted (deleted) match is kept. Match
+ids are 8 characters and only unique among the live matches, so a new
+match can get the id of a deleted one; the primary key tells their
+events apart.
+
+A row is (match_id, match_pk, kind, at, data): data holds the event's values as a
+MessagePack array, in the order of the model's EVENT_FIELDS[kind] (JSON
+when msgpack isn't installed; the first byte tells them apart), a few
+bytes per move.
+
+The consumers append from the match actor's jobs, in memory; a flusher
+thread writes the log with one bulk_create every EVENT_LOG_FLUSH_INTERVAL
+seconds, so logging adds no query to a move. Rows are written in the
+order they were appended, the id orders a match's events. A write that
+fails is rolled back and its events are written by the next flush, ahead
+of the newer ones. A crashed worker loses at most its last interval of
+events.
+
+<Model>.history(match_id) reads a match's events back (those of the
+latest match with that id, unless match_pk says which), and each game's
+game_logic.rounds_from_events rebuilds its rounds, every derived column
+included, from them (`manage.py replay_match_events`).
+
+MATCH_EVENT_LOG = "off" disables the log.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+
+try:
+    import msgpack
+except ImportError:         # pragma: no cover
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JOIN = 1
+MOVE = 2
+RESPONSE = 3
+ROUND_SETTLED = 4
+ABORT = 5
+
+EVENT_KINDS = [
+    (JOIN, 'Join'),
+    (MOVE, 'Move'),
+    (RESPONSE, 'Response'),
+    (ROUND_SETTLED, 'Round settled'),
+    (ABORT, 'Abort'),
+]
+
+
+def pack(values):
+    if msgpack is not None:
+        return msgpack.packb(list(values), use_bin_type=True)
+    return json.dumps(list(values), separators=(",", ":")).encode()
+
+
+def unpack(data):
+    data = bytes(data)
+    if data[:1] == b"[":
+        return json.loads(data)
+    return msgpack.unpackb(data, raw=False)
+
+
+class MatchEvent(models.Model):
+    """One event of a match; EVENT_FIELDS names the values of each kind."""
+
+    EVENT_FIELDS = {}
+
+    match_id = models.CharField(max_length=255)
+    match_pk = models.BigIntegerField(null=True)   # the match row's id, it outlives the row
+    kind = models.PositiveSmallIntegerField(choices=EVENT_KINDS)
+    at = models.FloatField()                # unix time
+    data = models.BinaryField()
+
+    class Meta:
+        abstract = True
+        ordering = ['id']
+        indexes = [models.Index(fields=['match_id', 'match_pk', 'id'])]
+
+    @property
+    def values(self):
+        """The event's values by name."""
+        return dict(zip(self.EVENT_FIELDS[self.kind], unpack(self.data)))
+
+    @classmethod
+    def history(cls, match_id, match_pk=None):
+        """
+        The events of a match in the order they happened. Without match_pk,
+        those of the latest match that had the id (primary keys only grow).
+        """
+        events = cls.objects.filter(match_id=match_id)
+        if match_pk is None:
+            match_pk = events.aggregate(latest=models.Max('match_pk'))['latest']
+        return list(events.filter(match_pk=match_pk).order_by('id'))
+
+    def __str__(self):
+        return f"{self.match_id} {self.get_kind_display()} {self.values}"
+
+
+def event_log_enabled():
+    return getattr(settings, "MATCH_EVENT_LOG", "database") == "database"
+
+
+class EventLog:
+    """Events appended by this worker process, until the flusher writes them."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.counts = Counter()     # appended, written
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def append(self, model, match_id, match_pk, kind, values):
+        self.start()
+        event = model(match_id=match_id, match_pk=match_pk, kind=kind, at=time.time(),
+                      data=pack(values))
+        with self._lock:
+            self._pending.append(event)
+            self.counts["appended"] += 1
+
+    def flush(self):
+        """
+        Write the pending events; returns how many. If the write fails the
+        events go back to the front of the queue, for the next flush.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        by_model = defaultdict(list)
+        for event in pending:
+            by_model[type(event)].append(event)
+        try:
+            with transaction.atomic():
+                for model, events in by_model.items():
+                    model.objects.bulk_create(events, batch_size=500)
+        except Exception:
+            for event in pending:
+                event.pk = None         # not saved after the rollback
+            with self._lock:
+                self._pending[:0] = pending
+                self.counts["failed_flushes"] += 1
+            raise
+        with self._lock:
+            self.counts["written"] += len(pending)
+        return len(pending)
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="event-log", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing the match event log failed")
+            finally:
+                close_old_connections()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, pending=len(self._pending))
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_event_log():
+    """The process-wide log, None when MATCH_EVENT_LOG is "off"."""
+    global _log
+    if not event_log_enabled():
+        return None
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = EventLog(getattr(settings, "EVENT_LOG_FLUSH_INTERVAL", 1.0))
+    return _log
+
+
+class EventLogMixin:
+    """
+    For the match consumers: log_event() appends to the log of the match
+    in self.state (call it from actor jobs).
+    """
+
+    event_model = None              # "<app>.<model>"
+
+    def log_event(self, kind, *values):
+        log = get_event_log()
+        if log is not None:
+            log.append(apps.get_model(self.event_model), self.match_id, self.state.match_pk,
+                       kind, values)
@@ -0,0 +1,88 @@
+"""
+Ordered delivery of a match's group events.
+
+Several coroutines publish events for the same match – both players'
+receive loops, bot turns and deadlines firing on the timer wheel – so
+two sockets could see those events interleaved differently. The
+Ultimatum consumer papered over this with a fixed asyncio.sleep(0.5)
+before every round_results frame.
+
+Instead, every event published through group_publish() is stamped with
+the next sequence number of the match actor, and each consumer hands
+group events to their handlers strictly in that order: an event that
+arrives early is held back until the ones before it are delivered. If
+a missing event doesn't show up within EVENT_GAP_TIMEOUT seconds (it
+can only have been dropped by the channel layer) delivery skips ahead
+instead of stalling the socket.
+
+Events without a sequence number, like lobby_matched sent from a view,
+are delivered right away. The numbers come from the match actor, so
+like the actor they assume both sockets of a match live in the same
+worker process.
+"""
+import asyncio
+import logging
+from django.conf import settings
+from .timer_wheel import get_timer_wheel
+
+logger = logging.getLogger(__name__)
+
+
+class OrderedGroupEventsMixin:
+    """
+    For consumers with `self.actor` and `self.room_group_name`. Call
+    start_event_order() right after joining the group.
+    """
+
+    def start_event_order(self):
+        # anything numbered before we joined was never meant for us
+        self._next_seq = self.actor.sequence + 1
+        self._held = {}
+        self._delivering = asyncio.Lock()
+
+    async def group_publish(self, event):
+        """
+        group_send `event` to the match, stamped with its sequence number
+        unless an actor job already numbered it.
+        """
+        if "seq" not in event:
+            event = dict(event, seq=self.actor.next_sequence())
+        await self.channel_layer.group_send(self.room_group_name, event)
+
+    def gap_key(self):
+        return ("event_order", self.channel_name)
+
+    async def dispatch(self, message):
+        seq = message.get("seq")
+        if seq is None or not hasattr(self, "_held"):
+            return await super().dispatch(message)
+        if seq < self._next_seq:
+            return          # published before this socket joined
+        self._held[seq] = message
+        await self._deliver_ready()
+
+    async def _deliver_ready(self):
+        async with self._delivering:
+            while self._next_seq in self._held:
+                message = self._held.pop(self._next_seq)
+                self._next_seq += 1
+                await super().dispatch(message)
+
+            wheel = get_timer_wheel()
+            if self._held:
+                if wheel.get(self.gap_key()) is None:
+                    wheel.schedule(self.gap_key(), getattr(settings, "EVENT_GAP_TIMEOUT", 1.0),
+                                   self._skip_gap)
+            else:
+                wheel.cancel(self.gap_key())
+
+    async def _skip_gap(self):
+        if not self._held:
+            return
+        logger.warning("Events %s-%s of %s never arrived, skipping them",
+                       self._next_seq, min(self._held) - 1, self.room_group_name)
+        self._next_seq = min(self._held)
+        await self._deliver_ready()
+
+    def stop_event_order(self):
+        get_timer_wheel().cancel(self.gap_key())
@@ -0,0 +1,222 @@
+"""
+Research exports of the played rounds of both games.
+
+data_prisoners.sh and data_ultumatum.sh used to pipe data_*.sql through
+psql in the db container, and got psql's aligned text, built in full
+before a line came out. The same rows and columns are now streamed as
+CSV by /api/prisoners/export/ and /api/ultimatum/export/ (staff only, log
+in through /admin/ first) and by `manage.py export_rounds`, which the
+scripts run now.
+
+The rounds are read with a server-side cursor (QuerySet.iterator) and
+written out chunk by chunk as they arrive, so memory stays flat whatever
+the size of the export. Filters:
+
+    ?since=YYYY-MM-DD&until=YYYY-MM-DD   round start, both days included
+    ?mode=online|bot
+    ?complete=true|false                 whether the match was finished
+"""
+import csv
+from datetime import date, timedelta
+from django.apps import apps
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+
+# rows fetched per round trip of the cursor, and written per chunk
+CHUNK_SIZE = 2000
+
+
+class RoundExport:
+    """
+    The settled rounds of one game, in the columns of its old .sql export:
+    `number_column` numbers the rounds of each match, then (header, field
+    path) for every other column.
+    """
+
+    def __init__(self, game, model, settled, match_field, start_field, complete_field,
+                 completed_at_field, number_column, columns):
+        self.game = game
+        self.model = model
+        self.settled = settled
+        self.match_field = match_field      # match id, the export is sorted by it
+        self.start_field = start_field
+        self.complete_field = complete_field
+        self.completed_at_field = completed_at_field
+        self.number_column = number_column
+        self.columns = columns
+
+    @property
+    def header(self):
+        return [self.number_column] + [name for name, _ in self.columns]
+
+    @property
+    def filename(self):
+        return f"{self.game}_rounds.csv"
+
+    def queryset(self, since=None, until=None, mode=None, complete=None,
+                 completed_after=None, completed_before=None, matches=None):
+        """
+        The settled rounds, filtered; completed_after/completed_before take
+        the rounds of the matches completed in that span ('YYYY-MM-DD HH:MM',
+        both exclusive), `matches` those of the matches with these keys.
+        """
+        rounds = apps.get_model(self.model).objects.filter(self.settled)
+        # times are stored as 'YYYY-MM-DD HH:MM' text, which sorts by date
+        if since is not None:
+            rounds = rounds.filter(**{f"{self.start_field}__gte": since.isoformat()})
+        if until is not None:
+            rounds = rounds.filter(**{f"{self.start_field}__lt": (until + timedelta(days=1)).isoformat()})
+        if mode is not None:
+            rounds = rounds.filter(match__game_mode=mode)
+        if complete is not None:
+            rounds = rounds.filter(**{self.complete_field: complete})
+        if completed_after is not None:
+            rounds = rounds.filter(**{f"{self.completed_at_field}__gt": completed_after})
+        if completed_before is not None:
+            rounds = rounds.filter(**{f"{self.completed_at_field}__lt": completed_before})
+        if matches is not None:
+            rounds = rounds.filter(match__in=matches)
+        return rounds.order_by(self.match_field, 'round_number')
+
+    def values(self, **filters):
+        """The export's rows as read, fetched CHUNK_SIZE at a time."""
+        paths = [path for _, path in self.columns]
+        current, number = None, 0
+        rows = self.queryset(**filters).values_list(self.match_field, *paths)
+        for match_id, *values in rows.iterator(chunk_size=CHUNK_SIZE):
+            if match_id != current:
+                current, number = match_id, 0
+            number += 1
+            yield [number] + values
+
+    def rows(self, **filters):
+        """The export's rows for CSV."""
+        for row in self.values(**filters):
+            # booleans as Postgres writes them in CSV
+            yield [('t' if v else 'f') if isinstance(v, bool) else v for v in row]
+
+    def stream(self, **filters):
+        """The CSV text, header first, in chunks of CHUNK_SIZE rows."""
+        buffer = LineBuffer()
+        writer = csv.writer(buffer)
+        writer.writerow(self.header)
+        for row in self.rows(**filters):
+            writer.writerow(row)
+            if len(buffer.lines) >= CHUNK_SIZE:
+                yield buffer.take()
+        yield buffer.take()
+
+
+class LineBuffer:
+    """A file for csv.writer that keeps the lines until taken."""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def take(self):
+        text, self.lines = "".join(self.lines), []
+        return text
+
+
+EXPORTS = {
+    # the columns of data_prisoners.sql
+    'prisoners': RoundExport(
+        'prisoners', 'the_game.GameRound',
+        Q(player_1_action__isnull=False, player_2_action__isnull=False),
+        'match__match_id', 'round_start_time', 'match__is_complete', 'match__completed_at',
+        'row_number', [
+            ('game_match_uuid', 'match__match_id'),
+            ('player_1_fingerprint', 'match__player_1_fingerprint'),
+            ('player_1_action', 'player_1_action'),
+            ('player_1_score', 'player_1_score'),
+            ('player_2_fingerprint', 'match__player_2_fingerprint'),
+            ('player_2_action', 'player_2_action'),
+            ('player_2_score', 'player_2_score'),
+            ('player_1_cooperation_percent', 'player_1_cooperation_percent'),
+            ('player_2_cooperation_percent', 'player_2_cooperation_percent'),
+            ('avg_cooperation_percent', 'avg_cooperation_percent'),
+            ('player_1_cumulative_score', 'player_1_cumulative_score'),
+            ('player_2_cumulative_score', 'player_2_cumulative_score'),
+            ('player_1_country', 'match__player_1_country'),
+            ('player_1_city', 'match__player_1_city'),
+            ('player_2_country', 'match__player_2_country'),
+            ('player_2_city', 'match__player_2_city'),
+            ('round_start', 'round_start_time'),
+            ('round_end', 'round_end_time'),
+            ('match_complete', 'match__is_complete'),
+            ('match_completed_at', 'match__completed_at'),
+        ]),
+    # the columns of data_ultimatum.sql
+    'ultimatum': RoundExport(
+        'ultimatum', 'ultimatum.UltimatumGameRound',
+        Q(player_1_coins_to_keep__isnull=False, player_1_coins_to_offer__isnull=False,
+          player_2_coins_to_keep__isnull=False, player_2_coins_to_offer__isnull=False,
+          player_1_response_to_p2_offer__isnull=False,
+          player_2_response_to_p1_offer__isnull=False),
+        'match__game_match_uuid', 'round_start', 'match__match_complete',
+        'match__match_completed_at', 'round_number', [
+            ('game_match_uuid', 'match__game_match_uuid'),
+            ('game_mode', 'match__game_mode'),
+            ('player_1_fingerprint', 'match__player_1_fingerprint'),
+            ('player_1_ip_address', 'match__player_1_ip_address'),
+            ('player_1_coins_to_keep', 'player_1_coins_to_keep'),
+            ('player_1_coins_to_offer', 'player_1_coins_to_offer'),
+            ('player_1_response_to_p2_offer', 'player_1_response_to_p2_offer'),
+            ('player_1_coins_made_in_round', 'player_1_coins_made_in_round'),
+            ('player_2_fingerprint', 'match__player_2_fingerprint'),
+            ('player_2_ip_address', 'match__player_2_ip_address'),
+            ('player_2_coins_to_keep', 'player_2_coins_to_keep'),
+            ('player_2_coins_to_offer', 'player_2_coins_to_offer'),
+            ('player_2_response_to_p1_offer', 'player_2_response_to_p1_offer'),
+            ('player_2_coins_made_in_round', 'player_2_coins_made_in_round'),
+            ('players_sum_coins_in_round', 'players_sum_coins_in_round'),
+            ('players_sum_coins_total', 'players_sum_coins_total'),
+            ('player_1_final_score', 'match__player_1_final_score'),
+            ('player_2_final_score', 'match__player_2_final_score'),
+            ('player_1_country', 'match__player_1_country'),
+            ('player_1_city', 'match__player_1_city'),
+            ('player_2_country', 'match__player_2_country'),
+            ('player_2_city', 'match__player_2_city'),
+            ('round_start', 'round_start'),
+            ('round_end', 'round_end'),
+            ('match_complete', 'match__match_complete'),
+        ]),
+}
+
+
+def parse_filters(params):
+    """The export filters of a query string; ValueError on a bad value."""
+    filters = {}
+    for name in ('since', 'until'):
+        if params.get(name):
+            filters[name] = date.fromisoformat(params[name])
+    if params.get('mode'):
+        if params['mode'] not in ('online', 'bot'):
+            raise ValueError("mode must be online or bot")
+        filters['mode'] = params['mode']
+    if params.get('complete'):
+        if params['complete'] not in ('true', 'false'):
+            raise ValueError("complete must be true or false")
+        filters['complete'] = params['complete'] == 'true'
+    return filters
+
+
+def export_response(request, game):
+    """The CSV export of `game` for a staff user, streamed."""
+    if not request.user.is_staff:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Exports are for staff users, log in through /admin/ first'
+        }, status=403)
+    try:
+        filters = parse_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid filter: {e}'}, status=400)
+
+    export = EXPORTS[game]
+    response = StreamingHttpResponse(export.stream(**filters), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{export.filename}"'
+    return response
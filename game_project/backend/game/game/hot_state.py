@@ -0,0 +1,245 @@
+"""
+Redis hot state of live matches, written behind to the database.
+
+Settling a round used to wait for its UPDATE to commit before the round
+results went out. With HOT_STATE_BACKEND = "redis" a settled round is
+written to its match's Redis hash instead ("hot:<game>:<match_id>", one
+JSON field per round), by a Lua script that also marks the match dirty –
+one round trip, so the moves' latency no longer depends on the database.
+
+A flusher thread per worker process takes the oldest dirty matches every
+HOT_STATE_FLUSH_INTERVAL seconds and writes their rounds with one
+bulk_update per game, in one transaction. A match's hash is dropped once
+flushed, unless it was written again meanwhile (it then stays dirty and
+is flushed again; rows are written whole, so that is harmless).
+
+The last round of a match flushes the match's pending rounds and is then
+written through with the match totals as before, so a finished match is
+complete in the database when its sockets say so. Until then the
+database may be HOT_STATE_FLUSH_INTERVAL seconds behind on live rounds.
+
+Crash recovery: the dirty set lives in Redis, so the flusher of any
+worker writes the rounds of a worker that died before flushing them, and
+loading a match lays its unflushed rounds over the rows read from the
+database. `manage.py flush_hot_state` writes everything left at once.
+
+Only pre-allocated rounds (rows that exist) go through Redis; the rest
+are written through.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+import redis
+import redis.asyncio
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from game.db_executor import db_sync_to_async
+from game.lobby import redis_url
+
+logger = logging.getLogger(__name__)
+
+ROUND_MODELS = {
+    "prisoners": "the_game.GameRound",
+    "ultimatum": "ultimatum.UltimatumGameRound",
+}
+
+DIRTY_KEY = "hot:dirty"
+
+# KEYS[1] match hash, KEYS[2] dirty set, ARGV[1] dirty member ("<game>:<match_id>"),
+# ARGV[2] now, ARGV[3..] field, value pairs. Returns the hash's new version.
+WRITE = """
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('ZADD', KEYS[2], 'NX', ARGV[2], ARGV[1])
+return redis.call('HINCRBY', KEYS[1], 'version', 1)
+"""
+
+# KEYS[1] match hash, KEYS[2] dirty set, ARGV[1] dirty member, ARGV[2] version
+# that was flushed. Drops both unless the hash was written again since.
+ACK = """
+local version = redis.call('HGET', KEYS[1], 'version')
+if not version or version == ARGV[2] then
+    redis.call('DEL', KEYS[1])
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+def hot_state_enabled():
+    return getattr(settings, "HOT_STATE_BACKEND", "redis") == "redis"
+
+
+class HotStateStore:
+    """Settled rounds of live matches; `game` is "prisoners" or "ultimatum"."""
+
+    batch_size = 100            # matches per flush
+
+    def __init__(self, client, async_client, interval):
+        self.client = client
+        self.async_client = async_client
+        self.interval = interval
+        self.counts = Counter()     # writes, flushes, flushed_matches, flushed_rounds
+        self.last_flush_ms = None
+        self._ack = client.register_script(ACK)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def match_key(game, match_id):
+        return f"hot:{game}:{match_id}"
+
+    @staticmethod
+    def round_model(game):
+        return apps.get_model(ROUND_MODELS[game])
+
+    @staticmethod
+    def round_fields(model):
+        """The columns a settled round writes (all but the keys)."""
+        return [f.name for f in model._meta.concrete_fields
+                if not f.primary_key and not f.is_relation]
+
+    def encode_round(self, round_obj):
+        values = {f: getattr(round_obj, f) for f in self.round_fields(type(round_obj))}
+        return json.dumps(dict(values, pk=round_obj.pk), cls=DjangoJSONEncoder)
+
+    # ─────────────────────── used by the consumers ───────────────────────
+    async def write_round(self, game, match_id, round_obj):
+        """Store a settled round; it reaches the database with the next flush."""
+        self.start()
+        await self.async_client.eval(
+            WRITE, 2, self.match_key(game, match_id), DIRTY_KEY,
+            f"{game}:{match_id}", time.time(),
+            f"round:{round_obj.round_number}", self.encode_round(round_obj),
+        )
+        with self._lock:
+            self.counts["writes"] += 1
+
+    async def overlay(self, game, match_id, rounds):
+        """
+        Lay the unflushed rounds of a match over its rows just read from
+        the database; returns the number of rounds replaced.
+        """
+        self.start()
+        stored = await self.async_client.hgetall(self.match_key(game, match_id))
+        replaced = 0
+        for round_obj in rounds:
+            value = stored.get(f"round:{round_obj.round_number}")
+            if value is None:
+                continue
+            values = json.loads(value)
+            values.pop("pk")
+            for field, field_value in values.items():
+                setattr(round_obj, field, field_value)
+            replaced += 1
+        if replaced:
+            logger.info("Recovered %d unflushed rounds of %s match %s", replaced, game, match_id)
+        return replaced
+
+    async def flush_match(self, game, match_id):
+        """Write a match's pending rounds now (before its last round)."""
+        await db_sync_to_async(self.flush_members)([f"{game}:{match_id}"])
+
+    async def discard(self, game, match_id):
+        """Forget a match's pending rounds, for when the match is deleted."""
+        pipe = self.async_client.pipeline(transaction=True)
+        pipe.delete(self.match_key(game, match_id))
+        pipe.zrem(DIRTY_KEY, f"{game}:{match_id}")
+        await pipe.execute()
+
+    # ─────────────────────── flushing ───────────────────────
+    def flush(self):
+        """Write the oldest dirty matches; returns how many were taken."""
+        members = self.client.zrange(DIRTY_KEY, 0, self.batch_size - 1)
+        if members:
+            self.flush_members(members)
+        return len(members)
+
+    def flush_all(self):
+        """Flush until nothing is dirty; returns the number of matches flushed."""
+        flushed = 0
+        while True:
+            taken = self.flush()
+            flushed += taken
+            if taken < self.batch_size:
+                return flushed
+
+    def flush_members(self, members):
+        started = time.monotonic()
+        pipe = self.client.pipeline(transaction=False)
+        for member in members:
+            pipe.hgetall(self.match_key(*member.split(":", 1)))
+        stored = pipe.execute()
+
+        rows = defaultdict(list)            # round model -> rows to update
+        for member, values in zip(members, stored):
+            model = self.round_model(member.split(":", 1)[0])
+            for field, value in values.items():
+                if field.startswith("round:"):
+                    rows[model].append(model(**json.loads(value)))
+
+        with transaction.atomic():
+            for model, objs in rows.items():
+                model.objects.bulk_update(objs, self.round_fields(model), batch_size=500)
+
+        for member, values in zip(members, stored):
+            self._ack(keys=[self.match_key(*member.split(":", 1)), DIRTY_KEY],
+                      args=[member, values.get("version", "")])
+
+        with self._lock:
+            self.counts["flushes"] += 1
+            self.counts["flushed_matches"] += len(members)
+            self.counts["flushed_rounds"] += sum(len(objs) for objs in rows.values())
+            self.last_flush_ms = round((time.monotonic() - started) * 1000, 2)
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="hot-state-flusher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            close_old_connections()
+            try:
+                self.flush_all()
+            except Exception:
+                logger.exception("Flushing the hot match state failed")
+            finally:
+                close_old_connections()
+            time.sleep(self.interval)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.counts, last_flush_ms=self.last_flush_ms)
+        data["dirty_matches"] = self.client.zcard(DIRTY_KEY)
+        return data
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_hot_state():
+    """The process-wide store, None when HOT_STATE_BACKEND isn't "redis"."""
+    global _store
+    if not hot_state_enabled():
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                url = redis_url()
+                _store = HotStateStore(
+                    redis.Redis.from_url(url, decode_responses=True),
+                    redis.asyncio.Redis.from_url(url, decode_responses=True),
+                    getattr(settings, "HOT_STATE_FLUSH_INTERVAL", 2.0),
+                )
+    return _store
@@ -0,0 +1,193 @@
+"""
+Redis lobby for online matchmaking, on the Redis behind CHANNEL_LAYERS.
+
+Each game has a FIFO list of tickets ("<match_id>:<fingerprint>") and every
+waiting player a presence key holding the id of the match they wait in.
+The presence key expires after LOBBY_PRESENCE_TTL seconds unless the
+player's websocket keeps renewing it (heartbeat). A ticket whose presence
+key is gone or points at another match is stale and dropped when reached.
+
+Pairing pops the oldest live ticket and, when there is none, queues the
+caller – both inside one Lua script, so two players arriving at the same
+moment can't both end up waiting. create_match stays O(1) (stale tickets
+are popped once), and the view that pairs pushes a "lobby_matched" event
+to the waiting player's group right away.
+
+LOBBY_BACKEND = "database" skips all of this and keeps the SKIP LOCKED
+query on the match tables.
+"""
+import asyncio
+import logging
+import redis
+import redis.asyncio
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] queue, ARGV[1] presence key prefix, ARGV[2] fingerprint,
+# ARGV[3] match id to queue when nobody is waiting ('' = don't queue),
+# ARGV[4] presence ttl. Returns the partner's match id or false.
+PAIR_OR_ENQUEUE = """
+while true do
+    local ticket = redis.call('LPOP', KEYS[1])
+    if not ticket then break end
+    local sep = string.find(ticket, ':', 1, true)
+    local match_id = string.sub(ticket, 1, sep - 1)
+    local fp = string.sub(ticket, sep + 1)
+    if fp ~= ARGV[2] and redis.call('GET', ARGV[1] .. fp) == match_id then
+        redis.call('DEL', ARGV[1] .. fp)
+        return match_id
+    end
+end
+if ARGV[3] ~= '' then
+    redis.call('RPUSH', KEYS[1], ARGV[3] .. ':' .. ARGV[2])
+    redis.call('SET', ARGV[1] .. ARGV[2], ARGV[3], 'EX', ARGV[4])
+end
+return false
+"""
+
+# KEYS[1] presence key, ARGV[1] match id. Deletes it only if it is still ours.
+LEAVE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1] presence key, ARGV[1] match id, ARGV[2] ttl. Renews it only if still ours.
+HEARTBEAT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def lobby_enabled():
+    return getattr(settings, "LOBBY_BACKEND", "redis") == "redis"
+
+
+def redis_url():
+    return getattr(settings, "LOBBY_REDIS_URL", None) or \
+        f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/0"
+
+
+class Lobby:
+    """Per-game queue and presence; `game` is "prisoners" or "ultimatum"."""
+
+    def __init__(self, client, async_client=None, ttl=None):
+        self.client = client
+        self.async_client = async_client
+        self.ttl = ttl or getattr(settings, "LOBBY_PRESENCE_TTL", 30)
+        self._pair = client.register_script(PAIR_OR_ENQUEUE)
+
+    @staticmethod
+    def queue_key(game):
+        return f"lobby:{game}:queue"
+
+    @staticmethod
+    def presence_prefix(game):
+        return f"lobby:{game}:presence:"
+
+    def _decode(self, value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    # ─────────────────────── used by the views ───────────────────────
+    def waiting_match(self, game, fp):
+        """Match id this player is waiting in, or None."""
+        return self._decode(self.client.get(self.presence_prefix(game) + fp))
+
+    def pair(self, game, fp):
+        """Pop the oldest live opponent's match id, or None."""
+        return self._decode(self._pair(
+            keys=[self.queue_key(game)],
+            args=[self.presence_prefix(game), fp, "", self.ttl],
+        )) or None
+
+    def pair_or_enqueue(self, game, fp, match_id):
+        """
+        Like pair(), but queue `match_id` for this player when nobody is
+        waiting. Returns the opponent's match id, or None once queued.
+        """
+        return self._decode(self._pair(
+            keys=[self.queue_key(game)],
+            args=[self.presence_prefix(game), fp, match_id, self.ttl],
+        )) or None
+
+    def find_or_queue(self, game, fp, claim, create, discard):
+        """
+        Seat `fp` opposite the oldest waiting player, or queue them.
+
+        claim(partner_match_id) seats fp in that match and returns it (None
+        if it is gone meanwhile), create() sets up the caller's own waiting
+        match and returns (match, match_id), discard(match_id) deletes it
+        again. The match exists before its ticket is queued, so whoever
+        pops the ticket always finds the row. Returns (match, joined).
+        """
+        partner_id = self.pair(game, fp)
+        while partner_id:
+            joined = claim(partner_id)
+            if joined is not None:
+                return joined, True
+            partner_id = self.pair(game, fp)
+
+        own, match_id = create()
+        partner_id = self.pair_or_enqueue(game, fp, match_id)
+        while partner_id:
+            # somebody queued between our pair() and now
+            joined = claim(partner_id)
+            if joined is not None:
+                discard(match_id)
+                return joined, True
+            partner_id = self.pair_or_enqueue(game, fp, match_id)
+        return own, False
+
+    def leave(self, game, fp, match_id):
+        self.client.eval(LEAVE, 1, self.presence_prefix(game) + fp, match_id)
+
+    def queue_length(self, game):
+        """Tickets in the queue, stale ones included."""
+        return self.client.llen(self.queue_key(game))
+
+    # ─────────────────────── used by the consumers ───────────────────────
+    async def heartbeat(self, game, fp, match_id):
+        """Renew a waiting player's presence; False once they were paired or expired."""
+        return bool(await self.async_client.eval(
+            HEARTBEAT, 1, self.presence_prefix(game) + fp, match_id, self.ttl
+        ))
+
+    async def keep_alive(self, game, fp, match_id):
+        """Heartbeat loop for a waiting player's socket; ends once they are paired."""
+        try:
+            while await self.heartbeat(game, fp, match_id):
+                await asyncio.sleep(self.ttl / 3)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error("Lobby heartbeat for %s in match %s failed: %s", fp, match_id, e)
+
+    async def aleave(self, game, fp, match_id):
+        await self.async_client.eval(LEAVE, 1, self.presence_prefix(game) + fp, match_id)
+
+
+_lobby = None
+
+
+def get_lobby():
+    """The process-wide lobby, None when LOBBY_BACKEND isn't "redis"."""
+    global _lobby
+    if not lobby_enabled():
+        return None
+    if _lobby is None:
+        url = redis_url()
+        _lobby = Lobby(redis.Redis.from_url(url), redis.asyncio.Redis.from_url(url))
+    return _lobby
+
+
+def notify_matched(group_name, **payload):
+    """Tell the waiting player's sockets (from a sync view) that an opponent arrived."""
+    async_to_sync(get_channel_layer().group_send)(
+        group_name, {"type": "lobby_matched", **payload}
+    )
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MatchActor:
+    """
+    One asyncio task per live match that owns the match state.
+
+    Both player sockets hand their moves to the actor's mailbox and await
+    the result, so every read-modify-write of a match runs one after the
+    other without row locks. Jobs must not call back into their own actor
+    (that would wait on itself forever).
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.state = None                   # set by the first job that loads it
+        self.references = 0
+        self.sequence = 0                   # last number handed to a group event
+        self.state_version = 0              # last client state published (state_sync)
+        self.published_state = None
+        self.frames = {}                    # encoded group event frames (codec.py)
+        self.mailbox = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def call(self, job, *args, **kwargs):
+        """Queue `job(*args, **kwargs)` and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self.mailbox.put_nowait((job, args, kwargs, future))
+        return await future
+
+    def next_sequence(self):
+        self.sequence += 1
+        return self.sequence
+
+    def stop(self):
+        self.mailbox.put_nowait(None)
+
+    async def _run(self):
+        while True:
+            message = await self.mailbox.get()
+            if message is None:
+                break
+            job, args, kwargs, future = message
+            if future.cancelled():      # the socket went away meanwhile
+                continue
+            try:
+                result = await job(*args, **kwargs)
+            except Exception as exc:
+                logger.exception("Job %s failed in match actor %s", job.__name__, self.key)
+                if not future.done():
+                    future.set_exception(exc)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+
+# ───────────────────── per-process registry ─────────────────────
+_actors = {}
+
+
+def acquire_match_actor(key):
+    """Return the actor of a match, starting it on first use."""
+    actor = _actors.get(key)
+    if actor is None:
+        actor = _actors[key] = MatchActor(key)
+    actor.references += 1
+    return actor
+
+
+def release_match_actor(actor):
+    """Drop a socket's reference; the actor stops with the last one."""
+    actor.references -= 1
+    if actor.references <= 0 and _actors.get(actor.key) is actor:
+        del _actors[actor.key]
+        actor.stop()
@@ -0,0 +1,94 @@
+"""
+Warm pool of pre-provisioned matches.
+
+create_match used to generate an id and insert the match inline. With
+MATCH_POOL_SIZE > 0 (off by default) that many unassigned matches per
+game and mode are kept ready (bulk inserted, hidden from the default
+managers by is_pooled), and starting a match is a single claim of one of
+them with SKIP LOCKED. An empty pool falls back to the inline insert.
+
+The web processes only claim. Celery beat tops the pools up every
+MATCH_POOL_INTERVAL seconds (the_game/tasks.py), or run
+`manage.py fill_match_pool --loop` without Celery. Each process reports
+its hits, misses and hit rate, and the current pool sizes, in
+/api/metrics/.
+"""
+import threading
+from collections import Counter
+from django.apps import apps
+from django.conf import settings
+
+POOLED_MODELS = {
+    "prisoners": "the_game.GameMatch",
+    "ultimatum": "ultimatum.UltimatumMatch",
+}
+GAME_MODES = ("online", "bot")
+
+
+class MatchPool:
+
+    def __init__(self, size, interval):
+        self.size = size
+        self.interval = interval
+        self.hits = Counter()               # (game, mode) -> claims served from the pool
+        self.misses = Counter()
+        self._lock = threading.Lock()
+
+    def model(self, game):
+        return apps.get_model(POOLED_MODELS[game])
+
+    def claim(self, game, game_mode, player_fingerprint, ip_address):
+        """A pooled match handed to player 1, or None on a miss."""
+        claimed = self.model(game).claim_from_pool(game_mode, player_fingerprint, ip_address)
+        with self._lock:
+            if claimed is None:
+                self.misses[game, game_mode] += 1
+            else:
+                self.hits[game, game_mode] += 1
+        return claimed
+
+    def replenish(self):
+        """Top every pool up to `size`; returns the number of matches created."""
+        created = 0
+        for game in POOLED_MODELS:
+            model = self.model(game)
+            for game_mode in GAME_MODES:
+                current = model.pool_size(game_mode)
+                if current < self.size:
+                    model.provision_pool(game_mode, self.size - current)
+                    created += self.size - current
+        return created
+
+    def stats(self):
+        available = {(game, game_mode): self.model(game).pool_size(game_mode)
+                     for game in POOLED_MODELS for game_mode in GAME_MODES}
+        with self._lock:
+            pools = {}
+            for game in POOLED_MODELS:
+                for game_mode in GAME_MODES:
+                    hits = self.hits[game, game_mode]
+                    claims = hits + self.misses[game, game_mode]
+                    pools[f"{game}/{game_mode}"] = {
+                        "available": available[game, game_mode],
+                        "hits": hits,
+                        "misses": claims - hits,
+                        "hit_rate": round(hits / claims, 3) if claims else None,
+                    }
+            return {"target_size": self.size, "pools": pools}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_match_pool():
+    """The process-wide pool, None when MATCH_POOL_SIZE is 0."""
+    global _pool
+    size = getattr(settings, "MATCH_POOL_SIZE", 0)
+    if size <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = MatchPool(size, getattr(settings, "MATCH_POOL_INTERVAL", 5))
+    return _pool
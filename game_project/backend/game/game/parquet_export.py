@@ -0,0 +1,164 @@
+"""
+Parquet datasets of the played rounds, for analysis.
+
+The CSV export (exports.py) is text that has to be parsed again on every
+load. `manage.py export_parquet <game> <directory>` writes the same
+columns to a Parquet dataset in <directory>/<game>/ instead:
+
+- typed columns – integers, floats, booleans, and timestamps for the
+  round and completion times (stored as 'YYYY-MM-DD HH:MM' text);
+- every other text column (fingerprints, places, actions, responses,
+  match ids) dictionary-encoded, so it loads as a pandas category;
+- partitioned by month of the round start (month=YYYY-MM/), so
+  pandas.read_parquet or pyarrow.dataset reads it all in one call.
+
+Runs are incremental. A run appends the rounds of the matches completed
+since the previous run as one new file per month, then moves the
+dataset's watermark (_watermark.json) forward. Completion times are
+stored to the minute, so the watermark is a minute, and a run only takes
+minutes that are over: a match finishing while it runs is left for the
+next run. A file only gets its final name once the run has written
+everything, and the watermark only moves after that. The files are
+named after the watermark the run starts from (part-after-<minute>), so
+a run that fails before moving it is repeated whole and overwrites
+whatever files it had renamed, instead of adding the same rows again.
+
+Rows come from the export's server-side cursor CHUNK_SIZE at a time and
+go out as row groups of at most that many rows per month.
+
+Needs pyarrow.
+"""
+import json
+import os
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.apps import apps
+from django.db import models
+from django.utils import timezone
+from .exports import CHUNK_SIZE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:         # pragma: no cover - optional dependency
+    pa = pq = None
+
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+TIME_COLUMNS = {'round_start', 'round_end', 'match_completed_at'}
+WATERMARK_FILE = '_watermark.json'
+
+
+def model_field(model, path):
+    """The model field behind an ORM path such as 'match__player_1_city'."""
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def arrow_type(header, field):
+    if header in TIME_COLUMNS:
+        return pa.timestamp('s')
+    if isinstance(field, models.BooleanField):
+        return pa.bool_()
+    if isinstance(field, models.FloatField):
+        return pa.float64()
+    if isinstance(field, (models.IntegerField, models.AutoField)):
+        return pa.int32()
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+def parse_time(value):
+    try:
+        return datetime.strptime(value, TIME_FORMAT) if value else None
+    except ValueError:
+        return None
+
+
+class ParquetExport:
+    """Appends the newly completed matches of one RoundExport to a dataset."""
+
+    def __init__(self, export, directory):
+        self.export = export
+        self.directory = os.path.join(directory, export.game)
+        model = apps.get_model(export.model)
+        self.schema = pa.schema(
+            [pa.field(export.number_column, pa.int16())] +
+            [pa.field(header, arrow_type(header, model_field(model, path)))
+             for header, path in export.columns]
+        )
+        self.time_indexes = [i for i, f in enumerate(self.schema) if f.name in TIME_COLUMNS]
+        self.start_index = self.schema.get_field_index('round_start')
+
+    # ─────────────────────── watermark ───────────────────────
+    @property
+    def watermark_path(self):
+        return os.path.join(self.directory, WATERMARK_FILE)
+
+    def read_watermark(self):
+        """The last completion minute already exported, None before the first run."""
+        try:
+            with open(self.watermark_path) as f:
+                return json.load(f)['completed_through']
+        except FileNotFoundError:
+            return None
+
+    def write_watermark(self, completed_through, rows):
+        tmp = self.watermark_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'completed_through': completed_through, 'rows': rows,
+                       'exported_at': timezone.now().strftime(TIME_FORMAT)}, f)
+        os.replace(tmp, self.watermark_path)
+
+    # ─────────────────────── writing ───────────────────────
+    def run(self):
+        """Export what completed since the watermark; returns (rows, files)."""
+        os.makedirs(self.directory, exist_ok=True)
+        now = timezone.now()
+        completed_before = now.strftime(TIME_FORMAT)
+        completed_through = (now - timedelta(minutes=1)).strftime(TIME_FORMAT)
+        completed_after = self.read_watermark()
+        filename = f"part-after-{re.sub(r'[^0-9]', '', completed_after or '') or 'start'}.parquet"
+
+        writers = {}                    # month -> (ParquetWriter, temporary path)
+        pending = defaultdict(list)     # month -> rows not written yet
+        written = 0
+        try:
+            for row in self.export.values(complete=True,
+                                          completed_after=completed_after,
+                                          completed_before=completed_before):
+                for i in self.time_indexes:
+                    row[i] = parse_time(row[i])
+                start = row[self.start_index]
+                month = start.strftime('%Y-%m') if start else 'unknown'
+                pending[month].append(row)
+                if len(pending[month]) >= CHUNK_SIZE:
+                    written += self.write_rows(writers, month, pending.pop(month), filename)
+            for month, rows in pending.items():
+                written += self.write_rows(writers, month, rows, filename)
+        finally:
+            for writer, _ in writers.values():
+                writer.close()
+
+        # all written: give the files their names, then move the watermark
+        for month, (_, tmp) in writers.items():
+            os.replace(tmp, os.path.join(os.path.dirname(tmp), filename))
+        self.write_watermark(completed_through, written)
+        return written, len(writers)
+
+    def write_rows(self, writers, month, rows, filename):
+        if month not in writers:
+            partition = os.path.join(self.directory, f"month={month}")
+            os.makedirs(partition, exist_ok=True)
+            tmp = os.path.join(partition, f".{filename}.tmp")
+            writers[month] = (pq.ParquetWriter(tmp, self.schema), tmp)
+        columns = list(zip(*rows))
+        arrays = []
+        for field, values in zip(self.schema, columns):
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, field.type))
+        writers[month][0].write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        return len(rows)
@@ -0,0 +1,8 @@
+from django.urls import re_path
+from . import spectate
+
+websocket_urlpatterns = [
+    # researchers watching a live match (staff only)
+    re_path(r'^ws/watch/(?P<game>prisoners|ultimatum)/(?P<match_id>[-\w]+)/$',
+            spectate.MatchSpectatorConsumer.as_asgi()),
+]
@@ -149,9 +149,17 @@ DATABASES = {
          'PASSWORD': os.getenv('DB_PASSWORD'),
          'HOST': os.getenv('DB_HOST'),
          'PORT': os.getenv('DB_PORT'),
+         'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
      }
  }
 
+# Where the websocket consumers run their ORM calls (see game/db_executor.py):
+# "thread_sensitive" (one shared thread) or "pool" (DB_EXECUTOR_POOL_SIZE threads)
+DB_EXECUTOR_MODE = os.getenv('DB_EXECUTOR_MODE', 'thread_sensitive')
+DB_EXECUTOR_POOL_SIZE = int(os.getenv('DB_EXECUTOR_POOL_SIZE', 8))
+# "sync" (ORM calls on the executor above) or "async" (native async ORM, Django 5.0+)
+GAME_REPOSITORY_BACKEND = os.getenv('GAME_REPOSITORY_BACKEND', 'sync')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -200,11 +208,74 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [(os.getenv('REDIS_HOST'), int(os.getenv('REDIS_PORT')))],
+            "hosts": [(REDIS_HOST, REDIS_PORT)],
         },
     },
-}
\ No newline at end of file
+}
+
+# Online matchmaking (see game/lobby.py): "redis" queues waiting players on the
+# Redis above, "database" claims half-filled match rows with SKIP LOCKED
+LOBBY_BACKEND = os.getenv('LOBBY_BACKEND', 'redis')
+LOBBY_PRESENCE_TTL = int(os.getenv('LOBBY_PRESENCE_TTL', 30))
+
+# Unassigned matches kept ready per game and mode (see game/match_pool.py), 0 disables;
+# Celery beat tops them up every MATCH_POOL_INTERVAL seconds
+MATCH_POOL_SIZE = int(os.getenv('MATCH_POOL_SIZE', 0))
+MATCH_POOL_INTERVAL = int(os.getenv('MATCH_POOL_INTERVAL', 5))
+
+# Settled rounds of live matches (see game/hot_state.py): "redis" keeps them on the Redis
+# above and writes them to the database in batches, "database" writes each one right away
+HOT_STATE_BACKEND = os.getenv('HOT_STATE_BACKEND', 'redis')
+HOT_STATE_FLUSH_INTERVAL = float(os.getenv('HOT_STATE_FLUSH_INTERVAL', 2.0))
+
+# Append-only event log of every match (see game/event_log.py): "database" or "off"
+MATCH_EVENT_LOG = os.getenv('MATCH_EVENT_LOG', 'database')
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv('EVENT_LOG_FLUSH_INTERVAL', 1.0))
+
+# Scheduled jobs (see game/celery.py), queued on the Redis above
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', f'redis://{REDIS_HOST}:{REDIS_PORT}/1')
+CELERY_TASK_IGNORE_RESULT = True
+
+# CSV files of the newly completed matches (see game/change_export.py), written
+# every CHANGE_EXPORT_INTERVAL seconds by Celery beat, 0 disables the schedule
+CHANGE_EXPORT_DIR = os.getenv('CHANGE_EXPORT_DIR', os.path.join(BASE_DIR, 'exports'))
+CHANGE_EXPORT_INTERVAL = int(os.getenv('CHANGE_EXPORT_INTERVAL', 300))
+CELERY_BEAT_SCHEDULE = {}
+if CHANGE_EXPORT_INTERVAL:
+    CELERY_BEAT_SCHEDULE['export-completed-matches'] = {
+        'task': 'the_game.tasks.export_completed_matches',
+        'schedule': CHANGE_EXPORT_INTERVAL,
+    }
+if MATCH_POOL_SIZE > 0:
+    CELERY_BEAT_SCHEDULE['refill-match-pool'] = {
+        'task': 'the_game.tasks.refill_match_pool',
+        'schedule': MATCH_POOL_INTERVAL,
+        # a refill that waited a whole interval is overtaken by the next one
+        'options': {'expires': MATCH_POOL_INTERVAL},
+    }
+
+# Server-side deadlines of Prisoner's Dilemma sockets in seconds, 0 disables one:
+# "join" from connecting to joining, "move" for both moves of a round
+PD_DEADLINES = {
+    'join': int(os.getenv('PD_JOIN_DEADLINE', 30)),
+    'move': int(os.getenv('PD_MOVE_DEADLINE', 25)),
+}
+
+# Resolution in seconds of the move deadlines (see game/timer_wheel.py)
+TIMER_WHEEL_TICK = float(os.getenv('TIMER_WHEEL_TICK', 0.5))
+
+# JSON encoder of the match sockets: "orjson" (if installed) or "stdlib" (see game/codec.py)
+WEBSOCKET_JSON_ENCODER = os.getenv('WEBSOCKET_JSON_ENCODER', 'orjson')
+
+# Seconds a socket holds back group events behind a missing one (see game/event_order.py)
+EVENT_GAP_TIMEOUT = float(os.getenv('EVENT_GAP_TIMEOUT', 1.0))
+
+# Seconds a page of /api/ultimatum/active-matches/ may be served from the cache, 0 disables
+ACTIVE_MATCHES_CACHE_TTL = int(os.getenv('ACTIVE_MATCHES_CACHE_TTL', 0))
\ No newline at end of file
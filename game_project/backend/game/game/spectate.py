@@ -0,0 +1,78 @@
+"""
+Live view of a match for researchers.
+
+A spectator socket joins the match's channel group like the players'
+sockets, so one group_send reaches players and observers alike. Every
+group event already carries its client frame encoded as JSON (see
+codec.py), so a spectator only forwards text – nothing is decoded or
+encoded per observer, however many watch the same match.
+
+Spectators get the full state frame of every state update (no deltas),
+and on connect a snapshot of the match as far as it is settled in the
+database. Only staff users (logged in through the admin) may watch.
+"""
+import json
+import logging
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+logger = logging.getLogger(__name__)
+
+
+async def prisoners_snapshot(match_id):
+    from the_game.match_state import load_match_state
+    from the_game.repository import get_match_repository
+    state = await load_match_state(get_match_repository(), match_id)
+    return state.snapshot() if state else None
+
+
+async def ultimatum_snapshot(match_id):
+    from ultimatum.match_state import load_match_state
+    from ultimatum.repository import get_round_repository
+    state = await load_match_state(get_round_repository(), match_id)
+    return state.snapshot() if state else None
+
+
+# game -> (channel group of a match, snapshot loader)
+GAMES = {
+    "prisoners": ("game_{}", prisoners_snapshot),
+    "ultimatum": ("ultimatum_game_{}", ultimatum_snapshot),
+}
+
+
+class MatchSpectatorConsumer(AsyncWebsocketConsumer):
+
+    async def connect(self):
+        game = self.scope["url_route"]["kwargs"]["game"]
+        self.match_id = self.scope["url_route"]["kwargs"]["match_id"]
+        user = self.scope.get("user")
+        if user is None or not user.is_staff:
+            await self.close(code=4003)
+            return
+
+        group_name, load_snapshot = GAMES[game]
+        game_state = await load_snapshot(self.match_id)
+        if game_state is None:
+            await self.close(code=4004)
+            return
+
+        self.room_group_name = group_name.format(self.match_id)
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.accept()
+        await self.send(text_data=json.dumps({"game_state": game_state, "spectating": True}))
+        logger.info("%s is watching %s match %s", user, game, self.match_id)
+
+    async def disconnect(self, code):
+        if hasattr(self, "room_group_name"):
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        pass        # spectators only listen
+
+    async def dispatch(self, message):
+        if message["type"].startswith("websocket."):
+            return await super().dispatch(message)
+        frames = message.get("frames")
+        if frames is not None:
+            await self.send(text_data=frames.get("game_state") or frames["frame"])
+        elif message["type"] == "force_disconnect":
+            await self.close(code=4001)     # the match is gone
@@ -0,0 +1,142 @@
+"""
+Versioned game state for the match sockets.
+
+Both consumers used to broadcast the whole game state – roundHistory
+included – on every join, round end and new round, so late in a match
+each frame carried up to 25 history entries to both players.
+
+Every state a match publishes now gets the next version number of the
+match. Clients that connect with ?protocol=2 get one full snapshot when
+they connect and from then on only what changed since the version before:
+
+    {"state_delta": {"set": {...}, "append": {"roundHistory": [...]}, "unset": [...]},
+     "state_version": 7, "base_version": 6}
+
+The server knows which version each socket got last: a socket that missed
+one (a skipped event gap) is sent the full state instead of a delta it
+couldn't apply, and a client that notices a gap itself can send
+{"action": "resync"} for a fresh snapshot. A snapshot is read from the
+live state, which can be ahead of the last published version; a socket
+that got such a snapshot is sent the full state next, since the delta
+from the published version would miss the keys it got early. Clients without ?protocol=2
+keep getting the full {"game_state": ...} frame every time.
+"""
+from urllib.parse import parse_qs
+
+STATE_PROTOCOL = 2
+
+
+def diff_state(old, new):
+    """
+    What changed from `old` to `new` (client state dicts). Lists that only
+    grew, like roundHistory, are sent as the appended entries.
+    """
+    changed, appended = {}, {}
+    for key, value in new.items():
+        before = old.get(key)
+        if key in old and value == before:
+            continue
+        if (isinstance(value, list) and isinstance(before, list)
+                and len(value) > len(before) and value[:len(before)] == before):
+            appended[key] = value[len(before):]
+        else:
+            changed[key] = value
+
+    delta = {"set": changed}
+    if appended:
+        delta["append"] = appended
+    removed = [key for key in old if key not in new]
+    if removed:
+        delta["unset"] = removed
+    return delta
+
+
+def apply_delta(state, delta):
+    """The state after `delta` (what protocol 2 clients do with a frame)."""
+    state = dict(state, **delta.get("set", {}))
+    for key, entries in delta.get("append", {}).items():
+        state[key] = state.get(key, []) + entries
+    for key in delta.get("unset", []):
+        state.pop(key, None)
+    return state
+
+
+class VersionedStateMixin:
+    """
+    For consumers with `self.actor`, an actor job `_snapshot()` that
+    returns the client state and the FrameCodecMixin. Call
+    start_state_sync() in connect.
+    """
+
+    def start_state_sync(self):
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        try:
+            self.state_protocol = int(query.get("protocol", ["1"])[0])
+        except ValueError:
+            self.state_protocol = 1
+        self.sent_version = 0           # last state version this socket got
+        self.sent_unpublished = False   # its last snapshot differs from that version
+
+    # ───────────── actor side (call inside actor jobs) ─────────────
+    def version_state(self, game_state):
+        """
+        Publish `game_state` as the next version of the match; returns the
+        game_state_update event for group_publish, with the full and the
+        delta frame. The event is numbered here, so versions reach every
+        socket in the order they were made.
+        """
+        actor = self.actor
+        previous = actor.published_state
+        actor.state_version += 1
+        actor.published_state = game_state
+        version = actor.state_version
+        frames = {"game_state": {"game_state": game_state, "state_version": version}}
+        if previous is not None:
+            frames["state_delta"] = {"state_delta": diff_state(previous, game_state),
+                                     "state_version": version, "base_version": version - 1}
+        return {
+            "type": "game_state_update",
+            "frames": frames,
+            "state_version": version,
+            "seq": actor.next_sequence(),
+        }
+
+    async def versioned_state(self):
+        game_state = await self._snapshot()
+        return self.version_state(game_state), game_state
+
+    async def current_state(self):
+        # can be newer than the last published version where nothing was
+        # published for it yet, then the socket needs the full state next
+        game_state = await self._snapshot()
+        actor = self.actor
+        return game_state, actor.state_version, game_state != actor.published_state
+
+    # ───────────────────── socket side ─────────────────────
+    async def publish_state(self):
+        """Broadcast the current state of the match as a new version; returns it."""
+        event, game_state = await self.actor.call(self.versioned_state)
+        await self.group_publish(event)
+        return game_state
+
+    async def send_snapshot(self, **extra):
+        """Send this socket the full current state (on connect and resync)."""
+        game_state, version, unpublished = await self.actor.call(self.current_state)
+        self.sent_version = version
+        self.sent_unpublished = unpublished
+        await self.send_frame(dict(extra, game_state=game_state, state_version=version))
+
+    def state_variant(self, event):
+        """
+        Which frame of a game_state_update event this socket gets: the delta,
+        the full state, or None if it is stale.
+        """
+        version = event["state_version"]
+        if version <= self.sent_version:
+            return None         # a snapshot sent meanwhile already had it
+        base, self.sent_version = self.sent_version, version
+        unpublished, self.sent_unpublished = self.sent_unpublished, False
+        if (self.state_protocol >= STATE_PROTOCOL and "state_delta" in event["frames"]
+                and base == version - 1 and not unpublished):
+            return "state_delta"
+        return "game_state"
@@ -0,0 +1,686 @@
+import asyncio
+import csv
+import glob
+import io
+import os
+import shutil
+import tempfile
+import types
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock, skipUnless
+
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from the_game.game_logic import apply_match_stats, apply_round_stats, initialize_rounds, save_game_stats
+from the_game.models import ExportWatermark, GameMatch, GameRound
+from . import change_export, timer_wheel
+from .change_export import ChangeExport
+from .exports import EXPORTS, parse_filters
+from .hot_state import DIRTY_KEY, HotStateStore
+from .lobby import Lobby
+from .match_actor import MatchActor
+from .parquet_export import ParquetExport
+from .state_sync import STATE_PROTOCOL, VersionedStateMixin, apply_delta, diff_state
+from .timer_wheel import TimerWheel
+
+try:
+    import fakeredis
+except ImportError:         # requirements-dev.txt
+    fakeredis = None
+
+try:
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:         # requirements.txt, optional for the rest
+    pc = pq = None
+
+
+class FakeClock:
+    """time.monotonic of the timer wheel module, moved by hand"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class TimerWheelTests(SimpleTestCase):
+    """
+    The wheel's own driver task is stopped: the tests move the clock and
+    advance the wheel the way _run does, one tick at a time.
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(timer_wheel, 'time', types.SimpleNamespace(monotonic=self.clock.monotonic))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.fired = []             # (key, tick it fired at)
+
+    def make_wheel(self, **kwargs):
+        wheel = TimerWheel(tick=1, **kwargs)
+        wheel._ensure_running()
+        wheel._task.cancel()
+        return wheel
+
+    def schedule(self, wheel, key, delay):
+        async def callback():
+            self.fired.append((key, wheel.current_tick))
+        return wheel.schedule(key, delay, callback)
+
+    async def run_until(self, wheel, seconds):
+        """Move the clock to `seconds` and catch the wheel up, like _run"""
+        self.clock.now = seconds
+        while wheel.current_tick < wheel._now_tick():
+            wheel._advance()
+        await asyncio.sleep(0)      # let the fired callbacks run
+
+    async def test_fires_on_its_tick(self):
+        wheel = self.make_wheel()
+        self.schedule(wheel, 'a', 3)
+        await self.run_until(wheel, 2)
+        self.assertEqual(self.fired, [])
+        await self.run_until(wheel, 3)
+        self.assertEqual(self.fired, [('a', 3)])
+        self.assertEqual(wheel.pending(), 0)
+
+    async def test_delay_is_rounded_up_to_a_tick(self):
+        wheel = TimerWheel(tick=0.5)
+        wheel._ensure_running()
+        wheel._task.cancel()
+        self.schedule(wheel, 'a', 0.7)
+        self.assertEqual(wheel.get('a').expires, 2)
+        self.schedule(wheel, 'b', 0)
+        self.assertEqual(wheel.get('b').expires, 1)
+
+    async def test_long_delays_cascade_down_to_their_tick(self):
+        # 4 slots and 2 levels hold 16 ticks, later deadlines wait in the overflow
+        wheel = self.make_wheel(slots=4, levels=2)
+        delays = [1, 3, 4, 5, 15, 16, 17, 40, 63, 64, 65, 100]
+        for delay in delays:
+            self.schedule(wheel, delay, delay)
+        self.assertIn(wheel.get(5), wheel.wheels[1][1])
+        self.assertIn(wheel.get(40), wheel.overflow)
+
+        for second in range(1, 101):
+            await self.run_until(wheel, second)
+        self.assertEqual(self.fired, [(delay, delay) for delay in delays])
+
+    async def test_default_wheel_cascades_past_64_ticks(self):
+        wheel = self.make_wheel()
+        for delay in (64, 65, 200, 4095, 4096, 5000):
+            self.schedule(wheel, delay, delay)
+        for second in (63, 64, 65, 199, 200, 4095, 4096, 4999, 5000):
+            await self.run_until(wheel, second)
+        self.assertEqual(self.fired, [(64, 64), (65, 65), (200, 200), (4095, 4095),
+                                      (4096, 4096), (5000, 5000)])
+
+    async def test_scheduling_a_key_again_replaces_its_deadline(self):
+        wheel = self.make_wheel()
+        self.schedule(wheel, 'a', 10)
+        self.schedule(wheel, 'a', 20)
+        self.assertEqual(wheel.pending(), 1)
+        await self.run_until(wheel, 19)
+        self.assertEqual(self.fired, [])
+        await self.run_until(wheel, 20)
+        self.assertEqual(self.fired, [('a', 20)])
+
+        # earlier than before works too
+        self.schedule(wheel, 'b', 30)
+        self.schedule(wheel, 'b', 5)
+        for second in range(21, 61):
+            await self.run_until(wheel, second)
+        self.assertEqual(self.fired, [('a', 20), ('b', 25)])
+
+    async def test_cancel(self):
+        wheel = self.make_wheel()
+        self.schedule(wheel, 'a', 5)
+        self.schedule(wheel, 'b', 100)
+        self.assertTrue(wheel.cancel('a'))
+        self.assertFalse(wheel.cancel('a'))
+        self.assertTrue(wheel.cancel('b'))      # cancelled from an upper level
+        self.assertFalse(wheel.cancel('never'))
+        await self.run_until(wheel, 200)
+        self.assertEqual(self.fired, [])
+        self.assertEqual(wheel.pending(), 0)
+        self.assertTrue(all(not bucket for level in wheel.wheels for bucket in level))
+
+    async def test_catches_up_after_a_stall(self):
+        wheel = self.make_wheel()
+        self.schedule(wheel, 'a', 10)
+        self.schedule(wheel, 'b', 100)
+        # the loop was blocked for 150 seconds: both fire, in order
+        await self.run_until(wheel, 150)
+        self.assertEqual([key for key, _ in self.fired], ['a', 'b'])
+
+    async def test_idle_wheel_does_not_replay_the_idle_ticks(self):
+        wheel = self.make_wheel()
+        self.schedule(wheel, 'a', 2)
+        await self.run_until(wheel, 2)
+        # nothing pending from here on, the wheel stops ticking
+        self.clock.now = 1000
+        self.schedule(wheel, 'b', 5)
+        self.assertEqual(wheel.current_tick, 1000)
+        with mock.patch.object(wheel, '_advance', wraps=wheel._advance) as advance:
+            await self.run_until(wheel, 1004)
+        self.assertEqual(advance.call_count, 4)
+        self.assertEqual(self.fired, [('a', 2)])
+        await self.run_until(wheel, 1005)
+        self.assertEqual(self.fired, [('a', 2), ('b', 1005)])
+
+    async def test_failing_callback_does_not_stop_the_wheel(self):
+        wheel = self.make_wheel()
+
+        async def broken():
+            raise RuntimeError('boom')
+
+        wheel.schedule('broken', 1, broken)
+        self.schedule(wheel, 'a', 2)
+        with self.assertLogs(timer_wheel.logger, 'ERROR'):
+            await self.run_until(wheel, 1)
+            await asyncio.sleep(0)
+        await self.run_until(wheel, 2)
+        self.assertEqual(self.fired, [('a', 2)])
+        self.assertEqual(wheel.stats()['fired'], 2)
+
+
+@skipUnless(fakeredis, "needs fakeredis with Lua (requirements-dev.txt)")
+class LobbyTests(SimpleTestCase):
+    """The pair-or-enqueue script and presence keys, on an in-process Redis"""
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.client = fakeredis.FakeRedis(server=server)
+        self.lobby = Lobby(self.client, fakeredis.FakeAsyncRedis(server=server), ttl=30)
+
+    def queue(self, game='prisoners'):
+        return [ticket.decode() for ticket in self.client.lrange(Lobby.queue_key(game), 0, -1)]
+
+    def test_first_player_is_queued(self):
+        self.assertIsNone(self.lobby.pair_or_enqueue('prisoners', 'a', 'm1'))
+        self.assertEqual(self.queue(), ['m1:a'])
+        self.assertEqual(self.lobby.waiting_match('prisoners', 'a'), 'm1')
+        self.assertTrue(0 < self.client.ttl(Lobby.presence_prefix('prisoners') + 'a') <= 30)
+
+    def test_second_player_pairs_with_the_waiting_one(self):
+        self.lobby.pair_or_enqueue('prisoners', 'a', 'm1')
+        self.assertEqual(self.lobby.pair_or_enqueue('prisoners', 'b', 'm2'), 'm1')
+        self.assertEqual(self.queue(), [])
+        self.assertIsNone(self.lobby.waiting_match('prisoners', 'a'))
+        self.assertIsNone(self.lobby.waiting_match('prisoners', 'b'))
+
+    def test_pair_does_not_queue(self):
+        self.assertIsNone(self.lobby.pair('prisoners', 'a'))
+        self.assertEqual(self.queue(), [])
+        self.assertIsNone(self.lobby.waiting_match('prisoners', 'a'))
+
+    def test_never_pairs_a_player_with_themselves(self):
+        self.lobby.pair_or_enqueue('prisoners', 'a', 'm1')
+        self.assertIsNone(self.lobby.pair('prisoners', 'a'))
+        # queueing again replaces the old ticket
+        self.assertIsNone(self.lobby.pair_or_enqueue('prisoners', 'a', 'm3'))
+        self.assertEqual(self.queue(), ['m3:a'])
+        self.assertEqual(self.lobby.pair_or_enqueue('prisoners', 'b', 'm2'), 'm3')
+
+    def test_stale_tickets_are_dropped(self):
+        self.lobby.pair_or_enqueue('prisoners', 'a', 'm1')
+        self.lobby.leave('prisoners', 'a', 'm1')            # presence gone
+        self.assertIsNone(self.lobby.pair_or_enqueue('prisoners', 'b', 'm2'))
+        self.assertEqual(self.queue(), ['m2:b'])
+        self.assertEqual(self.lobby.pair_or_enqueue('prisoners', 'c', 'm3'), 'm2')
+
+    def test_ticket_of_another_match_is_stale(self):
+        self.lobby.pair_or_enqueue('prisoners', 'a', 'm1')
+        # a's presence now points at another match (a newer tab)
+        self.client.set(Lobby.presence_prefix('prisoners') + 'a', 'm9')
+        self.assertIsNone(self.lobby.pair_or_enqueue('prisoners', 'b', 'm2'))
+        self.assertEqual(self.queue(), ['m2:b'])
+
+    def test_oldest_live_ticket_wins(self):
+        prefix = Lobby.presence_prefix('prisoners')
+        # three waiting at once, the oldest one gone
+        self.client.rpush(Lobby.queue_key('prisoners'), 'm1:a', 'm2:b', 'm3:c')
+        self.client.set(prefix + 'b', 'm2')
+        self.client.set(prefix + 'c', 'm3')
+        self.assertEqual(self.lobby.pair('prisoners', 'd'), 'm2')
+        self.assertEqual(self.lobby.pair('prisoners', 'e'), 'm3')
+        self.assertIsNone(self.lobby.pair('prisoners', 'f'))
+
+    def test_games_have_their_own_queues(self):
+        self.lobby.pair_or_enqueue('prisoners', 'a', 'm1')
+        self.assertIsNone(self.lobby.pair_or_enqueue('ultimatum', 'b', 'u1'))
+        self.assertEqual(self.queue('prisoners'), ['m1:a'])
+        self.assertEqual(self.queue('ultimatum'), ['u1:b'])
+
+    def test_leave_only_drops_the_players_own_presence(self):
+        self.lobby.pair_or_enqueue('prisoners', 'a', 'm1')
+        self.lobby.leave('prisoners', 'a', 'm2')
+        self.assertEqual(self.lobby.waiting_match('prisoners', 'a'), 'm1')
+        self.lobby.leave('prisoners', 'a', 'm1')
+        self.assertIsNone(self.lobby.waiting_match('prisoners', 'a'))
+
+    def test_find_or_queue_skips_partners_that_are_gone(self):
+        prefix = Lobby.presence_prefix('prisoners')
+        self.client.rpush(Lobby.queue_key('prisoners'), 'm1:a', 'm2:b')
+        self.client.set(prefix + 'a', 'm1')
+        self.client.set(prefix + 'b', 'm2')
+        claimed = []
+
+        def claim(match_id):
+            claimed.append(match_id)
+            return None if match_id == 'm1' else f"seat in {match_id}"
+
+        result = self.lobby.find_or_queue('prisoners', 'c', claim, create=None, discard=None)
+        self.assertEqual(result, ('seat in m2', True))
+        self.assertEqual(claimed, ['m1', 'm2'])
+
+    def test_find_or_queue_queues_its_own_match(self):
+        result = self.lobby.find_or_queue(
+            'prisoners', 'a', claim=None, create=lambda: ('own match', 'm1'), discard=None)
+        self.assertEqual(result, ('own match', False))
+        self.assertEqual(self.queue(), ['m1:a'])
+
+    async def test_heartbeat_renews_until_paired(self):
+        self.lobby.pair_or_enqueue('prisoners', 'a', 'm1')
+        key = Lobby.presence_prefix('prisoners') + 'a'
+        self.client.expire(key, 5)
+        self.assertTrue(await self.lobby.heartbeat('prisoners', 'a', 'm1'))
+        self.assertGreater(self.client.ttl(key), 5)
+        self.assertFalse(await self.lobby.heartbeat('prisoners', 'a', 'm2'))
+        self.lobby.pair_or_enqueue('prisoners', 'b', 'm2')
+        self.assertFalse(await self.lobby.heartbeat('prisoners', 'a', 'm1'))
+
+
+class StateSocket(VersionedStateMixin):
+    """A protocol 2 socket of a match whose live state is `live`"""
+
+    def __init__(self, actor, live):
+        self.actor, self.live = actor, live
+        self.scope = {'query_string': f'protocol={STATE_PROTOCOL}'.encode()}
+        self.start_state_sync()
+        self.client_state = None        # what the client holds
+
+    async def _snapshot(self):
+        return dict(self.live)
+
+    async def send_frame(self, frame):
+        self.client_state = frame['game_state']
+
+    def receive(self, event):
+        """What the client makes of a game_state_update event"""
+        variant = self.state_variant(event)
+        if variant == 'state_delta':
+            self.client_state = apply_delta(self.client_state, event['frames'][variant]['state_delta'])
+        elif variant == 'game_state':
+            self.client_state = event['frames'][variant]['game_state']
+        return variant
+
+
+class StateSyncTests(SimpleTestCase):
+
+    def setUp(self):
+        self.live = {'round': 1, 'player1LastAction': None, 'roundHistory': []}
+
+    def connect(self):
+        """A socket of a new match actor (needs the running loop)"""
+        actor = MatchActor('state-test')
+        self.addCleanup(actor.stop)
+        return StateSocket(actor, self.live)
+
+    async def publish(self, socket):
+        event, _ = await socket.actor.call(socket.versioned_state)
+        return event
+
+    def test_diff_and_apply(self):
+        old = {'round': 1, 'roundHistory': [1], 'gone': True}
+        new = {'round': 2, 'roundHistory': [1, 2], 'player1LastAction': None}
+        delta = diff_state(old, new)
+        self.assertEqual(delta, {'set': {'round': 2, 'player1LastAction': None},
+                                 'append': {'roundHistory': [2]}, 'unset': ['gone']})
+        self.assertEqual(apply_delta(old, delta), new)
+
+    async def test_deltas_follow_a_published_snapshot(self):
+        socket = self.connect()
+        await self.publish(socket)
+        await socket.send_snapshot()
+        self.live.update(round=2, roundHistory=['r1'])
+        self.assertEqual(socket.receive(await self.publish(socket)), 'state_delta')
+        self.assertEqual(socket.client_state, self.live)
+
+    async def test_resync_ahead_of_the_published_state(self):
+        socket = self.connect()
+        await self.publish(socket)
+        # a move lands in the live state, the socket resyncs before it is published
+        self.live['player1LastAction'] = 'Cooperate'
+        await socket.send_snapshot()
+        # the round ends and the action is cleared again, as in the published version
+        self.live.update(round=2, player1LastAction=None, roundHistory=['r1'])
+        self.assertEqual(socket.receive(await self.publish(socket)), 'game_state')
+        self.assertEqual(socket.client_state, self.live)
+        # back on deltas from there
+        self.live.update(round=3, roundHistory=['r1', 'r2'])
+        self.assertEqual(socket.receive(await self.publish(socket)), 'state_delta')
+        self.assertEqual(socket.client_state, self.live)
+
+
+@skipUnless(fakeredis, "needs fakeredis with Lua (requirements-dev.txt)")
+class HotStateStoreTests(TestCase):
+    """Write-behind of settled rounds, on an in-process Redis (no flusher thread)"""
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        self.store = HotStateStore(
+            self.client, fakeredis.FakeAsyncRedis(server=server, decode_responses=True), interval=1)
+        patcher = mock.patch.object(HotStateStore, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_match(self, match_id):
+        game_match = GameMatch.objects.create(
+            match_id=match_id, player_1_fingerprint='p1', player_2_fingerprint='p2',
+            player_1_ip='127.0.0.1', player_1_country='Unknown', player_1_city='Unknown')
+        initialize_rounds([game_match])
+        return list(game_match.rounds.order_by('round_number'))
+
+    def settle(self, round_obj, p1='Cooperate', p2='Defect'):
+        round_obj.player_1_action, round_obj.player_2_action = p1, p2
+        round_obj.player_1_score, round_obj.player_2_score = 0, 5
+        round_obj.round_end_time = '2024-01-01 10:00'
+        return round_obj
+
+    def stored(self, round_obj):
+        return GameRound.objects.values_list('player_1_action', 'player_2_action', 'player_2_score',
+                                             'round_end_time').get(pk=round_obj.pk)
+
+    async def test_rounds_are_written_behind(self):
+        rounds = await database_sync_to_async(self.make_match)('hot-1')
+        await self.store.write_round('prisoners', 'hot-1', self.settle(rounds[0]))
+        await self.store.write_round('prisoners', 'hot-1', self.settle(rounds[1], 'Defect'))
+        self.assertEqual(self.client.zrange(DIRTY_KEY, 0, -1), ['prisoners:hot-1'])
+        self.assertEqual(await database_sync_to_async(self.stored)(rounds[0]), (None, None, None, None))
+
+        self.assertEqual(await database_sync_to_async(self.store.flush)(), 1)
+        self.assertEqual(await database_sync_to_async(self.stored)(rounds[0]),
+                         ('Cooperate', 'Defect', 5, '2024-01-01 10:00'))
+        self.assertEqual((await database_sync_to_async(self.stored)(rounds[1]))[0], 'Defect')
+        self.assertFalse(self.client.exists(HotStateStore.match_key('prisoners', 'hot-1')))
+        self.assertEqual(self.client.zcard(DIRTY_KEY), 0)
+        self.assertEqual(self.store.counts['flushed_rounds'], 2)
+
+    async def test_flush_match_writes_one_match(self):
+        first = await database_sync_to_async(self.make_match)('hot-1')
+        second = await database_sync_to_async(self.make_match)('hot-2')
+        await self.store.write_round('prisoners', 'hot-1', self.settle(first[0]))
+        await self.store.write_round('prisoners', 'hot-2', self.settle(second[0]))
+        await self.store.flush_match('prisoners', 'hot-1')
+        self.assertEqual((await database_sync_to_async(self.stored)(first[0]))[0], 'Cooperate')
+        self.assertIsNone((await database_sync_to_async(self.stored)(second[0]))[0])
+        self.assertEqual(self.client.zrange(DIRTY_KEY, 0, -1), ['prisoners:hot-2'])
+
+    async def test_rewritten_match_stays_dirty(self):
+        rounds = await database_sync_to_async(self.make_match)('hot-1')
+        key = HotStateStore.match_key('prisoners', 'hot-1')
+        await self.store.write_round('prisoners', 'hot-1', self.settle(rounds[0]))
+        flushed_version = self.client.hget(key, 'version')
+        # a round written between the flusher's read and its ack
+        await self.store.write_round('prisoners', 'hot-1', self.settle(rounds[1]))
+        self.store._ack(keys=[key, DIRTY_KEY], args=['prisoners:hot-1', flushed_version])
+        self.assertTrue(self.client.exists(key))
+        self.assertEqual(self.client.zrange(DIRTY_KEY, 0, -1), ['prisoners:hot-1'])
+
+    async def test_overlay_lays_unflushed_rounds_over_the_rows(self):
+        rounds = await database_sync_to_async(self.make_match)('hot-1')
+        await self.store.write_round('prisoners', 'hot-1', self.settle(rounds[2]))
+        # a worker that starts over reads the rows from the database
+        reloaded = await database_sync_to_async(
+            lambda: list(GameRound.objects.filter(match__match_id='hot-1').order_by('round_number')))()
+        self.assertEqual(await self.store.overlay('prisoners', 'hot-1', reloaded), 1)
+        self.assertEqual((reloaded[2].player_1_action, reloaded[2].player_2_score), ('Cooperate', 5))
+        self.assertEqual(reloaded[2].pk, rounds[2].pk)
+        self.assertIsNone(reloaded[1].player_1_action)
+
+    async def test_discard(self):
+        rounds = await database_sync_to_async(self.make_match)('hot-1')
+        await self.store.write_round('prisoners', 'hot-1', self.settle(rounds[0]))
+        await self.store.discard('prisoners', 'hot-1')
+        self.assertEqual(await database_sync_to_async(self.store.flush)(), 0)
+        self.assertIsNone((await database_sync_to_async(self.stored)(rounds[0]))[0])
+
+    def test_flush_all_takes_every_batch(self):
+        self.store.batch_size = 2
+        matches = [self.make_match(f"hot-{n}") for n in range(5)]
+        for n, rounds in enumerate(matches):
+            self.client.zadd(DIRTY_KEY, {f"prisoners:hot-{n}": n})
+            self.client.hset(HotStateStore.match_key('prisoners', f"hot-{n}"),
+                             'round:1', self.store.encode_round(self.settle(rounds[0])))
+        self.assertEqual(self.store.flush_all(), 5)
+        self.assertEqual(GameRound.objects.filter(player_1_action='Cooperate').count(), 5)
+        self.assertEqual(self.client.zcard(DIRTY_KEY), 0)
+
+
+def play_match(match_id, game_mode, day, moves, completed_at=None):
+    """A Prisoner's Dilemma match settled round by round; None for a missing move"""
+    game_match = GameMatch.objects.create(
+        match_id=match_id, game_mode=game_mode, player_1_fingerprint='p1',
+        player_2_fingerprint='p2', player_1_ip='127.0.0.1', player_1_country='Morocco',
+        player_1_city='Rabat')
+    initialize_rounds([game_match])
+    previous_round = None
+    for round_obj, (p1, p2) in zip(game_match.rounds.order_by('round_number'), moves):
+        round_obj.player_1_action, round_obj.player_2_action = p1, p2
+        round_obj.round_start_time = f'{day} 10:{round_obj.round_number:02}'
+        if p2 is None:
+            round_obj.save()
+            continue
+        apply_round_stats(round_obj, previous_round)
+        apply_match_stats(game_match, round_obj)
+        save_game_stats(game_match, round_obj)
+        previous_round = round_obj
+    if completed_at:
+        GameMatch.objects.filter(pk=game_match.pk).update(completed_at=completed_at)
+    return game_match
+
+
+class RoundExportTests(TestCase):
+    """The research CSV of the Prisoner's Dilemma rounds"""
+
+    HEADER = [
+        'row_number', 'game_match_uuid', 'player_1_fingerprint', 'player_1_action',
+        'player_1_score', 'player_2_fingerprint', 'player_2_action', 'player_2_score',
+        'player_1_cooperation_percent', 'player_2_cooperation_percent',
+        'avg_cooperation_percent', 'player_1_cumulative_score', 'player_2_cumulative_score',
+        'player_1_country', 'player_1_city', 'player_2_country', 'player_2_city',
+        'round_start', 'round_end', 'match_complete', 'match_completed_at',
+    ]
+
+    def setUp(self):
+        # online b: finished on the 5th; bot a: 3 settled rounds and a lone move on the 1st
+        play_match('b-online', 'online', '2024-03-05', [('Cooperate', 'Defect')] * 25)
+        play_match('a-bot', 'bot', '2024-03-01', [('Defect', 'Defect')] * 3 + [('Cooperate', None)])
+
+    def export(self, **filters):
+        return list(csv.reader(io.StringIO(''.join(EXPORTS['prisoners'].stream(**filters)))))
+
+    def test_header_and_column_order(self):
+        header, first, *_ = self.export()
+        self.assertEqual(header, self.HEADER)
+        self.assertEqual(first[:8], ['1', 'a-bot', 'p1', 'Defect', '10', 'p2', 'Defect', '10'])
+        self.assertEqual(first[13:15], ['Morocco', 'Rabat'])
+        self.assertEqual(first[17], '2024-03-01 10:01')
+
+    def test_ultimatum_header(self):
+        self.assertEqual(EXPORTS['ultimatum'].header, [
+            'round_number', 'game_match_uuid', 'game_mode', 'player_1_fingerprint',
+            'player_1_ip_address', 'player_1_coins_to_keep', 'player_1_coins_to_offer',
+            'player_1_response_to_p2_offer', 'player_1_coins_made_in_round',
+            'player_2_fingerprint', 'player_2_ip_address', 'player_2_coins_to_keep',
+            'player_2_coins_to_offer', 'player_2_response_to_p1_offer',
+            'player_2_coins_made_in_round', 'players_sum_coins_in_round',
+            'players_sum_coins_total', 'player_1_final_score', 'player_2_final_score',
+            'player_1_country', 'player_1_city', 'player_2_country', 'player_2_city',
+            'round_start', 'round_end', 'match_complete',
+        ])
+
+    def test_settled_rounds_numbered_per_match(self):
+        rows = self.export()[1:]
+        self.assertEqual([(r[1], r[0]) for r in rows],
+                         [('a-bot', str(n)) for n in range(1, 4)] +
+                         [('b-online', str(n)) for n in range(1, 26)])
+
+    def test_booleans_as_t_and_f(self):
+        rows = self.export()[1:]
+        self.assertEqual({r[1]: r[19] for r in rows}, {'a-bot': 'f', 'b-online': 't'})
+
+    def test_filters(self):
+        def matches(**filters):
+            return sorted({row[1] for row in self.export(**filters)[1:]})
+
+        self.assertEqual(matches(), ['a-bot', 'b-online'])
+        self.assertEqual(matches(since=date(2024, 3, 5)), ['b-online'])
+        self.assertEqual(matches(until=date(2024, 3, 1)), ['a-bot'])
+        self.assertEqual(matches(since=date(2024, 3, 2), until=date(2024, 3, 4)), [])
+        self.assertEqual(matches(mode='bot'), ['a-bot'])
+        self.assertEqual(matches(complete=True), ['b-online'])
+        self.assertEqual(matches(complete=False, mode='online'), [])
+
+    def test_parse_filters(self):
+        self.assertEqual(parse_filters({}), {})
+        self.assertEqual(
+            parse_filters({'since': '2024-03-01', 'until': '2024-03-31', 'mode': 'online',
+                           'complete': 'false'}),
+            {'since': date(2024, 3, 1), 'until': date(2024, 3, 31), 'mode': 'online',
+             'complete': False})
+        for params in ({'since': '03/01/2024'}, {'mode': 'solo'}, {'complete': 'yes'}):
+            with self.assertRaises(ValueError):
+                parse_filters(params)
+
+    def test_view_is_for_staff(self):
+        url = '/api/prisoners/export/'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('player'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('researcher', is_staff=True))
+        response = self.client.get(url, {'mode': 'bot'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="prisoners_rounds.csv"')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows, self.export(mode='bot'))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(self.client.get(url, {'complete': 'maybe'}).status_code, 400)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+@skipUnless(pq, "needs pyarrow (requirements.txt)")
+class ParquetExportTests(TestCase):
+    """Incremental runs of the Parquet dataset of the Prisoner's Dilemma rounds"""
+
+    MOVES = [('Cooperate', 'Defect')] * 25
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        play_match('a', 'online', '2024-03-05', self.MOVES, completed_at='2024-03-05 12:00')
+
+    def run_at(self, now):
+        with mock.patch('game.parquet_export.timezone.now', return_value=now):
+            return ParquetExport(EXPORTS['prisoners'], self.directory).run()
+
+    def exported(self):
+        """{match id: rounds} of the whole dataset"""
+        table = pq.read_table(f'{self.directory}/prisoners')
+        counts = {}
+        for match_id in table.column('game_match_uuid').to_pylist():
+            counts[match_id] = counts.get(match_id, 0) + 1
+        return counts
+
+    def test_runs_append_what_completed_since(self):
+        self.assertEqual(self.run_at(utc(2024, 3, 5, 12, 30)), (25, 1))
+        self.assertEqual(self.run_at(utc(2024, 3, 5, 13, 0)), (0, 0))
+
+        play_match('b', 'online', '2024-03-06', self.MOVES, completed_at='2024-03-06 09:00')
+        # 09:00 is not over yet
+        self.assertEqual(self.run_at(utc(2024, 3, 6, 9, 0)), (0, 0))
+        self.assertEqual(self.run_at(utc(2024, 3, 6, 9, 1)), (25, 1))
+        self.assertEqual(self.exported(), {'a': 25, 'b': 25})
+
+        table = pq.read_table(f'{self.directory}/prisoners')
+        first_rounds = table.filter(pc.equal(table['row_number'], 1))
+        self.assertEqual(sorted(first_rounds.column('round_start').to_pylist()),
+                         [datetime(2024, 3, 5, 10, 1), datetime(2024, 3, 6, 10, 1)])
+
+    def test_rerun_after_crash_before_watermark(self):
+        self.run_at(utc(2024, 3, 5, 12, 30))
+        play_match('b', 'online', '2024-03-06', self.MOVES, completed_at='2024-03-06 09:00')
+
+        # the files are renamed, the watermark is not written
+        with mock.patch.object(ParquetExport, 'write_watermark', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.run_at(utc(2024, 3, 6, 10, 0))
+        self.assertEqual(self.exported(), {'a': 25, 'b': 25})
+
+        # the rerun starts from the same watermark and overwrites that file
+        play_match('c', 'online', '2024-03-06', self.MOVES, completed_at='2024-03-06 10:30')
+        self.assertEqual(self.run_at(utc(2024, 3, 6, 11, 0)), (50, 1))
+        self.assertEqual(self.exported(), {'a': 25, 'b': 25, 'c': 25})
+
+
+class ChangeExportTests(TestCase):
+    """Incremental CSV exports of the completed Prisoner's Dilemma matches"""
+
+    MOVES = [('Cooperate', 'Defect')] * 25
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.export = ChangeExport(EXPORTS['prisoners'], self.directory)
+        os.makedirs(self.export.directory)
+        # three matches completed in the same minute, one still playing
+        for match_id in 'abc':
+            play_match(match_id, 'online', '2024-03-05', self.MOVES, completed_at='2024-03-05 12:00')
+        play_match('d', 'online', '2024-03-05', self.MOVES[:3])
+
+    def exported(self):
+        """{match id: rounds} over every file written"""
+        counts = {}
+        for path in sorted(glob.glob(f'{self.export.directory}/*.csv')):
+            with open(path, newline='') as f:
+                for row in list(csv.reader(f))[1:]:
+                    counts[row[1]] = counts.get(row[1], 0) + 1
+        return counts
+
+    def test_batches_split_inside_a_minute(self):
+        with mock.patch.object(change_export, 'BATCH_MATCHES', 2):
+            self.assertEqual(self.export.export_batch('2024-03-05 12:30'), (2, 50))
+            self.assertEqual(self.exported(), {'a': 25, 'b': 25})
+            # same completion minute as the watermark, later primary key
+            self.assertEqual(self.export.export_batch('2024-03-05 12:30'), (1, 25))
+            self.assertEqual(self.export.export_batch('2024-03-05 12:30'), (0, 0))
+        self.assertEqual(self.exported(), {'a': 25, 'b': 25, 'c': 25})
+
+    def test_runs_export_each_match_once(self):
+        with mock.patch('game.change_export.timezone.now', return_value=utc(2024, 3, 5, 12, 0)):
+            # 12:00 is not over yet
+            self.assertEqual(self.export.run(), {'matches': 0, 'rows': 0, 'files': 0})
+        with mock.patch('game.change_export.timezone.now', return_value=utc(2024, 3, 5, 12, 30)):
+            self.assertEqual(self.export.run(), {'matches': 3, 'rows': 75, 'files': 1})
+
+        GameMatch.objects.filter(match_id='d').update(is_complete=True, completed_at='2024-03-05 12:40')
+        play_match('e', 'online', '2024-03-05', self.MOVES, completed_at='2024-03-05 12:40')
+        with mock.patch.object(change_export, 'BATCH_MATCHES', 1), \
+                mock.patch('game.change_export.timezone.now', return_value=utc(2024, 3, 5, 13, 0)):
+            self.assertEqual(self.export.run(), {'matches': 2, 'rows': 28, 'files': 2})
+            self.assertEqual(self.export.run(), {'matches': 0, 'rows': 0, 'files': 0})
+
+        self.assertEqual(self.exported(), {'a': 25, 'b': 25, 'c': 25, 'd': 3, 'e': 25})
+        mark = ExportWatermark.objects.get(name='changes:prisoners')
+        self.assertEqual((mark.completed_at, mark.last_match_id),
+                         ('2024-03-05 12:40', GameMatch.objects.get(match_id='e').pk))
+        self.assertEqual((mark.exported_matches, mark.exported_rows), (5, 103))
@@ -0,0 +1,200 @@
+"""
+Hierarchical timer wheel for move deadlines.
+
+Sockets used to start one asyncio.sleep task per pending deadline, so
+every open match kept a couple of sleeper tasks alive and a burst of
+moves meant a burst of task churn. The wheel is one task per process
+that ticks every TIMER_WHEEL_TICK seconds: a deadline is a set entry in
+a slot, cancelling it is a set removal, and only deadlines that
+actually fire start a task for their callback.
+
+Level 0 has one slot per tick, every further level one slot per full
+turn of the level below (64 slots each: 64 ticks, ~68 minutes and ~3
+days at the default tick). A deadline waits in the coarsest level that
+can hold it and moves down a level whenever the level above turns over
+its slot. Deadlines are scheduled under a key ((match, phase, socket)
+for the consumers); scheduling a key again replaces its deadline.
+
+Callbacks should only look at in-memory state – they fire on the event
+loop's thread.
+"""
+import asyncio
+import logging
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SLOTS = 64
+LEVELS = 3
+
+
+class Timer:
+    __slots__ = ("key", "expires", "callback", "args", "bucket")
+
+    def __init__(self, key, expires, callback, args):
+        self.key = key
+        self.expires = expires              # in ticks
+        self.callback = callback
+        self.args = args
+        self.bucket = None
+
+
+class TimerWheel:
+
+    def __init__(self, tick=0.5, slots=SLOTS, levels=LEVELS):
+        self.tick = tick
+        self.slots = slots
+        self.wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self.overflow = set()               # beyond the last level
+        self.timers = {}                    # key -> Timer
+        self.fired = 0
+        self._loop = None
+        self._task = None
+        self._wake = None
+        self._started_at = None
+        self.current_tick = 0
+
+    # ─────────────────────── public API ───────────────────────
+    def schedule(self, key, delay, callback, *args):
+        """
+        Call `callback(*args)` (a coroutine function) in about `delay`
+        seconds, rounded up to the next tick. Replaces an earlier
+        deadline with the same key.
+        """
+        self._ensure_running()
+        self.cancel(key)
+        if not self.timers:
+            # the wheel doesn't tick while empty, catch up without replaying
+            self.current_tick = self._now_tick()
+        ticks = max(1, -(-delay // self.tick))      # ceil, at least one tick
+        timer = Timer(key, self._now_tick() + int(ticks), callback, args)
+        self.timers[key] = timer
+        self._place(timer)
+        self._wake.set()
+        return timer
+
+    def cancel(self, key):
+        """Drop the deadline of `key`; False if there was none."""
+        timer = self.timers.pop(key, None)
+        if timer is None:
+            return False
+        if timer.bucket is not None:
+            timer.bucket.discard(timer)
+            timer.bucket = None
+        return True
+
+    def get(self, key):
+        """The pending Timer of `key`, or None."""
+        return self.timers.get(key)
+
+    def pending(self):
+        return len(self.timers)
+
+    def stats(self):
+        return {"pending": len(self.timers), "fired": self.fired, "tick": self.tick}
+
+    # ─────────────────────── wheel ───────────────────────
+    def _now_tick(self):
+        return int((time.monotonic() - self._started_at) / self.tick)
+
+    def _place(self, timer):
+        if timer.expires < self.current_tick:
+            timer.expires = self.current_tick + 1
+        granularity = 1
+        for wheel in self.wheels:
+            if timer.expires // granularity - self.current_tick // granularity < self.slots:
+                bucket = wheel[(timer.expires // granularity) % self.slots]
+                break
+            granularity *= self.slots
+        else:
+            bucket = self.overflow
+        bucket.add(timer)
+        timer.bucket = bucket
+
+    def _advance(self):
+        """Move one tick ahead and fire whatever is due."""
+        self.current_tick += 1
+        tick = self.current_tick
+        granularity = 1
+        for level in range(1, len(self.wheels)):
+            granularity *= self.slots
+            if tick % granularity:
+                break
+            self._cascade(self.wheels[level][(tick // granularity) % self.slots])
+        else:
+            if tick % (granularity * self.slots) == 0:
+                self._cascade(self.overflow)
+
+        due = self.wheels[0][tick % self.slots]
+        for timer in list(due):
+            if timer.expires <= tick:
+                due.discard(timer)
+                timer.bucket = None
+                if self.timers.get(timer.key) is timer:
+                    del self.timers[timer.key]
+                    self._fire(timer)
+
+    def _cascade(self, bucket):
+        timers = list(bucket)
+        bucket.clear()
+        for timer in timers:
+            self._place(timer)
+
+    def _fire(self, timer):
+        self.fired += 1
+        try:
+            task = self._loop.create_task(timer.callback(*timer.args))
+        except Exception:
+            logger.exception("Timer %s failed to start", timer.key)
+            return
+        task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Timer callback failed", exc_info=task.exception())
+
+    # ─────────────────────── driver task ───────────────────────
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # first use, or the previous loop is gone (tests run one per case)
+            if self._task is not None and not self._loop.is_closed():
+                self._task.cancel()
+            for wheel in self.wheels:
+                for bucket in wheel:
+                    bucket.clear()
+            self.overflow.clear()
+            self.timers.clear()
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._started_at = time.monotonic()
+            self.current_tick = 0
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            if not self.timers:
+                # nothing to wait for, don't tick
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            now_tick = self._now_tick()
+            if self.current_tick < now_tick:
+                while self.current_tick < now_tick:
+                    self._advance()
+                continue
+            next_at = self._started_at + (self.current_tick + 1) * self.tick
+            await asyncio.sleep(max(0, next_at - time.monotonic()))
+
+
+_wheel = None
+
+
+def get_timer_wheel():
+    """The process-wide wheel shared by all consumers."""
+    global _wheel
+    if _wheel is None:
+        _wheel = TimerWheel(getattr(settings, "TIMER_WHEEL_TICK", 0.5))
+    return _wheel
@@ -17,11 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import TemplateView
+from game import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/prisoners/', include('the_game.urls')),
     path('api/ultimatum/', include('ultimatum.urls')), 
+    path('api/metrics/', views.metrics, name='metrics'),
     path('', TemplateView.as_view(template_name='index.html')),
     path('<path:path>', TemplateView.as_view(template_name='index.html')),
 ]
\ No newline at end of file
@@ -0,0 +1,52 @@
+import logging
+
+import redis
+from django.http import JsonResponse
+
+from .db_executor import executor_stats, repository_backend
+from .event_log import get_event_log
+from .hot_state import get_hot_state
+from .lobby import get_lobby
+from .match_pool import get_match_pool
+from .timer_wheel import get_timer_wheel
+
+logger = logging.getLogger(__name__)
+
+
+def redis_section(data, name, read):
+    """data[name] = read(), or the error when Redis can't be reached"""
+    try:
+        data[name] = read()
+    except redis.RedisError as e:
+        logger.warning("Metrics section %s unavailable: %s", name, e)
+        data[name] = {'error': f'Redis unavailable: {e}'}
+
+
+def metrics(request):
+    """Runtime metrics of this worker process, for staff users"""
+    if not request.user.is_staff:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Metrics are for staff users, log in through /admin/ first'
+        }, status=403)
+
+    data = {
+        'status': 'success',
+        'db_executor': executor_stats(),
+        'repository_backend': repository_backend(),
+        'timer_wheel': get_timer_wheel().stats(),
+    }
+    lobby = get_lobby()
+    if lobby is not None:
+        redis_section(data, 'lobby_queue', lambda: {
+            game: lobby.queue_length(game) for game in ('prisoners', 'ultimatum')})
+    pool = get_match_pool()
+    if pool is not None:
+        data['match_pool'] = pool.stats()
+    hot_state = get_hot_state()
+    if hot_state is not None:
+        redis_section(data, 'hot_state', hot_state.stats)
+    event_log = get_event_log()
+    if event_log is not None:
+        data['event_log'] = event_log.stats()
+    return JsonResponse(data)
@@ -1,4 +1,5 @@
 from django.contrib import admin
-from .models import GameMatch
+from .models import ExportWatermark, GameMatch
 
 admin.site.register(GameMatch)
+admin.site.register(ExportWatermark)
@@ -1,86 +1,193 @@
-import json
 import asyncio
 import logging
-from django.utils import timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from asgiref.sync import sync_to_async
-from .models import GameMatch, GameRound
-from .game_logic import calculate_payoff, update_game_stats
+from django.conf import settings
+from game.codec import FrameCodecMixin
+from game.event_log import ABORT, JOIN, MOVE, ROUND_SETTLED, EventLogMixin
+from game.event_order import OrderedGroupEventsMixin
+from game.lobby import get_lobby
+from game.match_actor import acquire_match_actor, release_match_actor
+from game.state_sync import VersionedStateMixin
+from game.timer_wheel import get_timer_wheel
+from .game_logic import apply_round_stats, apply_match_stats
+from .match_state import load_match_state
+from .repository import get_match_repository
 
 logger = logging.getLogger(__name__)
 
+BOT_THINKING_TIME = 0.4     # seconds before the bot answers a move
 
-class GameConsumer(AsyncWebsocketConsumer):
+
+class GameConsumer(FrameCodecMixin, OrderedGroupEventsMixin, VersionedStateMixin,
+                   EventLogMixin, AsyncWebsocketConsumer):
+
+    event_model = "the_game.GameMatchEvent"
 
     # ───────────────────────── connect ──────────────────────────
     async def connect(self):
         self.match_id = self.scope["url_route"]["kwargs"]["match_id"]
-        self.game_match = await self.get_game_match(self.match_id)
-        if not self.game_match:
+        self.repository = get_match_repository()
+        self.timers = get_timer_wheel()
+        self.joined = False
+        # every move of this match is serialized through one actor
+        self.actor = acquire_match_actor(f"pd:{self.match_id}")
+        self.state = await self.actor.call(self.load_state)
+        if not self.state:
+            self.game_match = None
             logger.warning("Match %s not found – closing WS", self.match_id)
             await self.close()
             return
+        self.game_match = self.state.game_match
 
         self.room_group_name = f"game_{self.match_id}"
         await self.channel_layer.group_add(self.room_group_name,
                                            self.channel_name)
-        await self.accept()
-
-        await self.send(text_data=json.dumps({
-            "game_state": await self.get_game_state()
-        }))
+        self.start_event_order()
+        self.start_state_sync()
+        # JSON, or MessagePack if the client offers that subprotocol
+        await self.accept_with_codec()
+        self.start_deadline("join", self._join_deadline_expired)
+
+        # the one full state of this socket, deltas follow (see game/state_sync.py)
+        await self.send_snapshot()
+
+        # keep the lobby ticket alive while player 1 waits for an opponent
+        self.lobby = get_lobby()
+        if self.lobby is not None and self.is_waiting_for_opponent():
+            self.lobby_task = asyncio.create_task(self.lobby.keep_alive(
+                "prisoners", self.game_match.player_1_fingerprint, self.match_id))
+
+    def is_waiting_for_opponent(self):
+        return (self.game_match.game_mode == "online"
+                and self.game_match.player_2_fingerprint is None)
+
+    def stop_lobby_heartbeat(self):
+        task = getattr(self, "lobby_task", None)
+        if task and not task.done():
+            task.cancel()
+        self.lobby_task = None
+
+    # ──────────────────── server-side deadlines ────────────────────
+    def deadline_key(self, phase):
+        # the join deadline belongs to a socket, the move deadline to the match
+        owner = self.channel_name if phase == "join" else None
+        return (f"pd:{self.match_id}", phase, owner)
+
+    def start_deadline(self, phase, callback, *args):
+        seconds = getattr(settings, "PD_DEADLINES", {}).get(phase)
+        if seconds:
+            self.timers.schedule(self.deadline_key(phase), seconds, callback, *args)
+
+    def cancel_deadline(self, phase):
+        self.timers.cancel(self.deadline_key(phase))
+
+    async def start_move_deadline(self):
+        """Give both players PD_DEADLINES["move"] seconds for the open round."""
+        round_number = await self.actor.call(self.open_round_number)
+        if round_number is None:
+            self.cancel_deadline("move")
+            return
+        pending = self.timers.get(self.deadline_key("move"))
+        if pending is not None and pending.args == (round_number,):
+            return      # a rejoin doesn't buy the round more time
+        self.start_deadline("move", self._move_deadline_expired, round_number)
+
+    async def _join_deadline_expired(self):
+        if not self.joined:
+            logger.info("Socket never joined match %s – closing it", self.match_id)
+            await self.close(code=4001)
+
+    async def _move_deadline_expired(self, round_number):
+        if not await self.actor.call(self.is_round_open, round_number):
+            return
+        logger.info("Round %s of match %s stalled – ending the match", round_number, self.match_id)
+        await self.group_publish({
+            "type": "game_aborted",
+            "msg": "Match ended due to player inactivity. You will be redirected to the game lobby.",
+            "redirect_to": "/prisoners"
+        })
+        if await self.actor.call(self.delete_match, "inactivity"):
+            logger.info("Match %s deleted due to inactivity", self.match_id)
+        # drop every socket of the match, dead ones included
+        await self.group_publish({"type": "force_disconnect"})
 
     # ─────────────────────── disconnect ─────────────────────────
     async def disconnect(self, _code):
+        self.stop_lobby_heartbeat()
+        if hasattr(self, "timers"):
+            self.cancel_deadline("join")
+            # an unfinished match goes away with any of its sockets
+            self.cancel_deadline("move")
+            self.cancel_deadline("bot_move")
+        if getattr(self, "lobby", None) is not None and self.is_waiting_for_opponent():
+            await self.lobby.aleave("prisoners", self.game_match.player_1_fingerprint,
+                                    self.match_id)
+
         if hasattr(self, "room_group_name"):
             await self.channel_layer.group_discard(self.room_group_name,
                                                    self.channel_name)
+            self.stop_event_order()
 
         # Delete incomplete matches on disconnect
         if self.game_match:
             match_id = self.match_id
-            deleted = await self.delete_incomplete_match()
+            deleted = await self.actor.call(self.delete_incomplete_match)
             if deleted:
-                await self.channel_layer.group_send(self.room_group_name, {
+                await self.group_publish({
                     "type": "game_aborted",
                     "msg": "Match was incomplete and has been deleted.",
                     "redirect_to": "/prisoners"
                 })
                 logger.info("Incomplete match %s deleted.", match_id)
+        if hasattr(self, "actor"):
+            release_match_actor(self.actor)
 
-    async def game_aborted(self, event):
-        await self.send(text_data=json.dumps({
+    async def lobby_matched(self, event):
+        """An opponent took the second seat over HTTP – tell player 1 now."""
+        self.stop_lobby_heartbeat()
+        await self.actor.call(self.refresh_seats)
+        await self.send_snapshot(matched=True)
+
+    async def force_disconnect(self, event):
+        await self.close(code=4001)
+
+    def game_aborted_frame(self, event):
+        return {
             "game_aborted": True,
             "message": event["msg"],
             "redirect_to": event.get("redirect_to", "/prisoners")  # Default to prisoners page
-        }))
+        }
+
+    async def game_aborted(self, event):
+        await self.forward_frame(event)
 
     # ──────────────────────── receive ───────────────────────────
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.decode_frame(text_data, bytes_data)
         action = data.get("action")
         fp = data.get("player_fingerprint")
+        if action == "resync":
+            # the client missed a state version
+            await self.send_snapshot()
+            return
         if not action or not fp:
             return
 
         gs = await self.get_game_state()
         if gs["gameOver"]:
-            await self.send(text_data=json.dumps(
-                {"error": "Game is already over"}))
+            await self.send_frame({"error": "Game is already over"})
             return
 
         # ─────── join ───────
         if action == "join":
             if not await self.handle_join(fp):
-                await self.send(text_data=json.dumps(
-                    {"error": "Match is full or already started."}))
+                await self.send_frame({"error": "Match is full or already started."})
                 await self.close()
                 return
-            await self.channel_layer.group_send(self.room_group_name, {
-                "type": "game_state_update",
-                "game_state": await self.get_game_state(),
-            })
+            self.joined = True
+            self.cancel_deadline("join")
+            await self.publish_state()
+            await self.start_move_deadline()
             return
 
         # ─────── timeout/abandon ───────
@@ -88,15 +195,15 @@ class GameConsumer(AsyncWebsocketConsumer):
             logger.info("Player %s abandoned match %s due to timeout", fp, self.match_id)
             
             # Mark match as complete/abandoned and notify all players
-            await self.channel_layer.group_send(self.room_group_name, {
+            await self.group_publish({
                 "type": "game_aborted",
                 "msg": "Match ended due to player inactivity. You will be redirected to the game lobby.",
                 "redirect_to": "/prisoners"  # Redirect to prisoners page
             })
             
             # Delete the match
-            if self.game_match:
-                await database_sync_to_async(self.game_match.delete)()
+            self.cancel_deadline("move")
+            if await self.actor.call(self.delete_match, action):
                 logger.info("Match %s deleted due to timeout", self.match_id)
             return
 
@@ -107,87 +214,126 @@ class GameConsumer(AsyncWebsocketConsumer):
                 self.game_match.player_2_fingerprint,
                 "bot",
             ):
-                await self.send(text_data=json.dumps(
-                    {"error": "You are not a registered player."}))
+                await self.send_frame({"error": "You are not a registered player."})
                 return
 
-            if not await self.process_action(fp, action): 
+            stored, settled = await self.actor.call(self.process_action, fp, action)
+            if not stored:
                 return
 
-            await self.channel_layer.group_send(self.room_group_name, {
+            await self.group_publish({
                 "type": "game_action",
                 "player_fingerprint": fp,
                 "action": action,
             })
 
-            # bot replies right after human move
+            # bot replies shortly after the human move, off this receive path
             if (self.game_match.game_mode == "bot"
                     and fp == self.game_match.player_1_fingerprint):
-                await asyncio.sleep(0.4)
-                await self.make_bot_move()
-
-            # settle results when both moves are present
-            if await self.check_round_complete():
-                await self.calculate_round_results()
-                gs = await self.get_game_state()
-                await self.channel_layer.group_send(self.room_group_name, {
-                    "type": "game_state_update",
-                    "game_state": gs,
-                })
-                if gs["gameOver"]:
-                    await self.save_final_scores(gs)
-                    await self.channel_layer.group_send(self.room_group_name, {
-                        "type": "game_over",
-                        "player1_score": gs["player1Score"],
-                        "player2_score": gs["player2Score"],
-                        "player1_cooperation": gs["player1CooperationPercent"],
-                        "player2_cooperation": gs["player2CooperationPercent"],
-                    })
+                self.timers.schedule(self.deadline_key("bot_move"), BOT_THINKING_TIME,
+                                     self._bot_turn)
+
+            # results were settled when the second move came in
+            if settled:
+                await self.broadcast_round_results()
+
+    async def broadcast_round_results(self):
+        gs = await self.publish_state()
+        if gs["gameOver"]:
+            self.cancel_deadline("move")
+            await self.group_publish({
+                "type": "game_over",
+                "player1_score": gs["player1Score"],
+                "player2_score": gs["player2Score"],
+                "player1_cooperation": gs["player1CooperationPercent"],
+                "player2_cooperation": gs["player2CooperationPercent"],
+            })
+        else:
+            await self.start_move_deadline()
 
     # ─────────────── group message helpers ────────────────
-    async def game_action(self, event):
-        await self.send(text_data=json.dumps({
+    # the client frame of an event is built and encoded once, by its
+    # publisher (see game/codec.py); the handlers only forward it
+    def game_action_frame(self, event):
+        return {
             "player_fingerprint": event["player_fingerprint"],
             "action": event["action"],
-        }))
+        }
+
+    async def game_action(self, event):
+        await self.forward_frame(event)
 
     async def game_state_update(self, event):
-        await self.send(text_data=json.dumps({
-            "game_state": event["game_state"]
-        }))
+        variant = self.state_variant(event)
+        if variant is not None:
+            await self.forward_frame(event, variant)
 
-    async def game_over(self, event):
-        await self.send(text_data=json.dumps({
+    def game_over_frame(self, event):
+        return {
             "game_over": True,
             "player1_score": event["player1_score"],
             "player2_score": event["player2_score"],
             "player1_cooperation": event["player1_cooperation"],
             "player2_cooperation": event["player2_cooperation"],
-        }))
+        }
 
-    # ──────────────────────  DB helpers  ──────────────────────
-    @database_sync_to_async
-    def get_game_match(self, match_id):
-        try:
-            return GameMatch.objects.get(match_id=match_id)
-        except GameMatch.DoesNotExist:
-            return None
+    async def game_over(self, event):
+        await self.forward_frame(event)
 
-    @database_sync_to_async
-    def delete_incomplete_match(self):
-        """Delete the match if it's incomplete"""
-        if self.game_match:
-            return self.game_match.delete_if_incomplete()
-        return False
+    # ─────────────── actor jobs (own the match state) ───────────────
+    async def load_state(self):
+        if self.actor.state is None or self.actor.state.deleted:
+            self.actor.state = await load_match_state(self.repository, self.match_id)
+        return self.actor.state
 
-    @database_sync_to_async
-    def handle_join(self, fp):
+    async def open_round_number(self):
+        """The round both seated players owe moves for, None if there is none."""
+        round_number = self.state.current_round_number()
+        return round_number if self.state.is_round_open(round_number) else None
+
+    async def is_round_open(self, round_number):
+        return self.state.is_round_open(round_number)
+
+    async def delete_match(self, reason):
+        if self.state.deleted:
+            return False
+        self.state.deleted = True
+        self.log_event(ABORT, reason)
+        await self.repository.delete_match(self.state.game_match)
+        return True
+
+    async def delete_incomplete_match(self):
+        """Delete the match if it's incomplete"""
+        state = self.state
+        if state.game_match.is_complete or len(state.settled_rounds()) >= 25:
+            return False
+        return await self.delete_match("disconnect")
+
+    async def handle_join(self, fp):
+        return await self.actor.call(self._handle_join, fp)
+
+    async def _handle_join(self, fp):
+        if not self.state.is_player(fp):
+            await self.refresh_seats()
+        joined = await self.claim_seat(fp)
+        if joined:
+            self.log_event(JOIN, 1 if fp == self.game_match.player_1_fingerprint else 2, fp)
+        return joined
+
+    async def refresh_seats(self):
+        if self.game_match.game_mode == "online" and not self.state.deleted:
+            # the second seat is claimed over HTTP, pick it up once
+            await self.repository.refresh_match(
+                self.game_match, ["player_2_fingerprint", "player_2_ip",
+                                  "player_2_country", "player_2_city"])
+
+    async def claim_seat(self, fp):
         if self.game_match.is_complete:
             return False
 
         if not self.game_match.player_1_fingerprint:
             self.game_match.player_1_fingerprint = fp
-            self.game_match.save()
+            await self.repository.save_match(self.game_match, ["player_1_fingerprint"])
             return True
 
         if self.game_match.player_1_fingerprint == fp:
@@ -199,143 +345,72 @@ class GameConsumer(AsyncWebsocketConsumer):
                     # same fingerprint – reject
                     return False
                 self.game_match.player_2_fingerprint = fp
-                self.game_match.save()
+                await self.repository.save_match(self.game_match, ["player_2_fingerprint"])
                 return True
         else:  # bot mode
             if self.game_match.player_2_fingerprint != "bot":
                 self.game_match.player_2_fingerprint = "bot"
-                self.game_match.save()
+                await self.repository.save_match(self.game_match, ["player_2_fingerprint"])
             return True
         return False
 
     # ─────────────────────────────────────────────────────────
-    @database_sync_to_async
-    def process_action(self, fp, action) -> bool:
+    async def process_action(self, fp, action):
         """
-        Store the first valid click.
-        Returns True if stored, False otherwise.
+        Store the first valid click and settle the round once both
+        moves are in. Returns (stored, settled).
         """
-        latest = self.game_match.rounds.order_by("-round_number").first()
-        rnd_no = 1
-        if latest and latest.player_1_action and latest.player_2_action:
-            rnd_no = latest.round_number + 1
-        elif latest:
-            rnd_no = latest.round_number
-
-        if rnd_no > 25:
-            return False
-
-        rnd, _ = GameRound.objects.get_or_create(
-            match=self.game_match,
-            round_number=rnd_no,
-            defaults={"round_start_time": timezone.now().strftime('%Y-%m-%d %H:%M')},
-        )
-
-        wrote = False
-        # either player may act first – we just store their own choice
-        if fp == self.game_match.player_1_fingerprint:
-            if rnd.player_1_action is None:
-                rnd.player_1_action = action
-                wrote = True
-        elif fp == self.game_match.player_2_fingerprint:
-            if rnd.player_2_action is None:
-                rnd.player_2_action = action
-                wrote = True
-
-        rnd.save()
-        return wrote
-
-    @database_sync_to_async
-    def check_round_complete(self):
-        r = self.game_match.rounds.order_by("-round_number").first()
-        return bool(r and r.player_1_action and r.player_2_action)
-
-    @database_sync_to_async
-    def calculate_round_results(self):
-        r = self.game_match.rounds.order_by("-round_number").first()
-        p1, p2 = calculate_payoff(r.player_1_action, r.player_2_action)
-        r.player_1_score, r.player_2_score = p1, p2
-        r.round_end_time = timezone.now().strftime('%Y-%m-%d %H:%M')
-        r.save()
-        update_game_stats(self.game_match.match_id)
-        # 👇 NEW – open empty record for the coming round
-        if r.round_number < 25:
-            GameRound.objects.get_or_create(
-                match=self.game_match,
-                round_number=r.round_number + 1,
-            )
+        if self.state.deleted:
+            return False, False
+        rnd = self.state.record_action(fp, action)
+        if rnd is None:
+            return False, False
+        player = 1 if fp == self.game_match.player_1_fingerprint else 2
+        self.log_event(MOVE, rnd.round_number, player, action)
+
+        settled = self.state.is_settled(rnd)
+        if settled:
+            # payoff and running totals from the previous round, in memory
+            apply_round_stats(rnd, self.state.previous_round(rnd))
+            apply_match_stats(self.game_match, rnd)
+            await self.repository.save_settled_round(self.game_match, rnd)
+            self.log_event(ROUND_SETTLED, rnd.round_number, rnd.player_1_score, rnd.player_2_score)
+        # a lone first move stays in memory: if nobody plays on, the
+        # unfinished match is deleted anyway
+        return True, settled
 
     # ─────────────── assemble state for the client ───────────────
-    @database_sync_to_async
-    def get_game_state(self):
-        self.game_match.refresh_from_db()
-        rounds = self.game_match.rounds.order_by("round_number")
-
-        p1 = p2 = 0
-        history = []
-        for r in rounds:
-            if r.player_1_action and r.player_2_action:
-                p1 += r.player_1_score
-                p2 += r.player_2_score
-                history.append({
-                    "roundNumber": r.round_number,
-                    "player1Action": r.player_1_action,
-                    "player2Action": r.player_2_action,
-                    "player1Points": r.player_1_score,
-                    "player2Points": r.player_2_score,
-                })
-
-        next_rnd = len(history) + 1
-        if rounds and (rounds.last().player_1_action is None or
-                       rounds.last().player_2_action is None):
-            next_rnd = rounds.last().round_number
+    async def get_game_state(self):
+        return await self.actor.call(self._snapshot)
 
-        game_over = self.game_match.is_complete or next_rnd > 25
-        waiting = self.game_match.player_2_fingerprint is None \
-                    and self.game_match.game_mode == "online"
-
-        last = rounds.last()
-        return {
-            "currentRound": min(next_rnd, 25),
-            "maxRounds": 25,
-            "player1Score": p1,
-            "player2Score": p2,
-            "player1CooperationPercent": self.game_match.player_1_cooperation_percent,
-            "player2CooperationPercent": self.game_match.player_2_cooperation_percent,
-            "roundHistory": history,
-            "waitingForOpponent": waiting,
-            "gameOver": game_over,
-            "player1LastAction": last.player_1_action if last else None,
-            "player2LastAction": last.player_2_action if last else None,
-            "gameMode": self.game_match.game_mode,
-            "player1Fingerprint": self.game_match.player_1_fingerprint,
-            "player2Fingerprint": self.game_match.player_2_fingerprint,
-        }
-
-    @database_sync_to_async
-    def save_final_scores(self, gs):
-        self.game_match.player_1_final_score = gs["player1Score"]
-        self.game_match.player_2_final_score = gs["player2Score"]
-        self.game_match.is_complete = True
-        self.game_match.completed_at = timezone.now().strftime('%Y-%m-%d %H:%M')
-        self.game_match.save()
+    async def _snapshot(self):
+        return self.state.snapshot()
 
     # ────────────────────── bot helper ──────────────────────────
     async def make_bot_move(self):
+        stored, settled, bot_action = await self.actor.call(self._bot_move)
+        if stored:
+            await self.group_publish({
+                "type": "game_action",
+                "player_fingerprint": "bot",
+                "action": bot_action,
+            })
+        return settled
+
+    async def _bot_turn(self):
+        try:
+            if await self.make_bot_move():
+                await self.broadcast_round_results()
+        except Exception:
+            logger.exception("Bot move failed in match %s", self.match_id)
+
+    async def _bot_move(self):
         from .Bot import make_bot_decision
 
-        rounds = await database_sync_to_async(
-            lambda: list(self.game_match.rounds.order_by("round_number"))
-        )()
+        rounds = self.state.rounds
         player_hist = [r.player_1_action for r in rounds if r.player_1_action]
         bot_hist = [r.player_2_action for r in rounds if r.player_2_action]
 
-        bot_action = await sync_to_async(make_bot_decision)(
-            player_hist, bot_hist
-        )
-        await self.process_action("bot", bot_action)
-        await self.channel_layer.group_send(self.room_group_name, {
-            "type": "game_action",
-            "player_fingerprint": "bot",
-            "action": bot_action,
-        })
\ No newline at end of file
+        bot_action = make_bot_decision(player_hist, bot_hist)
+        stored, settled = await self.process_action("bot", bot_action)
+        return stored, settled, bot_action
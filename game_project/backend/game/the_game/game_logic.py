@@ -1,5 +1,6 @@
 from .models import GameMatch, GameRound
 from django.utils import timezone
+from game.event_log import MOVE
 
 def calculate_payoff(player_1_action, player_2_action):
     """
@@ -39,82 +40,171 @@ def format_cooperation_percentage(value):
             return int(rounded)
         return rounded
 
-def update_game_stats(match_id):
+STATS_FIELDS = [
+    'player_1_cooperation_count',
+    'player_2_cooperation_count',
+    'player_1_cooperation_percent',
+    'player_2_cooperation_percent',
+    'avg_cooperation_percent',
+    'player_1_cumulative_score',
+    'player_2_cumulative_score',
+]
+
+# GameMatch columns written with the last round, once the match is complete
+MATCH_STATS_FIELDS = [
+    'player_1_cooperation_percent',
+    'player_2_cooperation_percent',
+    'avg_cooperation_percent',
+    'is_complete',
+    'completed_at',
+    'player_1_final_score',
+    'player_2_final_score',
+]
+
+def initialize_rounds(game_matches):
     """
-    Update the game statistics after each round.
-    This calculates progressive statistics for each round individually.
+    Insert all 25 (empty) round rows of the given matches in one statement,
+    so playing a round only ever updates its row.
     """
-    try:
-        game_match = GameMatch.objects.get(match_id=match_id)
-    except GameMatch.DoesNotExist:
-        return
-    
-    rounds = game_match.rounds.all().order_by('round_number')
-    
-    if not rounds.exists():
-        return
-    
-    current_round = rounds.last()
-    if current_round.player_1_action and current_round.player_2_action and \
-       (current_round.player_1_score is None or current_round.player_2_score is None):
-        player_1_payoff, player_2_payoff = calculate_payoff(
-            current_round.player_1_action, 
-            current_round.player_2_action
+    GameRound.objects.bulk_create([
+        GameRound(match=game_match, round_number=round_number)
+        for game_match in game_matches
+        for round_number in range(1, 26)
+    ], batch_size=1000)
+
+def apply_round_stats(round_obj, previous_round=None, rounds_count=None):
+    """
+    Fill in the running statistics of a settled round.
+
+    Everything is derived from the previous settled round's stored running
+    totals, so the cost is constant no matter how far into the match we
+    are. Nothing is written to the database here.
+
+    `rounds_count` is how many rounds are settled with this one. Live
+    rounds are played in order, so it defaults to the round number; pass
+    it for rows that may have gaps (recompute_game_stats).
+    """
+    if round_obj.player_1_score is None or round_obj.player_2_score is None:
+        round_obj.player_1_score, round_obj.player_2_score = calculate_payoff(
+            round_obj.player_1_action,
+            round_obj.player_2_action
         )
-        current_round.player_1_score = player_1_payoff
-        current_round.player_2_score = player_2_payoff
-        current_round.round_end_time = timezone.now().strftime('%Y-%m-%d %H:%M')
-        current_round.save()
-    
-    # Calculate progressive statistics for each round
-    completed_rounds = rounds.filter(
-        player_1_action__isnull=False,
-        player_2_action__isnull=False
-    ).order_by('round_number')
-    
-    # Process each completed round and calculate its progressive statistics
-    for i, round_obj in enumerate(completed_rounds, 1):
-        # Get all rounds up to and including this round
-        rounds_up_to_current = completed_rounds[:i]
-        
-        # Count cooperations up to this round
-        player_1_cooperations = sum(1 for r in rounds_up_to_current if r.player_1_action == "Cooperate")
-        player_2_cooperations = sum(1 for r in rounds_up_to_current if r.player_2_action == "Cooperate")
-        
-        # Calculate cooperation percentages as decimals (0-1)
-        rounds_count = len(rounds_up_to_current)
-        player_1_cooperation_percent = player_1_cooperations / rounds_count if rounds_count > 0 else 0
-        player_2_cooperation_percent = player_2_cooperations / rounds_count if rounds_count > 0 else 0
-        avg_cooperation_percent = (player_1_cooperation_percent + player_2_cooperation_percent) / 2
-        
-        # Calculate cumulative scores up to this round
-        player_1_cumulative_score = sum(r.player_1_score for r in rounds_up_to_current if r.player_1_score is not None)
-        player_2_cumulative_score = sum(r.player_2_score for r in rounds_up_to_current if r.player_2_score is not None)
-        
-        # Format the cooperation percentages before saving
-        round_obj.player_1_cooperation_percent = format_cooperation_percentage(player_1_cooperation_percent)
-        round_obj.player_2_cooperation_percent = format_cooperation_percentage(player_2_cooperation_percent)
-        round_obj.avg_cooperation_percent = format_cooperation_percentage(avg_cooperation_percent)
-        round_obj.player_1_cumulative_score = player_1_cumulative_score
-        round_obj.player_2_cumulative_score = player_2_cumulative_score
-        round_obj.save()
-    
-    if completed_rounds.exists():
-        final_round = completed_rounds.last()
-        game_match.player_1_cooperation_percent = final_round.player_1_cooperation_percent
-        game_match.player_2_cooperation_percent = final_round.player_2_cooperation_percent
-        game_match.avg_cooperation_percent = final_round.avg_cooperation_percent
-    
+
+    if previous_round is not None:
+        p1_cooperations = previous_round.player_1_cooperation_count
+        p2_cooperations = previous_round.player_2_cooperation_count
+        p1_cumulative = previous_round.player_1_cumulative_score
+        p2_cumulative = previous_round.player_2_cumulative_score
+    else:
+        p1_cooperations = p2_cooperations = p1_cumulative = p2_cumulative = 0
+
+    if round_obj.player_1_action == "Cooperate":
+        p1_cooperations += 1
+    if round_obj.player_2_action == "Cooperate":
+        p2_cooperations += 1
+
+    if rounds_count is None:
+        rounds_count = round_obj.round_number
+    player_1_cooperation_percent = p1_cooperations / rounds_count
+    player_2_cooperation_percent = p2_cooperations / rounds_count
+    avg_cooperation_percent = (player_1_cooperation_percent + player_2_cooperation_percent) / 2
+
+    round_obj.player_1_cooperation_count = p1_cooperations
+    round_obj.player_2_cooperation_count = p2_cooperations
+    round_obj.player_1_cooperation_percent = format_cooperation_percentage(player_1_cooperation_percent)
+    round_obj.player_2_cooperation_percent = format_cooperation_percentage(player_2_cooperation_percent)
+    round_obj.avg_cooperation_percent = format_cooperation_percentage(avg_cooperation_percent)
+    round_obj.player_1_cumulative_score = p1_cumulative + round_obj.player_1_score
+    round_obj.player_2_cumulative_score = p2_cumulative + round_obj.player_2_score
+    return round_obj
+
+def apply_match_stats(game_match, last_round):
+    """Copy the running totals of the latest settled round onto the match."""
+    game_match.player_1_cooperation_percent = last_round.player_1_cooperation_percent
+    game_match.player_2_cooperation_percent = last_round.player_2_cooperation_percent
+    game_match.avg_cooperation_percent = last_round.avg_cooperation_percent
+
     # Check for game completion after 25 rounds
-    if completed_rounds.count() >= 25:
+    if last_round.round_number >= 25:
         game_match.is_complete = True
         game_match.completed_at = timezone.now().strftime('%Y-%m-%d %H:%M')
-        
-        # Calculate final scores from all rounds
-        game_match.player_1_final_score = sum(r.player_1_score for r in completed_rounds if r.player_1_score is not None)
-        game_match.player_2_final_score = sum(r.player_2_score for r in completed_rounds if r.player_2_score is not None)
-    
+        game_match.player_1_final_score = last_round.player_1_cumulative_score
+        game_match.player_2_final_score = last_round.player_2_cumulative_score
+
+def finish_round(current_round):
+    """Stamp the end time of a settled round (in memory), unless it has one."""
+    if not current_round.round_end_time:
+        current_round.round_end_time = timezone.now().strftime('%Y-%m-%d %H:%M')
+
+def save_game_stats(game_match, current_round):
+    """
+    Persist a settled round, and the match totals once the match is over.
+
+    Live totals are served from the match state in memory and an
+    unfinished match is deleted when its players leave, so the match row
+    is only written with the final round.
+    """
+    finish_round(current_round)
+    # a full save, so both moves are written in the same statement
+    current_round.save()
+    if game_match.is_complete:
+        game_match.save(update_fields=MATCH_STATS_FIELDS)
+
+def recompute_game_stats(game_match):
+    """
+    Rebuild the running statistics of every settled round of a match.
+
+    Used for backfills: one read for the rounds, one bulk UPDATE for all of
+    them and one UPDATE for the match.
+    """
+    completed_rounds = list(game_match.rounds.filter(
+        player_1_action__isnull=False,
+        player_2_action__isnull=False
+    ).order_by('round_number'))
+
+    if not completed_rounds:
+        return 0
+
+    # historical matches may miss rows, so count the rounds instead of
+    # trusting the round numbers
+    previous_round = None
+    for rounds_count, round_obj in enumerate(completed_rounds, 1):
+        apply_round_stats(round_obj, previous_round, rounds_count)
+        previous_round = round_obj
+
+    GameRound.objects.bulk_update(
+        completed_rounds,
+        STATS_FIELDS + ['player_1_score', 'player_2_score'],
+        batch_size=500,
+    )
+
+    completed_at = game_match.completed_at
+    apply_match_stats(game_match, previous_round)
+    if completed_at:
+        # keep the original completion time of historical matches
+        game_match.completed_at = completed_at
     game_match.save()
+    return len(completed_rounds)
+
+def rounds_from_events(events):
+    """
+    The rounds of a match rebuilt from its event log (GameMatchEvent.history),
+    with the statistics of every settled round. Nothing is saved.
+    """
+    rounds = {}
+    for event in events:
+        if event.kind == MOVE:
+            values = event.values
+            round_obj = rounds.setdefault(values['round'], GameRound(round_number=values['round']))
+            setattr(round_obj, f"player_{values['player']}_action", values['action'])
+
+    previous_round = None
+    for round_number in sorted(rounds):
+        round_obj = rounds[round_number]
+        if round_obj.player_1_action and round_obj.player_2_action:
+            apply_round_stats(round_obj, previous_round)
+            previous_round = round_obj
+    return [rounds[round_number] for round_number in sorted(rounds)]
 
 def cleanup_incomplete_matches():
     """
@@ -0,0 +1,120 @@
+import asyncio
+import random
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from django.core.management.base import BaseCommand
+
+from game.db_executor import ASYNC_ORM_AVAILABLE, DBExecutor
+from the_game.game_logic import apply_round_stats, apply_match_stats, initialize_rounds
+from the_game.match_state import MatchState
+from the_game.models import GameMatch, GameRound
+from the_game.repository import AsyncMatchRepository, SyncMatchRepository
+
+BENCH_PREFIX = 'bench-'
+
+
+class ThreadSensitiveExecutor:
+    """channels' database_sync_to_async behind the DBExecutor.run interface."""
+
+    async def run(self, func, *args, **kwargs):
+        return await database_sync_to_async(func)(*args, **kwargs)
+
+
+class Command(BaseCommand):
+    help = ("Measure Prisoner's Dilemma moves per second through the consumers' "
+            "DB write path: the sync repository on a thread-sensitive or pooled "
+            "executor of several sizes, and the async ORM repository")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--matches', type=int, default=100,
+                            help='Concurrent matches (default 100)')
+        parser.add_argument('--rounds', type=int, default=25,
+                            help='Rounds played per match (default 25)')
+        parser.add_argument('--pool-sizes', default='1,2,4,8,16',
+                            help='Comma separated pool sizes to try (default 1,2,4,8,16)')
+        parser.add_argument('--repositories', default='sync,async',
+                            help='Comma separated repository backends to try (default sync,async)')
+
+    def handle(self, *args, **options):
+        matches, rounds = options['matches'], options['rounds']
+        pool_sizes = [int(size) for size in options['pool_sizes'].split(',') if size]
+        backends = [name for name in options['repositories'].split(',') if name]
+
+        self.stdout.write(f"{matches} concurrent matches x {rounds} rounds x 2 moves")
+        self.stdout.write(f"{'repository':<28}{'moves/s':>10}{'seconds':>10}{'max queue':>12}")
+
+        try:
+            if 'sync' in backends:
+                repository = SyncMatchRepository(ThreadSensitiveExecutor())
+                elapsed = self.run_round(repository, matches, rounds)
+                self.report('sync thread_sensitive', matches, rounds, elapsed, '-')
+
+                for size in pool_sizes:
+                    executor = DBExecutor(size)
+                    try:
+                        elapsed = self.run_round(SyncMatchRepository(executor), matches, rounds)
+                    finally:
+                        executor.shutdown()
+                    self.report(f'sync pool({size})', matches, rounds, elapsed,
+                                executor.stats()['max_queue_depth'])
+
+            if 'async' in backends:
+                if ASYNC_ORM_AVAILABLE:
+                    elapsed = self.run_round(AsyncMatchRepository(), matches, rounds)
+                    self.report('async orm', matches, rounds, elapsed, '-')
+                else:
+                    self.stdout.write(f"{'async orm':<28}skipped, needs Django 5.0+")
+        finally:
+            GameMatch.objects.filter(match_id__startswith=BENCH_PREFIX).delete()
+
+    def report(self, label, matches, rounds, elapsed, max_queue):
+        moves = matches * rounds * 2
+        self.stdout.write(f"{label:<28}{moves / elapsed:>10.0f}{elapsed:>10.2f}{max_queue:>12}")
+
+    def run_round(self, repository, matches, rounds):
+        game_matches = GameMatch.objects.bulk_create([
+            GameMatch(
+                match_id=f"{BENCH_PREFIX}{uuid.uuid4().hex[:12]}",
+                game_mode='bot',
+                player_1_fingerprint='bench-player',
+                player_2_fingerprint='bot',
+                player_1_ip='127.0.0.1',
+                player_1_country='Unknown',
+                player_1_city='Unknown',
+            )
+            for _ in range(matches)
+        ])
+        # bulk_create only returns primary keys on Postgres
+        game_matches = list(GameMatch.objects.filter(
+            match_id__in=[m.match_id for m in game_matches]
+        ))
+        initialize_rounds(game_matches)
+        rounds_by_match = {m.pk: [] for m in game_matches}
+        for rnd in GameRound.objects.filter(match__in=game_matches).order_by('round_number'):
+            rounds_by_match[rnd.match_id].append(rnd)
+        states = [MatchState(m, rounds_by_match[m.pk]) for m in game_matches]
+
+        started = time.monotonic()
+        asyncio.run(self.play_all(repository, states, rounds))
+        elapsed = time.monotonic() - started
+
+        GameMatch.objects.filter(match_id__startswith=BENCH_PREFIX).delete()
+        return elapsed
+
+    async def play_all(self, repository, states, rounds):
+        await asyncio.gather(*(
+            self.play_match(repository, state, rounds) for state in states
+        ))
+
+    async def play_match(self, repository, state, rounds):
+        """The writes of GameConsumer.process_action, one move after the other."""
+        game_match = state.game_match
+        for _ in range(rounds):
+            for fp in ('bench-player', 'bot'):
+                rnd = state.record_action(fp, random.choice(['Cooperate', 'Defect']))
+                if state.is_settled(rnd):
+                    apply_round_stats(rnd, state.previous_round(rnd))
+                    apply_match_stats(game_match, rnd)
+                    await repository.save_settled_round(game_match, rnd)
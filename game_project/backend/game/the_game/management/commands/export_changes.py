@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game.change_export import export_changes
+from game.exports import EXPORTS
+
+
+class Command(BaseCommand):
+    help = ("Write the rounds of the matches completed since the last run as CSV "
+            "files in CHANGE_EXPORT_DIR/<game>/ (see game/change_export.py)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('games', nargs='*',
+                            help='prisoners and/or ultimatum (default: both)')
+        parser.add_argument('--directory', help='Instead of CHANGE_EXPORT_DIR')
+
+    def handle(self, *args, **options):
+        games = options['games'] or sorted(EXPORTS)
+        for game in games:
+            if game not in EXPORTS:
+                raise CommandError(f"Unknown game {game!r}, choose from {', '.join(sorted(EXPORTS))}")
+        for game in games:
+            totals = export_changes(game, options['directory'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{game}: {totals['matches']} matches, {totals['rows']} rounds "
+                f"in {totals['files']} files"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game import parquet_export
+from game.exports import EXPORTS
+
+
+class Command(BaseCommand):
+    help = ("Append the rounds of the matches completed since the last run to a "
+            "Parquet dataset in <directory>/<game>/ (see game/parquet_export.py)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('game', choices=sorted(EXPORTS))
+        parser.add_argument('directory')
+
+    def handle(self, *args, **options):
+        if parquet_export.pa is None:
+            raise CommandError("pyarrow is not installed")
+
+        export = parquet_export.ParquetExport(EXPORTS[options['game']], options['directory'])
+        rows, files = export.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {rows} rounds in {files} files to {export.directory}"))
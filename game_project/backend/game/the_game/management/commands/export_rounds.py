@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game.exports import EXPORTS, parse_filters
+
+
+class Command(BaseCommand):
+    help = ("Write the settled rounds of a game as CSV to stdout, in the columns "
+            "of the research export (see game/exports.py)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('game', choices=sorted(EXPORTS))
+        parser.add_argument('--since', help='First day of round starts, YYYY-MM-DD')
+        parser.add_argument('--until', help='Last day of round starts, YYYY-MM-DD')
+        parser.add_argument('--mode', help='online or bot')
+        parser.add_argument('--complete', help='true or false')
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters({name: options[name]
+                                     for name in ('since', 'until', 'mode', 'complete')})
+        except ValueError as e:
+            raise CommandError(f"Invalid filter: {e}")
+
+        for chunk in EXPORTS[options['game']].stream(**filters):
+            self.stdout.write(chunk, ending='')
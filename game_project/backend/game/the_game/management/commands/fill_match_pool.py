@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.match_pool import get_match_pool
+
+
+class Command(BaseCommand):
+    help = ("Top up the warm pool of pre-provisioned matches of both games "
+            "(MATCH_POOL_SIZE per game and mode)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep replenishing every MATCH_POOL_INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        pool = get_match_pool()
+        if pool is None:
+            raise CommandError("MATCH_POOL_SIZE is 0, the match pool is disabled")
+
+        while True:
+            created = pool.replenish()
+            self.stdout.write(f"Provisioned {created} matches, pool sizes: "
+                              f"{pool.stats()['pools']}")
+            if not options['loop']:
+                break
+            time.sleep(pool.interval)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game.hot_state import get_hot_state
+
+
+class Command(BaseCommand):
+    help = ("Write the settled rounds still held in the Redis hot state to the "
+            "database, e.g. after a worker crashed or before stopping Redis")
+
+    def handle(self, *args, **options):
+        hot_state = get_hot_state()
+        if hot_state is None:
+            raise CommandError("HOT_STATE_BACKEND is not \"redis\", nothing to flush")
+
+        flushed = hot_state.flush_all()
+        stats = hot_state.stats()
+        self.stdout.write(f"Flushed {flushed} matches ({stats.get('flushed_rounds', 0)} rounds), "
+                          f"{stats['dirty_matches']} still dirty")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from the_game.game_logic import recompute_game_stats
+from the_game.models import GameMatch
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-round running statistics of Prisoner's Dilemma matches (backfill)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('match_ids', nargs='*', help='Only recompute these match ids')
+        parser.add_argument('--complete-only', action='store_true',
+                            help='Skip matches that are still in progress')
+
+    def handle(self, *args, **options):
+        matches = GameMatch.objects.all().order_by('id')
+        if options['match_ids']:
+            matches = matches.filter(match_id__in=options['match_ids'])
+        if options['complete_only']:
+            matches = matches.filter(is_complete=True)
+
+        match_count = round_count = 0
+        for game_match in matches.iterator(chunk_size=500):
+            round_count += recompute_game_stats(game_match)
+            match_count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {round_count} rounds across {match_count} matches"
+        ))
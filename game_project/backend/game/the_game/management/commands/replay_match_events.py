@@ -0,0 +1,76 @@
+import math
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from game.event_log import ABORT
+from the_game import game_logic as prisoners_logic
+from ultimatum import game_logic as ultimatum_logic
+
+# game -> (event model, round model, match id field of the match, rebuild)
+GAMES = {
+    'prisoners': ('the_game.GameMatchEvent', 'the_game.GameRound', 'match_id',
+                  prisoners_logic.rounds_from_events),
+    'ultimatum': ('ultimatum.UltimatumMatchEvent', 'ultimatum.UltimatumGameRound',
+                  'game_match_uuid', ultimatum_logic.rounds_from_events),
+}
+
+# stamped with the wall clock, not derived from the moves
+CLOCK_FIELDS = {'round_start_time', 'round_end_time', 'round_start', 'round_end'}
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the rounds of matches from their event log and compare "
+            "them with the stored round rows")
+
+    def add_arguments(self, parser):
+        parser.add_argument('game', choices=sorted(GAMES))
+        parser.add_argument('match_ids', nargs='+')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Print at most this many mismatches (default 20)')
+
+    def handle(self, *args, **options):
+        event_label, round_label, id_field, rebuild = GAMES[options['game']]
+        event_model = apps.get_model(event_label)
+        round_model = apps.get_model(round_label)
+        match_model = round_model._meta.get_field('match').related_model
+        fields = [f.name for f in round_model._meta.concrete_fields
+                  if not f.primary_key and not f.is_relation and f.name not in CLOCK_FIELDS]
+
+        mismatches = []
+        for match_id in options['match_ids']:
+            # the live match with the id, else the latest one that had it
+            match_pk = match_model.all_objects.filter(**{id_field: match_id}).values_list(
+                'pk', flat=True).first()
+            events = event_model.history(match_id, match_pk)
+            rebuilt = rebuild(events)
+            stored = {r.round_number: r for r in round_model.objects.filter(match=match_pk)}
+            for event in events:
+                if event.kind == ABORT:
+                    self.stdout.write(f"{match_id}: aborted ({event.values['reason']})")
+            self.stdout.write(f"{match_id}: {len(events)} events, {len(rebuilt)} rounds rebuilt, "
+                              f"{len(stored)} round rows stored")
+
+            for round_obj in rebuilt:
+                row = stored.get(round_obj.round_number)
+                if row is None:
+                    continue            # the match was deleted, or never had the row
+                if not (getattr(row, 'round_end_time', None) or getattr(row, 'round_end', None)):
+                    continue            # moves of an open round are only written once it settles
+                for field in fields:
+                    replayed, kept = getattr(round_obj, field), getattr(row, field)
+                    if isinstance(kept, float) and isinstance(replayed, (int, float)):
+                        if math.isclose(kept, replayed, abs_tol=1e-9):
+                            continue
+                    elif kept == replayed:
+                        continue
+                    mismatches.append(f"{match_id} round {round_obj.round_number}: "
+                                      f"stored {field}={kept} replayed={replayed}")
+
+        for problem in mismatches[:options['show']]:
+            self.stdout.write(problem)
+        if len(mismatches) > options['show']:
+            self.stdout.write(f"... and {len(mismatches) - options['show']} more")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} mismatches")
+        self.stdout.write(self.style.SUCCESS("Rebuilt rounds match the stored rows"))
@@ -0,0 +1,146 @@
+import logging
+from django.utils import timezone
+from .models import GameRound
+
+logger = logging.getLogger(__name__)
+
+MAX_ROUNDS = 25
+
+
+class MatchState:
+    """
+    Authoritative in-memory view of a live Prisoner's Dilemma match.
+
+    Loaded from Postgres once by the match actor and only touched from its
+    jobs, so answering a Cooperate/Defect click never needs a read query.
+    The model instances held here are the ones that get saved, Postgres
+    only sees the writes: one UPDATE per round, when it settles (the
+    rows are pre-allocated by game_logic.initialize_rounds).
+    """
+
+    def __init__(self, game_match, rounds):
+        self.game_match = game_match
+        self.rounds = rounds                # GameRound objects by round_number
+        self.deleted = False
+
+    # ───────────────────────── lookups ──────────────────────────
+    @property
+    def match_id(self):
+        return self.game_match.match_id
+
+    @property
+    def match_pk(self):
+        return self.game_match.pk
+
+    def round(self, round_number):
+        """The row of a round, None if it was never created."""
+        if 0 < round_number <= len(self.rounds) and \
+                self.rounds[round_number - 1].round_number == round_number:
+            return self.rounds[round_number - 1]
+        return next((r for r in self.rounds if r.round_number == round_number), None)
+
+    def settled_rounds(self):
+        return [r for r in self.rounds if r.player_1_action and r.player_2_action]
+
+    def is_settled(self, round_obj):
+        return bool(round_obj and round_obj.player_1_action and round_obj.player_2_action)
+
+    def previous_round(self, round_obj):
+        index = self.rounds.index(round_obj)
+        return self.rounds[index - 1] if index > 0 else None
+
+    def current_round_number(self):
+        # rounds are played in order, the open one follows the settled ones
+        return len(self.settled_rounds()) + 1
+
+    def is_game_over(self):
+        return self.game_match.is_complete or self.current_round_number() > MAX_ROUNDS
+
+    def is_round_open(self, round_number):
+        """Both players are seated and round `round_number` is still open."""
+        return (not self.deleted and not self.is_game_over()
+                and self.game_match.player_2_fingerprint is not None
+                and self.current_round_number() == round_number)
+
+    def is_player(self, fp):
+        return fp in (self.game_match.player_1_fingerprint,
+                      self.game_match.player_2_fingerprint)
+
+    # ──────────────────────── mutations ─────────────────────────
+    def record_action(self, fp, action):
+        """
+        Store the first valid click of a player for the open round.
+        Returns the touched round, or None if nothing changed.
+        """
+        rnd_no = self.current_round_number()
+        if rnd_no > MAX_ROUNDS:
+            return None
+
+        rnd = self.round(rnd_no)
+        if rnd is None:
+            # matches created before their rounds were pre-allocated
+            rnd = GameRound(match=self.game_match, round_number=rnd_no)
+            self.rounds.append(rnd)
+        if not rnd.round_start_time:
+            rnd.round_start_time = timezone.now().strftime('%Y-%m-%d %H:%M')
+
+        # either player may act first – we just store their own choice
+        if fp == self.game_match.player_1_fingerprint:
+            if rnd.player_1_action is None:
+                rnd.player_1_action = action
+                return rnd
+        elif fp == self.game_match.player_2_fingerprint:
+            if rnd.player_2_action is None:
+                rnd.player_2_action = action
+                return rnd
+        return None
+
+    # ─────────────── assemble state for the client ───────────────
+    def snapshot(self):
+        p1 = p2 = 0
+        history = []
+        for r in self.settled_rounds():
+            p1 += r.player_1_score or 0
+            p2 += r.player_2_score or 0
+            history.append({
+                "roundNumber": r.round_number,
+                "player1Action": r.player_1_action,
+                "player2Action": r.player_2_action,
+                "player1Points": r.player_1_score,
+                "player2Points": r.player_2_score,
+            })
+
+        next_rnd = self.current_round_number()
+        game_over = self.is_game_over()
+        waiting = self.game_match.player_2_fingerprint is None \
+                    and self.game_match.game_mode == "online"
+
+        # the clicks of the open round, or of the final round once it is over
+        last = self.round(min(next_rnd, MAX_ROUNDS))
+
+        return {
+            "currentRound": min(next_rnd, MAX_ROUNDS),
+            "maxRounds": MAX_ROUNDS,
+            "player1Score": p1,
+            "player2Score": p2,
+            "player1CooperationPercent": self.game_match.player_1_cooperation_percent,
+            "player2CooperationPercent": self.game_match.player_2_cooperation_percent,
+            "roundHistory": history,
+            "waitingForOpponent": waiting,
+            "gameOver": game_over,
+            "player1LastAction": last.player_1_action if last else None,
+            "player2LastAction": last.player_2_action if last else None,
+            "gameMode": self.game_match.game_mode,
+            "player1Fingerprint": self.game_match.player_1_fingerprint,
+            "player2Fingerprint": self.game_match.player_2_fingerprint,
+        }
+
+
+async def load_match_state(repository, match_id):
+    """Read a match and its rounds once; None if the match does not exist."""
+    game_match, rounds = await repository.load_match(match_id)
+    if game_match is None:
+        return None
+    for r in rounds:
+        r.match = game_match        # share one match instance, no lazy FK reads
+    return MatchState(game_match, rounds)
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:03
+
+from django.db import migrations, models
+
+
+def backfill_cooperation_counts(apps, schema_editor):
+    GameRound = apps.get_model('the_game', 'GameRound')
+    match_ids = GameRound.objects.values_list('match_id', flat=True).distinct()
+
+    for match_id in match_ids.iterator():
+        rounds = list(GameRound.objects.filter(
+            match_id=match_id,
+            player_1_action__isnull=False,
+            player_2_action__isnull=False
+        ).order_by('round_number'))
+
+        p1_cooperations = p2_cooperations = 0
+        for round_obj in rounds:
+            if round_obj.player_1_action == 'Cooperate':
+                p1_cooperations += 1
+            if round_obj.player_2_action == 'Cooperate':
+                p2_cooperations += 1
+            round_obj.player_1_cooperation_count = p1_cooperations
+            round_obj.player_2_cooperation_count = p2_cooperations
+
+        GameRound.objects.bulk_update(
+            rounds,
+            ['player_1_cooperation_count', 'player_2_cooperation_count'],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('the_game', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gameround',
+            name='player_1_cooperation_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='gameround',
+            name='player_2_cooperation_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_cooperation_counts, migrations.RunPython.noop),
+    ]
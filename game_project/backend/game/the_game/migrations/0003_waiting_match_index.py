@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('the_game', '0002_gameround_cooperation_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gamematch',
+            index=models.Index(condition=models.Q(('is_complete', False), ('player_2_fingerprint__isnull', True)), fields=['game_mode', 'id'], name='gamematch_waiting_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('the_game', '0003_waiting_match_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='gamematch',
+            name='gamematch_waiting_idx',
+        ),
+        migrations.AddField(
+            model_name='gamematch',
+            name='is_pooled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='gamematch',
+            index=models.Index(condition=models.Q(('is_complete', False), ('is_pooled', False), ('player_2_fingerprint__isnull', True)), fields=['game_mode', 'id'], name='gamematch_waiting_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gamematch',
+            index=models.Index(condition=models.Q(('is_pooled', True)), fields=['game_mode', 'id'], name='gamematch_pooled_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('the_game', '0004_match_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameMatchEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('match_id', models.CharField(max_length=255)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Join'), (2, 'Move'), (3, 'Response'), (4, 'Round settled'), (5, 'Abort')])),
+                ('at', models.FloatField()),
+                ('data', models.BinaryField()),
+            ],
+            options={
+                'ordering': ['id'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='gamematchevent',
+            index=models.Index(fields=['match_id', 'id'], name='the_game_ga_match_i_5fb5ea_idx'),
+        ),
+    ]
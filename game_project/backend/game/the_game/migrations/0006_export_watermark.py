@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('the_game', '0005_match_event_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('completed_at', models.CharField(blank=True, max_length=50, null=True)),
+                ('last_match_id', models.BigIntegerField(default=0)),
+                ('last_row_id', models.BigIntegerField(default=0)),
+                ('exported_matches', models.IntegerField(default=0)),
+                ('exported_rows', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='gamematch',
+            index=models.Index(condition=models.Q(('is_complete', True)), fields=['completed_at', 'id'], name='gamematch_completed_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('the_game', '0006_export_watermark'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='gamematchevent',
+            name='the_game_ga_match_i_5fb5ea_idx',
+        ),
+        migrations.AddField(
+            model_name='gamematchevent',
+            name='match_pk',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='gamematchevent',
+            index=models.Index(fields=['match_id', 'match_pk', 'id'], name='the_game_ga_match_i_d20dae_idx'),
+        ),
+    ]
@@ -1,5 +1,14 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
+from game.event_log import ABORT, JOIN, MOVE, ROUND_SETTLED, MatchEvent
+import uuid
+
+class PlayableMatchManager(models.Manager):
+    """Hides the pre-provisioned matches still sitting in the warm pool"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_pooled=False)
+
 
 class GameMatch(models.Model):
     GAME_MODES = [
@@ -23,6 +32,117 @@ class GameMatch(models.Model):
     player_2_final_score = models.IntegerField(default=0)
     is_complete = models.BooleanField(default=False)
     completed_at = models.CharField(max_length=50, blank=True, null=True)
+    is_pooled = models.BooleanField(default=False)  # created ahead, no player yet
+
+    objects = PlayableMatchManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # only online matches still waiting for their second player
+            models.Index(
+                fields=['game_mode', 'id'],
+                name='gamematch_waiting_idx',
+                condition=models.Q(player_2_fingerprint__isnull=True, is_complete=False,
+                                   is_pooled=False),
+            ),
+            models.Index(
+                fields=['game_mode', 'id'],
+                name='gamematch_pooled_idx',
+                condition=models.Q(is_pooled=True),
+            ),
+            # incremental exports walk completed matches in completion order
+            models.Index(
+                fields=['completed_at', 'id'],
+                name='gamematch_completed_idx',
+                condition=models.Q(is_complete=True),
+            ),
+        ]
+
+    @classmethod
+    def provision_pool(cls, game_mode, count):
+        """Insert `count` unassigned matches, and their rounds, into the warm pool"""
+        from .game_logic import initialize_rounds
+
+        with transaction.atomic():
+            pooled = cls.all_objects.bulk_create([
+                cls(
+                    match_id=str(uuid.uuid4())[:8],
+                    game_mode=game_mode,
+                    player_1_fingerprint='',
+                    player_1_ip='0.0.0.0',
+                    player_1_country='Unknown',
+                    player_1_city='Unknown',
+                    player_2_fingerprint='bot' if game_mode == 'bot' else None,
+                    is_pooled=True,
+                )
+                for _ in range(count)
+            ])
+            if pooled and pooled[0].pk is None:
+                # bulk_create only returns primary keys on Postgres
+                pooled = cls.all_objects.filter(match_id__in=[m.match_id for m in pooled])
+            initialize_rounds(pooled)
+
+    @classmethod
+    def pool_size(cls, game_mode):
+        return cls.all_objects.filter(is_pooled=True, game_mode=game_mode).count()
+
+    @classmethod
+    def claim_from_pool(cls, game_mode, player_fingerprint, ip_address):
+        """
+        Hand a pooled match to its first player, or None if the pool is empty.
+        SKIP LOCKED lets concurrent requests each take a different one.
+        """
+        with transaction.atomic():
+            game_match = (cls.all_objects
+                          .filter(is_pooled=True, game_mode=game_mode)
+                          .order_by('id')
+                          .select_for_update(skip_locked=True)
+                          .first())
+            if game_match is None:
+                return None
+            game_match.is_pooled = False
+            game_match.player_1_fingerprint = player_fingerprint
+            game_match.player_1_ip = ip_address
+            game_match.save(update_fields=['is_pooled', 'player_1_fingerprint', 'player_1_ip'])
+        return game_match
+
+    @classmethod
+    def waiting_matches(cls):
+        """Online matches with a free second seat, oldest first"""
+        return cls.objects.filter(
+            game_mode='online',
+            player_2_fingerprint__isnull=True,
+            is_complete=False,
+        ).order_by('id')
+
+    @classmethod
+    def claim_waiting_match(cls, player_fingerprint, ip_address, match_id=None):
+        """
+        Seat a player in the oldest waiting match, or return None.
+
+        Rows another request is claiming right now are skipped instead of
+        waited on (FOR UPDATE SKIP LOCKED), so concurrent joiners never get
+        the same seat and never queue up behind each other. With match_id,
+        only that match is claimed (the lobby already picked it).
+        """
+        waiting = cls.waiting_matches()
+        if match_id is not None:
+            waiting = waiting.filter(match_id=match_id)
+        with transaction.atomic():
+            game_match = (waiting
+                          .select_for_update(skip_locked=True)
+                          .exclude(player_1_fingerprint=player_fingerprint)
+                          .first())
+            if game_match is None:
+                return None
+            game_match.player_2_fingerprint = player_fingerprint
+            game_match.player_2_ip = ip_address
+            game_match.player_2_country = 'Unknown'
+            game_match.player_2_city = 'Unknown'
+            game_match.save(update_fields=['player_2_fingerprint', 'player_2_ip',
+                                           'player_2_country', 'player_2_city'])
+        return game_match
 
     def get_completed_rounds_count(self):
         """Get the number of completed rounds for this match"""
@@ -58,6 +178,8 @@ class GameRound(models.Model):
     player_1_score = models.IntegerField(null=True, blank=True)
     player_2_score = models.IntegerField(null=True, blank=True)
     
+    player_1_cooperation_count = models.IntegerField(default=0)  # Running total
+    player_2_cooperation_count = models.IntegerField(default=0)  # Running total
     player_1_cooperation_percent = models.FloatField(default=0)  
     player_2_cooperation_percent = models.FloatField(default=0)  
     avg_cooperation_percent = models.FloatField(default=0)       
@@ -73,4 +195,30 @@ class GameRound(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"Round {self.round_number} of Match {self.match.match_id}"
\ No newline at end of file
+        return f"Round {self.round_number} of Match {self.match.match_id}"
+
+
+class GameMatchEvent(MatchEvent):
+    """Event log of a Prisoner's Dilemma match (see game/event_log.py)"""
+
+    EVENT_FIELDS = {
+        JOIN: ('player', 'fingerprint'),
+        MOVE: ('round', 'player', 'action'),
+        ROUND_SETTLED: ('round', 'player_1_score', 'player_2_score'),
+        ABORT: ('reason',),
+    }
+
+
+class ExportWatermark(models.Model):
+    """How far an incremental export has got (see game/change_export.py)"""
+    name = models.CharField(max_length=50, unique=True)
+    # the last exported match: its completion minute and primary key
+    completed_at = models.CharField(max_length=50, blank=True, null=True)
+    last_match_id = models.BigIntegerField(default=0)
+    last_row_id = models.BigIntegerField(default=0)     # highest round primary key exported
+    exported_matches = models.IntegerField(default=0)
+    exported_rows = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} through {self.completed_at} (match {self.last_match_id})"
@@ -0,0 +1,131 @@
+"""
+Database access of the Prisoner's Dilemma consumer.
+
+The consumer only talks to a repository, so the same jobs run on top of
+either implementation:
+
+* SyncMatchRepository  – plain ORM calls hopped onto the DB executor
+                         (db_sync_to_async, see game.db_executor).
+* AsyncMatchRepository – the native async ORM (aget/asave/adelete/...).
+
+get_match_repository() returns the one picked by GAME_REPOSITORY_BACKEND,
+wrapped in HotStateMatchRepository when live rounds are kept in Redis
+(HOT_STATE_BACKEND, see game.hot_state).
+"""
+from game.db_executor import db_sync_to_async, repository_backend
+from game.hot_state import get_hot_state
+from .game_logic import finish_round, save_game_stats
+from .models import GameMatch
+
+
+def _load_match(match_id):
+    try:
+        game_match = GameMatch.objects.get(match_id=match_id)
+    except GameMatch.DoesNotExist:
+        return None, []
+    return game_match, list(game_match.rounds.order_by("round_number"))
+
+
+class SyncMatchRepository:
+    """Every method is one hop onto the executor running the sync ORM."""
+
+    backend = "sync"
+
+    def __init__(self, executor=None):
+        # an explicit DBExecutor wins over DB_EXECUTOR_MODE (used by benchmarks)
+        self.executor = executor
+
+    async def _run(self, func, *args, **kwargs):
+        if self.executor is not None:
+            return await self.executor.run(func, *args, **kwargs)
+        return await db_sync_to_async(func)(*args, **kwargs)
+
+    async def load_match(self, match_id):
+        """(game_match, rounds by round_number); (None, []) if it does not exist."""
+        return await self._run(_load_match, match_id)
+
+    async def refresh_match(self, game_match, fields):
+        await self._run(game_match.refresh_from_db, fields=fields)
+
+    async def save_match(self, game_match, fields):
+        await self._run(game_match.save, update_fields=fields)
+
+    async def save_settled_round(self, game_match, round_obj):
+        await self._run(save_game_stats, game_match, round_obj)
+
+    async def delete_match(self, game_match):
+        await self._run(game_match.delete)
+
+
+class AsyncMatchRepository:
+    """The same operations through the async ORM API."""
+
+    backend = "async"
+
+    async def load_match(self, match_id):
+        try:
+            game_match = await GameMatch.objects.aget(match_id=match_id)
+        except GameMatch.DoesNotExist:
+            return None, []
+        rounds = [r async for r in game_match.rounds.order_by("round_number")]
+        return game_match, rounds
+
+    async def refresh_match(self, game_match, fields):
+        await game_match.arefresh_from_db(fields=fields)
+
+    async def save_match(self, game_match, fields):
+        await game_match.asave(update_fields=fields)
+
+    async def save_settled_round(self, game_match, round_obj):
+        # the writes of game_logic.save_game_stats, as a single hop onto the DB executor
+        await db_sync_to_async(save_game_stats)(game_match, round_obj)
+
+    async def delete_match(self, game_match):
+        await game_match.adelete()
+
+
+class HotStateMatchRepository:
+    """
+    Settled rounds of a live match go to the Redis hot state and reach the
+    database with its flusher. The final round (with the match totals) and
+    everything else go through `repository`.
+    """
+
+    game = "prisoners"
+
+    def __init__(self, repository, hot_state):
+        self.repository = repository
+        self.hot_state = hot_state
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    async def load_match(self, match_id):
+        game_match, rounds = await self.repository.load_match(match_id)
+        if game_match is not None:
+            # rounds of a worker that died before they were flushed
+            await self.hot_state.overlay(self.game, match_id, rounds)
+        return game_match, rounds
+
+    async def save_settled_round(self, game_match, round_obj):
+        if round_obj.pk is None or game_match.is_complete:
+            await self.hot_state.flush_match(self.game, game_match.match_id)
+            await self.repository.save_settled_round(game_match, round_obj)
+            return
+        finish_round(round_obj)
+        await self.hot_state.write_round(self.game, game_match.match_id, round_obj)
+
+    async def delete_match(self, game_match):
+        await self.hot_state.discard(self.game, game_match.match_id)
+        await self.repository.delete_match(game_match)
+
+
+def get_match_repository():
+    if repository_backend() == "async":
+        repository = AsyncMatchRepository()
+    else:
+        repository = SyncMatchRepository()
+    hot_state = get_hot_state()
+    if hot_state is not None:
+        return HotStateMatchRepository(repository, hot_state)
+    return repository
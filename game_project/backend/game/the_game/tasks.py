@@ -0,0 +1,18 @@
+from celery import shared_task
+
+from game.change_export import export_changes
+from game.exports import EXPORTS
+from game.match_pool import get_match_pool
+
+
+@shared_task
+def export_completed_matches():
+    """The incremental CSV export of both games, scheduled by Celery beat"""
+    return {game: export_changes(game) for game in sorted(EXPORTS)}
+
+
+@shared_task
+def refill_match_pool():
+    """Top up the warm match pool of both games, scheduled by Celery beat"""
+    pool = get_match_pool()
+    return pool.replenish() if pool is not None else 0
@@ -1,3 +1,318 @@
-from django.test import TestCase
+import threading
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from game import event_log, match_pool
+from game.event_log import MOVE, ROUND_SETTLED, EventLog, EventLogMixin
+from game.hot_state import DIRTY_KEY, HotStateStore
+from . import repository
+from .game_logic import (STATS_FIELDS, apply_match_stats, apply_round_stats, calculate_payoff,
+                         format_cooperation_percentage, initialize_rounds,
+                         recompute_game_stats, rounds_from_events, save_game_stats)
+from .match_state import MatchState
+from .models import GameMatch, GameMatchEvent, GameRound
+from .repository import AsyncMatchRepository, HotStateMatchRepository, SyncMatchRepository
+from .tasks import refill_match_pool
+from .views import start_match
+
+try:
+    import fakeredis
+except ImportError:         # requirements-dev.txt
+    fakeredis = None
+
+# both players' moves of a 25 round match, every combination and long runs of each
+MOVES = [
+    ('Cooperate', 'Cooperate'), ('Cooperate', 'Defect'), ('Defect', 'Cooperate'),
+    ('Defect', 'Defect'), ('Cooperate', 'Cooperate'), ('Cooperate', 'Cooperate'),
+    ('Defect', 'Cooperate'), ('Defect', 'Defect'), ('Defect', 'Defect'),
+    ('Cooperate', 'Defect'), ('Cooperate', 'Cooperate'), ('Defect', 'Cooperate'),
+    ('Cooperate', 'Defect'), ('Cooperate', 'Cooperate'), ('Defect', 'Defect'),
+    ('Cooperate', 'Cooperate'), ('Cooperate', 'Cooperate'), ('Cooperate', 'Cooperate'),
+    ('Defect', 'Cooperate'), ('Defect', 'Cooperate'), ('Cooperate', 'Defect'),
+    ('Defect', 'Defect'), ('Cooperate', 'Cooperate'), ('Defect', 'Cooperate'),
+    ('Cooperate', 'Defect'),
+]
+
+
+def reference_stats(moves):
+    """The statistics of every round counted from scratch, the way they were before"""
+    stats = []
+    for n in range(1, len(moves) + 1):
+        played = moves[:n]
+        p1_cooperations = sum(p1 == 'Cooperate' for p1, _ in played)
+        p2_cooperations = sum(p2 == 'Cooperate' for _, p2 in played)
+        payoffs = [calculate_payoff(p1, p2) for p1, p2 in played]
+        stats.append({
+            'player_1_cooperation_count': p1_cooperations,
+            'player_2_cooperation_count': p2_cooperations,
+            'player_1_cooperation_percent': format_cooperation_percentage(p1_cooperations / n),
+            'player_2_cooperation_percent': format_cooperation_percentage(p2_cooperations / n),
+            'avg_cooperation_percent': format_cooperation_percentage(
+                (p1_cooperations / n + p2_cooperations / n) / 2),
+            'player_1_cumulative_score': sum(p1 for p1, _ in payoffs),
+            'player_2_cumulative_score': sum(p2 for _, p2 in payoffs),
+        })
+    return stats
+
+
+def round_stats(round_obj):
+    return {field: getattr(round_obj, field) for field in STATS_FIELDS}
+
+
+class ApplyRoundStatsTests(SimpleTestCase):
+
+    def test_running_totals_match_counting_from_scratch(self):
+        previous_round = None
+        for (round_number, (p1, p2)), expected in zip(enumerate(MOVES, 1), reference_stats(MOVES)):
+            round_obj = GameRound(round_number=round_number, player_1_action=p1, player_2_action=p2)
+            apply_round_stats(round_obj, previous_round)
+            self.assertEqual(round_stats(round_obj), expected, f"round {round_number}")
+            self.assertEqual((round_obj.player_1_score, round_obj.player_2_score),
+                             calculate_payoff(p1, p2))
+            previous_round = round_obj
+
+    def test_percentages_are_formatted(self):
+        first = apply_round_stats(GameRound(round_number=1, player_1_action='Cooperate',
+                                            player_2_action='Defect'))
+        second = apply_round_stats(GameRound(round_number=2, player_1_action='Defect',
+                                             player_2_action='Defect'), first)
+        third = apply_round_stats(GameRound(round_number=3, player_1_action='Defect',
+                                            player_2_action='Defect'), second)
+        self.assertEqual(first.player_1_cooperation_percent, 1)
+        self.assertEqual(second.player_1_cooperation_percent, 0.5)
+        self.assertEqual(third.player_1_cooperation_percent, 0.33)
+        self.assertEqual(third.avg_cooperation_percent, 0.17)
+
+
+class IncrementalStatsTests(TestCase):
+
+    def setUp(self):
+        self.game_match = GameMatch.objects.create(
+            match_id='stats-test', game_mode='online',
+            player_1_fingerprint='p1', player_2_fingerprint='p2',
+            player_1_ip='127.0.0.1', player_1_country='Unknown', player_1_city='Unknown',
+        )
+        initialize_rounds([self.game_match])
+
+    def play(self, moves):
+        """Settle the rounds one at a time, as the consumer does"""
+        previous_round = None
+        for round_obj, (p1, p2) in zip(self.game_match.rounds.order_by('round_number'), moves):
+            round_obj.player_1_action, round_obj.player_2_action = p1, p2
+            apply_round_stats(round_obj, previous_round)
+            apply_match_stats(self.game_match, round_obj)
+            save_game_stats(self.game_match, round_obj)
+            previous_round = round_obj
+
+    def stored_stats(self):
+        return [round_stats(r) for r in self.game_match.rounds.filter(
+            player_1_action__isnull=False).order_by('round_number')]
+
+    def test_settled_rounds_match_recompute_game_stats(self):
+        self.play(MOVES)
+        played = self.stored_stats()
+        self.assertEqual(played, reference_stats(MOVES))
+
+        # wipe the running totals and rebuild them the backfill way
+        GameRound.objects.filter(match=self.game_match).update(
+            player_1_cooperation_count=0, player_2_cooperation_count=0,
+            player_1_cooperation_percent=0, player_2_cooperation_percent=0,
+            avg_cooperation_percent=0, player_1_cumulative_score=0, player_2_cumulative_score=0,
+        )
+        self.assertEqual(recompute_game_stats(self.game_match), 25)
+        self.assertEqual(self.stored_stats(), played)
+
+    def test_unfinished_match_matches_recompute_game_stats(self):
+        self.play(MOVES[:9])
+        played = self.stored_stats()
+        self.assertEqual(played, reference_stats(MOVES[:9]))
+        recompute_game_stats(self.game_match)
+        self.assertEqual(self.stored_stats(), played)
+
+    def test_recompute_counts_rounds_across_gaps(self):
+        self.play(MOVES[:6])
+        # a historical match that lost its round 3
+        GameRound.objects.filter(match=self.game_match, round_number=3).delete()
+        self.assertEqual(recompute_game_stats(self.game_match), 5)
+        self.assertEqual(self.stored_stats(), reference_stats(MOVES[:2] + MOVES[3:6]))
+
+    def test_last_round_completes_the_match(self):
+        self.play(MOVES)
+        last = reference_stats(MOVES)[-1]
+        game_match = GameMatch.objects.get(pk=self.game_match.pk)
+        self.assertTrue(game_match.is_complete)
+        self.assertTrue(game_match.completed_at)
+        self.assertEqual(game_match.player_1_final_score, last['player_1_cumulative_score'])
+        self.assertEqual(game_match.player_2_final_score, last['player_2_cumulative_score'])
+        self.assertEqual(game_match.avg_cooperation_percent, last['avg_cooperation_percent'])
+
+        completed_at = game_match.completed_at
+        recompute_game_stats(game_match)
+        game_match.refresh_from_db()
+        self.assertEqual(game_match.completed_at, completed_at)
+        self.assertEqual(game_match.player_1_final_score, last['player_1_cumulative_score'])
+
+
+class SettledRoundRepositoryTests(TestCase):
+    """The repositories the consumer saves its settled rounds through"""
+
+    def setUp(self):
+        self.game_match = GameMatch.objects.create(
+            match_id='repo-test', game_mode='online',
+            player_1_fingerprint='p1', player_2_fingerprint='p2',
+            player_1_ip='127.0.0.1', player_1_country='Unknown', player_1_city='Unknown',
+        )
+        initialize_rounds([self.game_match])
+        self.rounds = list(self.game_match.rounds.order_by('round_number'))
+
+    async def play(self, repo, moves, first=1):
+        """Settle the rounds from `first` on one at a time, as the consumer does"""
+        previous_round = self.rounds[first - 2] if first > 1 else None
+        for round_obj, (p1, p2) in zip(self.rounds[first - 1:], moves):
+            round_obj.player_1_action, round_obj.player_2_action = p1, p2
+            apply_round_stats(round_obj, previous_round)
+            apply_match_stats(self.game_match, round_obj)
+            await repo.save_settled_round(self.game_match, round_obj)
+            previous_round = round_obj
+
+    def stored_stats(self):
+        return [round_stats(r) for r in self.game_match.rounds.filter(
+            player_1_action__isnull=False).order_by('round_number')]
+
+    async def test_async_repository_writes_through_save_game_stats(self):
+        with mock.patch.object(repository, 'save_game_stats', wraps=save_game_stats) as save:
+            await self.play(AsyncMatchRepository(), MOVES)
+        self.assertEqual(save.call_count, 25)
+        self.assertEqual(await database_sync_to_async(self.stored_stats)(), reference_stats(MOVES))
+        game_match = await database_sync_to_async(GameMatch.objects.get)(pk=self.game_match.pk)
+        self.assertTrue(game_match.is_complete)
+
+    @skipUnless(fakeredis, "needs fakeredis with Lua (requirements-dev.txt)")
+    async def test_hot_state_writes_behind_until_the_last_round(self):
+        server = fakeredis.FakeServer()
+        store = HotStateStore(fakeredis.FakeRedis(server=server, decode_responses=True),
+                              fakeredis.FakeAsyncRedis(server=server, decode_responses=True), 1)
+        repo = HotStateMatchRepository(SyncMatchRepository(), store)
+        with mock.patch.object(HotStateStore, 'start'):
+            await self.play(repo, MOVES[:24])
+            # nothing written yet, a worker loading the match sees the rounds anyway
+            self.assertEqual(await database_sync_to_async(self.stored_stats)(), [])
+            game_match, rounds = await repo.load_match('repo-test')
+            self.assertEqual([round_stats(r) for r in rounds[:24]], reference_stats(MOVES[:24]))
+            self.assertTrue(all(r.round_end_time for r in rounds[:24]))
+
+            # the last round flushes the others and is written with the match
+            await self.play(repo, MOVES[24:], first=25)
+        self.assertEqual(await database_sync_to_async(self.stored_stats)(), reference_stats(MOVES))
+        self.assertEqual(store.client.zcard(DIRTY_KEY), 0)
+        game_match = await database_sync_to_async(GameMatch.objects.get)(pk=self.game_match.pk)
+        self.assertTrue(game_match.is_complete)
+
+
+class MatchLogger(EventLogMixin):
+    """log_event of the consumer, for the match in `state`"""
+
+    event_model = 'the_game.GameMatchEvent'
+
+    def __init__(self, state):
+        self.state, self.match_id = state, state.match_id
+
+
+class EventLogReplayTests(TestCase):
+
+    def setUp(self):
+        self.log = EventLog(interval=1)
+        for patcher in (mock.patch.object(EventLog, 'start'),
+                        mock.patch.object(event_log, 'get_event_log', return_value=self.log)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def play(self, match_id, moves):
+        """A match played the consumer's way: log the moves, settle, log the settlement"""
+        game_match = GameMatch.objects.create(
+            match_id=match_id, player_1_fingerprint='p1', player_2_fingerprint='p2',
+            player_1_ip='127.0.0.1', player_1_country='Unknown', player_1_city='Unknown')
+        initialize_rounds([game_match])
+        rounds = list(game_match.rounds.order_by('round_number'))
+        logger = MatchLogger(MatchState(game_match, rounds))
+        previous_round = None
+        for round_obj, (p1, p2) in zip(rounds, moves):
+            logger.log_event(MOVE, round_obj.round_number, 2, p2)
+            logger.log_event(MOVE, round_obj.round_number, 1, p1)
+            round_obj.player_1_action, round_obj.player_2_action = p1, p2
+            apply_round_stats(round_obj, previous_round)
+            apply_match_stats(game_match, round_obj)
+            save_game_stats(game_match, round_obj)
+            logger.log_event(ROUND_SETTLED, round_obj.round_number,
+                             round_obj.player_1_score, round_obj.player_2_score)
+            previous_round = round_obj
+        self.log.flush()
+        return game_match
+
+    def assertRebuilt(self, rebuilt, game_match):
+        stored = [r for r in game_match.rounds.order_by('round_number') if r.player_1_action]
+        self.assertEqual(len(rebuilt), len(stored))
+        for replayed, row in zip(rebuilt, stored):
+            self.assertEqual(round_stats(replayed), round_stats(row))
+            self.assertEqual((replayed.player_1_action, replayed.player_2_action,
+                              replayed.player_1_score, replayed.player_2_score),
+                             (row.player_1_action, row.player_2_action,
+                              row.player_1_score, row.player_2_score))
+
+    def test_rounds_rebuilt_from_the_log_match_the_settled_rounds(self):
+        game_match = self.play('ev-1', MOVES)
+        self.assertRebuilt(rounds_from_events(GameMatchEvent.history('ev-1')), game_match)
+        call_command('replay_match_events', 'prisoners', 'ev-1', stdout=StringIO())
+
+    def test_reused_match_id_keeps_its_own_log(self):
+        deleted = self.play('ev-1', MOVES[:7])
+        deleted_pk = deleted.pk
+        deleted.delete()
+        game_match = self.play('ev-1', MOVES[10:15])
+
+        self.assertEqual({e.match_pk for e in GameMatchEvent.history('ev-1')}, {game_match.pk})
+        self.assertRebuilt(rounds_from_events(GameMatchEvent.history('ev-1')), game_match)
+        self.assertEqual(len(rounds_from_events(GameMatchEvent.history('ev-1', deleted_pk))), 7)
+        call_command('replay_match_events', 'prisoners', 'ev-1', stdout=StringIO())
+
+
+@override_settings(MATCH_POOL_SIZE=2)
+class MatchPoolTests(TestCase):
+    """The warm pool is claimed by the web processes and refilled by Celery beat"""
+
+    def setUp(self):
+        patcher = mock.patch.object(match_pool, '_pool', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_off_by_default(self):
+        with override_settings(MATCH_POOL_SIZE=0):
+            self.assertIsNone(match_pool.get_match_pool())
+            self.assertEqual(refill_match_pool(), 0)
+        self.assertFalse(GameMatch.all_objects.filter(is_pooled=True).exists())
+
+    def test_claims_start_no_thread(self):
+        game_match = start_match('online', 'p1', '127.0.0.1')
+        self.assertFalse(game_match.is_pooled)
+        self.assertEqual(game_match.rounds.count(), 25)
+        self.assertNotIn('match-pool', [t.name for t in threading.enumerate()])
+        self.assertFalse(GameMatch.all_objects.filter(is_pooled=True).exists())
+
+    def test_refill_then_claim(self):
+        # two per game and mode, four modes
+        self.assertEqual(refill_match_pool(), 8)
+        self.assertEqual(refill_match_pool(), 0)
+
+        game_match = start_match('online', 'p1', '127.0.0.1')
+        self.assertEqual((game_match.player_1_fingerprint, game_match.is_pooled), ('p1', False))
+        self.assertEqual(GameMatch.pool_size('online'), 1)
+
+        pools = match_pool.get_match_pool().stats()['pools']
+        self.assertEqual(pools['prisoners/online'],
+                         {'available': 1, 'hits': 1, 'misses': 0, 'hit_rate': 1.0})
+        self.assertEqual(pools['ultimatum/bot']['available'], 2)
+        self.assertEqual(refill_match_pool(), 1)
@@ -1,7 +1,7 @@
 from django.urls import path
 from the_game import views
-from django.views.generic import TemplateView
 
 urlpatterns = [
     path('create_match/', views.create_match, name='create_match'),
+    path('export/', views.export_rounds, name='export_rounds'),
 ]
\ No newline at end of file
@@ -1,10 +1,36 @@
+from django.db import transaction
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 import json
 import uuid
+from game.exports import export_response
+from game.lobby import get_lobby, notify_matched
+from game.match_pool import get_match_pool
+from .game_logic import initialize_rounds
 from .models import GameMatch 
 
 
+def start_match(game_mode, player_fingerprint, ip_address):
+    """A new match holding player 1, taken from the warm pool when it has one"""
+    pool = get_match_pool()
+    if pool is not None:
+        game_match = pool.claim('prisoners', game_mode, player_fingerprint, ip_address)
+        if game_match is not None:
+            return game_match
+    with transaction.atomic():
+        game_match = GameMatch.objects.create(
+            match_id=str(uuid.uuid4())[:8],
+            game_mode=game_mode,
+            player_1_fingerprint=player_fingerprint,
+            player_1_ip=ip_address,
+            player_1_country='Unknown', 
+            player_1_city='Unknown',
+            player_2_fingerprint='bot' if game_mode == 'bot' else None,
+        )
+        initialize_rounds([game_match])
+    return game_match
+
+
 @csrf_exempt
 def create_match(request):
     if request.method == 'POST':
@@ -22,37 +48,45 @@ def create_match(request):
 
         if game_mode == 'online':
         
-            try:
-                game_match = GameMatch.objects.get(
-                    game_mode='online',
-                    player_2_fingerprint__isnull=True, 
-                    is_complete=False
+            lobby = get_lobby()
+
+            # ── REFUSE if the same browser tries to occupy both seats ──────────
+            if lobby is not None:
+                already_waiting = lobby.waiting_match('prisoners', player_fingerprint)
+            else:
+                already_waiting = GameMatch.waiting_matches().filter(
+                    player_1_fingerprint=player_fingerprint).exists()
+            if already_waiting:
+                return JsonResponse(
+                    {"status": "error",
+                    "message": "You are already registered in this match."},
+                    status=400
                 )
-                # ── REFUSE if the same browser tries to occupy both seats ──────────
-                if game_match.player_1_fingerprint == player_fingerprint:
-                    return JsonResponse(
-                        {"status": "error",
-                        "message": "You are already registered in this match."},
-                        status=400
-                    )
-                game_match.player_2_fingerprint = player_fingerprint
-                game_match.player_2_ip = ip_address
-                game_match.player_2_country = 'Unknown' 
-                game_match.player_2_city = 'Unknown'    
-                game_match.save()
-                status_message = 'joined_existing_match'
-                print(f"Player {player_fingerprint} joined existing match {game_match.match_id}")
 
-            except GameMatch.DoesNotExist:
-                match_id = str(uuid.uuid4())[:8] 
-                game_match = GameMatch.objects.create(
-                    match_id=match_id,
-                    game_mode=game_mode,
-                    player_1_fingerprint=player_fingerprint,
-                    player_1_ip=ip_address,
-                    player_1_country='Unknown', 
-                    player_1_city='Unknown',
+            if lobby is not None:
+                def create():
+                    own = start_match('online', player_fingerprint, ip_address)
+                    return own, own.match_id
+
+                game_match, joined = lobby.find_or_queue(
+                    'prisoners', player_fingerprint,
+                    claim=lambda partner_id: GameMatch.claim_waiting_match(
+                        player_fingerprint, ip_address, match_id=partner_id),
+                    create=create,
+                    discard=lambda own_id: GameMatch.objects.filter(match_id=own_id).delete(),
                 )
+            else:
+                game_match = GameMatch.claim_waiting_match(player_fingerprint, ip_address)
+                joined = game_match is not None
+                if not joined:
+                    game_match = start_match('online', player_fingerprint, ip_address)
+
+            if joined:
+                status_message = 'joined_existing_match'
+                print(f"Player {player_fingerprint} joined existing match {game_match.match_id}")
+                notify_matched(f"game_{game_match.match_id}",
+                               player_2_fingerprint=player_fingerprint)
+            else:
                 status_message = 'created_new_match'
                 print(f"Player {player_fingerprint} created new match {game_match.match_id}")
             
@@ -64,16 +98,7 @@ def create_match(request):
                 print(f"Player {player_fingerprint} rejoined match {game_match.match_id}")
             
         elif game_mode == 'bot':
-            match_id = str(uuid.uuid4())[:8]
-            game_match = GameMatch.objects.create(
-                match_id=match_id,
-                game_mode=game_mode,
-                player_1_fingerprint=player_fingerprint,
-                player_1_ip=ip_address,
-                player_1_country='Unknown', 
-                player_1_city='Unknown',
-                player_2_fingerprint='bot'
-            )
+            game_match = start_match('bot', player_fingerprint, ip_address)
             status_message = 'created_bot_match'
             print(f"Player {player_fingerprint} created bot match {game_match.match_id}")
 
@@ -86,4 +111,9 @@ def create_match(request):
             'player_2_fingerprint': game_match.player_2_fingerprint,
         })
     
-    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
\ No newline at end of file
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+
+
+def export_rounds(request):
+    """CSV of every settled round, for staff (filters: see game/exports.py)"""
+    return export_response(request, 'prisoners')
@@ -1,4 +1,7 @@
 from django.contrib import admin
-from .models import UltimatumGameRound
+from .models import UltimatumGameRound, UltimatumMatch, UltimatumMatchEvent, UltimatumMatchSummary
 
+admin.site.register(UltimatumMatch)
 admin.site.register(UltimatumGameRound)
+admin.site.register(UltimatumMatchSummary)
+admin.site.register(UltimatumMatchEvent)
@@ -1,23 +1,31 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from asgiref.sync import sync_to_async, async_to_sync
-from .models import UltimatumGameRound
-from .game_logic import update_game_stats
+from game.codec import FrameCodecMixin
+from game.event_log import ABORT, JOIN, MOVE, RESPONSE, ROUND_SETTLED, EventLogMixin
+from game.event_order import OrderedGroupEventsMixin
+from game.lobby import get_lobby
+from game.match_actor import acquire_match_actor, release_match_actor
+from game.state_sync import VersionedStateMixin
+from game.timer_wheel import get_timer_wheel
+from .match_state import load_match_state
+from .repository import get_round_repository
 import random
-import json, asyncio, logging 
+import asyncio, logging 
 logger = logging.getLogger(__name__)
 
 # Separate timeout constants
 PROPOSER_TIMEOUT = 25  # 25 seconds for making offers
 RESPONSE_TIMEOUT = 25  # 25 seconds for responding to offers
+BOT_THINKING_TIME = 1.0  # before the bot's offer and response
 
-class UltimatumGameConsumer(AsyncWebsocketConsumer):
+class UltimatumGameConsumer(FrameCodecMixin, OrderedGroupEventsMixin, VersionedStateMixin,
+                            EventLogMixin, AsyncWebsocketConsumer):
+
+    event_model = "ultimatum.UltimatumMatchEvent"
 
     async def connect(self):
         self.match_id = self.scope["url_route"]["kwargs"]["match_id"]
         self.player_fingerprint = None  
-        self.offer_timeout_task = None
-        self.response_timeout_task = None  # NEW: Separate timeout for responses
+        self.timers = get_timer_wheel()
         
         # Extract IP address from the connection
         self.client_ip = self.scope.get('client', ['unknown', None])[0]
@@ -37,7 +45,11 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
                 if forwarded and len(forwarded) > 0:
                     self.client_ip = forwarded[0].get('for', 'unknown')
                     
-        self.match_exists = await self.check_match_exists(self.match_id)
+        # every move of this match is serialized through one actor
+        self.repository = get_round_repository()
+        self.actor = acquire_match_actor(f"ultimatum:{self.match_id}")
+        self.state = await self.actor.call(self.load_state)
+        self.match_exists = self.state is not None
         
         if not self.match_exists:
             logger.warning("Match %s not found – closing WS", self.match_id)
@@ -47,105 +59,67 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
 
         self.room_group_name = f"ultimatum_game_{self.match_id}"
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        self.start_event_order()
+        self.start_state_sync()
+        # JSON, or MessagePack if the client offers that subprotocol
+        await self.accept_with_codec()
         try:
-            game_state = await self.get_game_state()
-            
-            await self.send(text_data=json.dumps({
-                "game_state": game_state
-            }))
+            # the one full state of this socket, deltas follow (see game/state_sync.py)
+            await self.send_snapshot()
             logger.info(f"Player connected to match {self.match_id} from IP {self.client_ip}")
         except Exception as e:
             logger.error(f"Error sending initial game state: {e}")
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 "error": "Failed to load game state"
-            }))
+            })
+
+        # Keep the lobby ticket alive while player 1 waits for an opponent
+        self.lobby = get_lobby()
+        if self.lobby is not None and self.is_waiting_for_opponent():
+            self.lobby_task = asyncio.create_task(self.lobby.keep_alive(
+                "ultimatum", self.state.match.player_1_fingerprint, self.match_id))
+
+    def is_waiting_for_opponent(self):
+        game_match = self.state.match
+        return game_match.game_mode == "online" and not game_match.player_2_fingerprint
+
+    def stop_lobby_heartbeat(self):
+        task = getattr(self, "lobby_task", None)
+        if task and not task.done():
+            task.cancel()
+        self.lobby_task = None
     
-    # OFFER TIMEOUT HELPERS
+    # MOVE DEADLINES – kept on the process-wide timer wheel, one per phase
+    def deadline_key(self, phase):
+        return (f"ultimatum:{self.match_id}", phase, self.channel_name)
+
     async def start_offer_timeout(self):
-        """(Re)start a 25-second timer for making offers."""
-        await self.cancel_offer_timeout()
-        self.offer_timeout_task = asyncio.create_task(self._offer_timeout_loop())
+        """(Re)start a 25-second deadline for making offers."""
+        self.timers.schedule(self.deadline_key("offer"), PROPOSER_TIMEOUT,
+                             self._deadline_expired, "offer")
 
     async def cancel_offer_timeout(self):
-        if self.offer_timeout_task and not self.offer_timeout_task.done():
-            self.offer_timeout_task.cancel()
-        self.offer_timeout_task = None
+        self.timers.cancel(self.deadline_key("offer"))
 
-    async def _offer_timeout_loop(self):
-        try:
-            await asyncio.sleep(PROPOSER_TIMEOUT)
-            current_round = await self.get_current_round()
-            if not current_round:
-                return
-
-            # Decide whether *this* player still owes an offer
-            first = await database_sync_to_async(
-                lambda: UltimatumGameRound.objects.get(
-                    game_match_uuid=self.match_id, round_number=1
-                )
-            )()
-
-            needs_offer = (
-                (self.player_fingerprint == first.player_1_fingerprint and 
-                current_round.player_1_coins_to_offer is None)
-                or
-                (self.player_fingerprint == first.player_2_fingerprint and 
-                 current_round.player_2_coins_to_offer is None)
-            )
-            if needs_offer:
-                await self.handle_player_timeout("offer")
-        except asyncio.CancelledError:
-            pass    # normal path when player makes an offer
-
-    # NEW: RESPONSE TIMEOUT HELPERS
     async def start_response_timeout(self):
-        """Start a 10-second timer for responding to offers."""
-        await self.cancel_response_timeout()
-        self.response_timeout_task = asyncio.create_task(self._response_timeout_loop())
+        """(Re)start a 25-second deadline for responding to offers."""
+        self.timers.schedule(self.deadline_key("response"), RESPONSE_TIMEOUT,
+                             self._deadline_expired, "response")
 
     async def cancel_response_timeout(self):
-        if self.response_timeout_task and not self.response_timeout_task.done():
-            self.response_timeout_task.cancel()
-        self.response_timeout_task = None
+        self.timers.cancel(self.deadline_key("response"))
 
-    async def _response_timeout_loop(self):
-        try:
-            await asyncio.sleep(RESPONSE_TIMEOUT)
-            current_round = await self.get_current_round()
-            if not current_round:
-                return
-
-            # Decide whether *this* player still owes a response
-            first = await database_sync_to_async(
-                lambda: UltimatumGameRound.objects.get(
-                    game_match_uuid=self.match_id, round_number=1
-                )
-            )()
-
-            # Check if both offers are made and this player needs to respond
-            both_offers_made = (current_round.player_1_coins_to_offer is not None and 
-                              current_round.player_2_coins_to_offer is not None)
-            
-            if both_offers_made:
-                needs_response = (
-                    (self.player_fingerprint == first.player_1_fingerprint and 
-                     current_round.player_1_response_to_p2_offer is None)
-                    or
-                    (self.player_fingerprint == first.player_2_fingerprint and 
-                     current_round.player_2_response_to_p1_offer is None)
-                )
-                if needs_response:
-                    await self.handle_player_timeout("response")
-        except asyncio.CancelledError:
-            pass    # normal path when player responds
+    async def _deadline_expired(self, phase):
+        # Decide whether *this* player still owes the move – in-memory state only
+        if await self.actor.call(self.owes_move, phase):
+            await self.handle_player_timeout(phase)
 
     async def handle_player_timeout(self, timeout_type="offer"):
         """Handle player timeout for either offer or response phase."""
         logging.warning("Player %s timed-out (%s phase) in match %s",
                         self.player_fingerprint, timeout_type, self.match_id)
 
-        await self.channel_layer.group_send(self.room_group_name, {
+        await self.group_publish({
             "type": "match_terminated",
             "reason": "timeout",
             "timeout_type": timeout_type,
@@ -160,30 +134,38 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
         # Cancel both timers
         await self.cancel_offer_timeout()
         await self.cancel_response_timeout()
+        self.cancel_bot_turns()
+
+        self.stop_lobby_heartbeat()
+        if getattr(self, "lobby", None) is not None and self.is_waiting_for_opponent():
+            try:
+                await self.lobby.aleave("ultimatum", self.state.match.player_1_fingerprint,
+                                        self.match_id)
+            except Exception as e:
+                logger.error(f"Error leaving lobby: {e}")
         
         if hasattr(self, "room_group_name"):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+            self.stop_event_order()
 
         if hasattr(self, 'match_exists') and self.match_exists:
             try:
-                is_complete = await self.is_match_complete()
+                is_complete = await self.actor.call(self.is_match_complete)
                 
                 if not is_complete:
                     logger.info(f"Player disconnected from incomplete match {self.match_id} - terminating match for all players")
                     
-                    await self.channel_layer.group_send(self.room_group_name, {
+                    await self.group_publish({
                         "type": "match_terminated",
                         "reason": "Player disconnected",
                         "disconnected_player": getattr(self, 'player_fingerprint', 'unknown')
                     })
                     
-                    await asyncio.sleep(0.5)
-                    
-                    deleted = await self.delete_match_completely()
+                    deleted = await self.actor.call(self.delete_match_completely, "disconnect")
                     if deleted:
                         logger.info(f"Incomplete match {self.match_id} deleted due to player disconnect")
                     
-                    await self.channel_layer.group_send(self.room_group_name, {
+                    await self.group_publish({
                         "type": "force_disconnect",
                         "reason": "player_disconnected",
                     })
@@ -193,11 +175,14 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
             except Exception as e:
                 logger.error(f"Error during disconnect cleanup: {e}")
 
-    async def receive(self, text_data):
+        if hasattr(self, "actor"):
+            release_match_actor(self.actor)
+
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({"error": "Invalid JSON"}))
+            data = self.decode_frame(text_data, bytes_data)
+        except ValueError:
+            await self.send_frame({"error": "Invalid JSON"})
             return
             
         action = data.get("action")
@@ -205,8 +190,12 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
         if action == "leave":
             await self.close(code=4001)
             return
+        if action == "resync":
+            # the client missed a state version
+            await self.send_snapshot()
+            return
         if not action or not fp:
-            await self.send(text_data=json.dumps({"error": "Missing action or player_fingerprint"}))
+            await self.send_frame({"error": "Missing action or player_fingerprint"})
             return
 
         self.player_fingerprint = fp
@@ -216,37 +205,33 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
         try:
             gs = await self.get_game_state()
             if gs.get("error"):
-                await self.send(text_data=json.dumps({"error": gs["error"]}))
+                await self.send_frame({"error": gs["error"]})
                 return
                 
             if gs.get("gameOver"):
-                await self.send(text_data=json.dumps({"error": "Game is already over"}))
+                await self.send_frame({"error": "Game is already over"})
                 return
         except Exception as e:
             logger.error(f"Error getting game state: {e}")
-            await self.send(text_data=json.dumps({"error": "Failed to get game state"}))
+            await self.send_frame({"error": "Failed to get game state"})
             return
 
         # Handle join
         if action == "join":
             try:
-                join_result = await self.handle_join_with_ip(fp, self.client_ip)
+                join_result = await self.actor.call(self.handle_join_with_ip, fp, self.client_ip)
                 if not join_result:
-                    await self.send(text_data=json.dumps({"error": "Cannot join match"}))
+                    await self.send_frame({"error": "Cannot join match"})
                     return
                 
-                updated_game_state = await self.get_game_state()
-                await self.channel_layer.group_send(self.room_group_name, {
-                    "type": "game_state_update",
-                    "game_state": updated_game_state,
-                })
+                await self.publish_state()
                 
                 # Start offer timeout for new rounds
                 await self.start_offer_timeout()
                 return
             except Exception as e:
                 logger.error(f"Error handling join: {e}")
-                await self.send(text_data=json.dumps({"error": "Failed to join match"}))
+                await self.send_frame({"error": "Failed to join match"})
                 return
 
         # Handle make offer
@@ -257,15 +242,15 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
                 coins_to_offer = data.get("coins_to_offer")
                 
                 if coins_to_keep is None or coins_to_offer is None:
-                    await self.send(text_data=json.dumps({"error": "Missing coins_to_keep or coins_to_offer"}))
+                    await self.send_frame({"error": "Missing coins_to_keep or coins_to_offer"})
                     return
                     
                 if not (0 <= coins_to_keep <= 100) or not (0 <= coins_to_offer <= 100):
-                    await self.send(text_data=json.dumps({"error": "Invalid coin amounts"}))
+                    await self.send_frame({"error": "Invalid coin amounts"})
                     return
                     
                 if coins_to_keep + coins_to_offer != 100:
-                    await self.send(text_data=json.dumps({"error": "Coins to keep + coins to offer must equal 100"}))
+                    await self.send_frame({"error": "Coins to keep + coins to offer must equal 100"})
                     return
 
                 offer_data = {
@@ -273,14 +258,14 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
                     "coins_to_offer": coins_to_offer
                 }
 
-                if not await self.process_offer(fp, offer_data):
-                    await self.send(text_data=json.dumps({"error": "Cannot make offer"}))
+                if not await self.actor.call(self.process_offer, fp, offer_data):
+                    await self.send_frame({"error": "Cannot make offer"})
                     return
                 
                 # Cancel offer timeout for this player
                 await self.cancel_offer_timeout()
                 
-                await self.channel_layer.group_send(self.room_group_name, {
+                await self.group_publish({
                     "type": "game_action",
                     "player_fingerprint": fp,
                     "action": "make_offer",
@@ -289,19 +274,16 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
                 })
 
                 # Check if bot needs to make offer
-                await self.handle_bot_offer_if_needed()
+                await self.schedule_bot_offer()
                 
                 # NEW: Check if both offers are now made and start response timeout
-                current_round = await self.get_current_round()
-                if (current_round and 
-                    current_round.player_1_coins_to_offer is not None and 
-                    current_round.player_2_coins_to_offer is not None):
+                if await self.actor.call(self.both_offers_made):
                     logger.info(f"Both offers made in match {self.match_id}, starting response timeout")
                     await self.start_response_timeout()
 
             except Exception as e:
                 logger.error(f"Error processing offer: {e}")
-                await self.send(text_data=json.dumps({"error": "Failed to process offer"}))
+                await self.send_frame({"error": "Failed to process offer"})
 
         # Handle respond to offer
         elif action == "respond_to_offer":
@@ -310,17 +292,17 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
                 response = data.get("response")
                 
                 if response not in ["accept", "reject"]:
-                    await self.send(text_data=json.dumps({"error": "Invalid response"}))
+                    await self.send_frame({"error": "Invalid response"})
                     return
 
-                if not await self.process_response(fp, target_player, response):
-                    await self.send(text_data=json.dumps({"error": "Cannot respond to offer"}))
+                if not await self.actor.call(self.process_response, fp, target_player, response):
+                    await self.send_frame({"error": "Cannot respond to offer"})
                     return
                 
                 # Cancel response timeout for this player
                 await self.cancel_response_timeout()
                 
-                await self.channel_layer.group_send(self.room_group_name, {
+                await self.group_publish({
                     "type": "game_action",
                     "player_fingerprint": fp,
                     "action": "respond_to_offer",
@@ -329,57 +311,65 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
                 })
 
                 # Check if bot needs to respond
-                await self.handle_bot_response_if_needed()
+                await self.schedule_bot_response()
 
-                # Check if round is complete
-                if await self.check_round_complete():
-                    logger.info(f"Round complete in match {self.match_id}, calculating results...")
-                    
-                    # Cancel any remaining timeouts
-                    await self.cancel_offer_timeout()
-                    await self.cancel_response_timeout()
-                    
-                    await self.calculate_round_results()
-                    gs = await self.get_game_state()
-                    
-                    await self.channel_layer.group_send(self.room_group_name, {
-                        "type": "game_state_update",
-                        "game_state": gs,
-                    })
-                    
-                    if gs.get("gameOver"):
-                        logger.info(f"Game over for match {self.match_id}")
-                        await self.channel_layer.group_send(self.room_group_name, {
-                            "type": "game_over",
-                            "player1_score": gs.get("player1Score", 0),
-                            "player2_score": gs.get("player2Score", 0),
-                        })
-                    else:
-                        logger.info(f"Creating next round for match {self.match_id}")
-                        next_round_created = await self.create_next_round()
-                        if next_round_created:
-                            updated_gs = await self.get_game_state()
-                            await self.channel_layer.group_send(self.room_group_name, {
-                                "type": "game_state_update",
-                                "game_state": updated_gs,
-                            })
-                            # Start offer timeout for new round
-                            await self.start_offer_timeout()
+                await self.settle_and_broadcast()
 
             except Exception as e:
                 logger.error(f"Error processing response: {e}")
-                await self.send(text_data=json.dumps({"error": "Failed to process response"}))
+                await self.send_frame({"error": "Failed to process response"})
+
+    async def settle_and_broadcast(self):
+        # Check if round is complete (only one socket gets to settle it)
+        results = await self.actor.call(self.settle_round_if_complete)
+        if not results:
+            return
+        summary_event, update, next_update, gs = results
+        
+        # Cancel any remaining timeouts
+        await self.cancel_offer_timeout()
+        await self.cancel_response_timeout()
+        
+        # send to **every** socket in the match
+        await self.group_publish(summary_event)
+        await self.group_publish(update)
+        
+        if gs.get("gameOver"):
+            logger.info(f"Game over for match {self.match_id}")
+            await self.group_publish({
+                "type": "game_over",
+                "player1_score": gs.get("player1Score", 0),
+                "player2_score": gs.get("player2Score", 0),
+            })
+        elif next_update:
+            await self.group_publish(next_update)
+            # Start offer timeout for new round
+            await self.start_offer_timeout()
 
     # Group message handlers
+    async def lobby_matched(self, event):
+        """An opponent took the second seat over HTTP – tell player 1 now."""
+        self.stop_lobby_heartbeat()
+        try:
+            await self.actor.call(self.refresh_seats)
+            await self.send_snapshot(matched=True)
+        except Exception as e:
+            logger.error(f"Error sending matched event: {e}")
+
+    # The client frame of a group event is built and encoded once, by its
+    # publisher (see game/codec.py); the handlers only forward it
+    def match_terminated_frame(self, event):
+        return {
+            "match_terminated": True,
+            "reason": event["reason"],
+            "timeout_type": event.get("timeout_type", "unknown"),
+            "message": f"Match ended: {event['reason']}",
+            "disconnected_player": event.get("disconnected_player", "unknown")
+        }
+
     async def match_terminated(self, event):
         try:
-            await self.send(text_data=json.dumps({
-                "match_terminated": True,
-                "reason": event["reason"],
-                "timeout_type": event.get("timeout_type", "unknown"),
-                "message": f"Match ended: {event['reason']}",
-                "disconnected_player": event.get("disconnected_player", "unknown")
-            }))
+            await self.forward_frame(event)
         except Exception as e:
             logger.error(f"Error sending match termination: {e}")
 
@@ -390,140 +380,138 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error during force disconnect: {e}")
 
-    async def _broadcast_round_results(self, round_obj: UltimatumGameRound):
-        """Send a lightweight snapshot of the round that just ended."""
-        payload = {
-            "type": "round_results",               # <-- routing key
-            "round_number": round_obj.round_number,
-            "p1_offer": round_obj.player_1_coins_to_offer,
-            "p2_offer": round_obj.player_2_coins_to_offer,
-            "p1_response": round_obj.player_2_response_to_p1_offer,  # what P2 said to P1
-            "p2_response": round_obj.player_1_response_to_p2_offer,  # what P1 said to P2
-            "p1_earned": round_obj.player_1_coins_made_in_round,
-            "p2_earned": round_obj.player_2_coins_made_in_round,
+    def game_action_frame(self, event):
+        return {
+            "player_fingerprint": event["player_fingerprint"],
+            "action": event["action"],
+            "coins_to_keep": event.get("coins_to_keep"),
+            "coins_to_offer": event.get("coins_to_offer"),
+            "response": event.get("response"),
+            "target_player": event.get("target_player"),
         }
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {"type": "round_results", "summary": payload},
-        )
-        # await self.channel_layer.group_send(self.room_group_name, payload)
-
 
     async def game_action(self, event):
         try:
-            await self.send(text_data=json.dumps({
-                "player_fingerprint": event["player_fingerprint"],
-                "action": event["action"],
-                "coins_to_keep": event.get("coins_to_keep"),
-                "coins_to_offer": event.get("coins_to_offer"),
-                "response": event.get("response"),
-                "target_player": event.get("target_player"),
-            }))
+            await self.forward_frame(event)
         except Exception as e:
             logger.error(f"Error sending game action: {e}")
 
     async def game_state_update(self, event):
         try:
-            await self.send(text_data=json.dumps({
-                "game_state": event["game_state"]
-            }))
+            variant = self.state_variant(event)
+            if variant is not None:
+                await self.forward_frame(event, variant)
         except Exception as e:
             logger.error(f"Error sending game state update: {e}")
 
+    def game_over_frame(self, event):
+        return {
+            "game_over": True,
+            "player1_score": event["player1_score"],
+            "player2_score": event["player2_score"],
+        }
+
     async def game_over(self, event):
         try:
-            await self.send(text_data=json.dumps({
-                "game_over": True,
-                "player1_score": event["player1_score"],
-                "player2_score": event["player2_score"],
-            }))
+            await self.forward_frame(event)
         except Exception as e:
             logger.error(f"Error sending game over: {e}")
 
-    # Database helpers
-    @database_sync_to_async
-    def check_match_exists(self, match_id):
-        return UltimatumGameRound.objects.filter(game_match_uuid=match_id).exists()
+    # Actor jobs – the only code that touches self.state
+    async def load_state(self):
+        if self.actor.state is None or self.actor.state.deleted:
+            self.actor.state = await load_match_state(self.repository, self.match_id)
+        return self.actor.state
+
+    async def owes_move(self, phase):
+        if self.state.deleted:
+            return False
+        if phase == "offer":
+            return self.state.owes_offer(self.player_fingerprint)
+        return self.state.owes_response(self.player_fingerprint)
+
+    async def both_offers_made(self):
+        return not self.state.deleted and self.state.both_offers_made()
 
-    @database_sync_to_async
-    def is_match_complete(self):
+    async def is_match_complete(self):
         try:
-            completed_match = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id,
-                match_complete=True
-            ).exists()
-            
-            if completed_match:
-                return True
-            
-            completed_rounds = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id,
-                player_1_coins_to_offer__isnull=False,
-                player_2_coins_to_offer__isnull=False,
-                player_1_response_to_p2_offer__isnull=False,
-                player_2_response_to_p1_offer__isnull=False
-            ).count()
-            
-            return completed_rounds >= 25
+            return self.state.is_complete()
         except Exception as e:
             logger.error(f"Error checking if match is complete: {e}")
             return False
 
-    @database_sync_to_async
-    def delete_match_completely(self):
+    async def delete_match_completely(self, reason):
+        if self.state.deleted:
+            return False
+        self.log_event(ABORT, reason)
         try:
-            deleted_count, _ = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id
-            ).delete()
+            deleted_count = await self.repository.delete_match(self.match_id)
+            self.state.deleted = True
             logger.info(f"Deleted {deleted_count} rounds for match {self.match_id}")
             return deleted_count > 0
         except Exception as e:
             logger.error(f"Error deleting match {self.match_id}: {e}")
             return False
 
-    @database_sync_to_async
-    def handle_join_with_ip(self, fp, ip_address):
+    async def handle_join_with_ip(self, fp, ip_address):
+        if self.state.deleted:
+            return False
+        game_match = self.state.match
+        if fp not in (game_match.player_1_fingerprint, game_match.player_2_fingerprint):
+            await self.refresh_seats()
+        joined = await self.claim_seat(fp, ip_address)
+        if joined:
+            self.log_event(JOIN, self.state.player_number(fp), fp)
+        return joined
+
+    async def refresh_seats(self):
+        game_match = self.state.match
+        if game_match.game_mode == "online" and not self.state.deleted:
+            # the second seat is claimed over HTTP, pick it up once
+            await self.repository.refresh_match(game_match, [
+                "player_2_fingerprint", "player_2_ip_address",
+                "player_2_country", "player_2_city",
+            ])
+
+    async def claim_seat(self, fp, ip_address):
         try:
-            first_round = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id, 
-                round_number=1
-            ).first()
+            game_match = self.state.match
             
-            if not first_round or first_round.match_complete:
+            if game_match.match_complete:
                 logger.warning(f"Match {self.match_id} not found or complete")
                 return False
 
-            if not first_round.player_1_fingerprint:
-                first_round.player_1_fingerprint = fp
-                first_round.player_1_ip_address = ip_address
-                first_round.save()
+            if not game_match.player_1_fingerprint:
+                game_match.player_1_fingerprint = fp
+                game_match.player_1_ip_address = ip_address
+                await self.repository.save_match(game_match, ["player_1_fingerprint", "player_1_ip_address"])
                 logger.info(f"Set player 1 for match {self.match_id}: {fp} from IP {ip_address}")
                 return True
 
-            if first_round.player_1_fingerprint == fp:
+            if game_match.player_1_fingerprint == fp:
                 # Update IP if changed
-                if first_round.player_1_ip_address != ip_address:
-                    first_round.player_1_ip_address = ip_address
-                    first_round.save()
+                if game_match.player_1_ip_address != ip_address:
+                    game_match.player_1_ip_address = ip_address
+                    await self.repository.save_match(game_match, ["player_1_ip_address"])
                     logger.info(f"Updated IP for player 1 in match {self.match_id}: {ip_address}")
                 logger.info(f"Player 1 reconnected to match {self.match_id}: {fp}")
                 return True
 
-            if first_round.game_mode == "online":
-                if not first_round.player_2_fingerprint:
-                    if fp == first_round.player_1_fingerprint:
+            if game_match.game_mode == "online":
+                if not game_match.player_2_fingerprint:
+                    if fp == game_match.player_1_fingerprint:
                         logger.warning(f"Same player trying to join as both players: {fp}")
                         return False
-                    first_round.player_2_fingerprint = fp
-                    first_round.player_2_ip_address = ip_address
-                    first_round.save()
+                    game_match.player_2_fingerprint = fp
+                    game_match.player_2_ip_address = ip_address
+                    await self.repository.save_match(game_match, ["player_2_fingerprint", "player_2_ip_address"])
                     logger.info(f"Set player 2 for match {self.match_id}: {fp} from IP {ip_address}")
                     return True
-                elif first_round.player_2_fingerprint == fp:
+                elif game_match.player_2_fingerprint == fp:
                     # Update IP if changed
-                    if first_round.player_2_ip_address != ip_address:
-                        first_round.player_2_ip_address = ip_address
-                        first_round.save()
+                    if game_match.player_2_ip_address != ip_address:
+                        game_match.player_2_ip_address = ip_address
+                        await self.repository.save_match(game_match, ["player_2_ip_address"])
                         logger.info(f"Updated IP for player 2 in match {self.match_id}: {ip_address}")
                     logger.info(f"Player 2 reconnected to match {self.match_id}: {fp}")
                     return True
@@ -531,10 +519,10 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
                     logger.warning(f"Match {self.match_id} full")
                     return False
             else:  # bot mode
-                if first_round.player_2_fingerprint != "bot":
-                    first_round.player_2_fingerprint = "bot"
-                    first_round.player_2_ip_address = None
-                    first_round.save()
+                if game_match.player_2_fingerprint != "bot":
+                    game_match.player_2_fingerprint = "bot"
+                    game_match.player_2_ip_address = None
+                    await self.repository.save_match(game_match, ["player_2_fingerprint", "player_2_ip_address"])
                     logger.info(f"Set bot as player 2 for match {self.match_id}")
                 return True
             
@@ -543,42 +531,20 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error in handle_join_with_ip: {e}")
             return False
 
-    @database_sync_to_async
-    def handle_join(self, fp):
+    async def handle_join(self, fp):
         # This method is kept for backwards compatibility but uses the new IP-aware method
-        return self.handle_join_with_ip(fp, getattr(self, 'client_ip', 'unknown'))
+        return await self.actor.call(self.handle_join_with_ip, fp, getattr(self, 'client_ip', 'unknown'))
 
-    @database_sync_to_async
-    def get_current_round(self):
-        try:
-            rounds = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id
-            ).order_by('-round_number')
-            return rounds.first()
-        except Exception as e:
-            logger.error(f"Error getting current round: {e}")
-            return None
-
-    @database_sync_to_async
-    def process_offer(self, fp, offer_data):
+    async def process_offer(self, fp, offer_data):
         """
         Process offer with new structure that includes coins_to_keep and coins_to_offer
         offer_data should be: {"coins_to_keep": 30, "coins_to_offer": 70}
         """
         try:
-            current_round = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id
-            ).order_by('-round_number').first()
-            
-            if not current_round:
+            if self.state.deleted:
                 logger.warning(f"No current round found for match {self.match_id}")
                 return False
 
-            first_round = UltimatumGameRound.objects.get(
-                game_match_uuid=self.match_id, 
-                round_number=1
-            )
-
             # Validate that coins_to_keep + coins_to_offer = 100
             coins_to_keep = offer_data.get("coins_to_keep")
             coins_to_offer = offer_data.get("coins_to_offer")
@@ -591,206 +557,111 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
                 logger.warning(f"Invalid offer: coins_to_keep ({coins_to_keep}) + coins_to_offer ({coins_to_offer}) != 100")
                 return False
 
-            # Determine which player is making the offer
-            if fp == first_round.player_1_fingerprint:
-                if current_round.player_1_coins_to_offer is not None:
-                    logger.warning(f"Player 1 already made offer in round {current_round.round_number}")
-                    return False
-                current_round.player_1_coins_to_keep = coins_to_keep
-                current_round.player_1_coins_to_offer = coins_to_offer
-            elif fp == first_round.player_2_fingerprint:
-                if current_round.player_2_coins_to_offer is not None:
-                    logger.warning(f"Player 2 already made offer in round {current_round.round_number}")
-                    return False
-                current_round.player_2_coins_to_keep = coins_to_keep
-                current_round.player_2_coins_to_offer = coins_to_offer
-            else:
-                logger.warning(f"Unknown player {fp} trying to make offer")
+            current_round = self.state.record_offer(fp, coins_to_keep, coins_to_offer)
+            if current_round is None:
                 return False
+            self.log_event(MOVE, current_round.round_number, self.state.player_number(fp),
+                           coins_to_keep, coins_to_offer)
 
-            current_round.save()
+            # written with the rest of the round once it settles
             logger.info(f"Offer processed for player {fp}: keep={coins_to_keep}, offer={coins_to_offer}")
             return True
         except Exception as e:
             logger.error(f"Error processing offer: {e}")
             return False
 
-    @database_sync_to_async
-    def process_response(self, fp, target_player, response):
+    async def process_response(self, fp, target_player, response):
         try:
-            current_round = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id
-            ).order_by('-round_number').first()
-            
-            if not current_round:
+            if self.state.deleted:
                 logger.warning(f"No current round found for match {self.match_id}")
                 return False
 
-            first_round = UltimatumGameRound.objects.get(
-                game_match_uuid=self.match_id, 
-                round_number=1
-            )
-
-            # Player 1 responding to Player 2's offer
-            if fp == first_round.player_1_fingerprint and target_player == "player_2":
-                if current_round.player_2_coins_to_offer is None:
-                    logger.warning(f"Player 2 hasn't made offer yet")
-                    return False
-                if current_round.player_1_response_to_p2_offer is not None:
-                    logger.warning(f"Player 1 already responded to Player 2's offer")
-                    return False
-                current_round.player_1_response_to_p2_offer = response
-                
-            # Player 2 responding to Player 1's offer  
-            elif fp == first_round.player_2_fingerprint and target_player == "player_1":
-                if current_round.player_1_coins_to_offer is None:
-                    logger.warning(f"Player 1 hasn't made offer yet")
-                    return False
-                if current_round.player_2_response_to_p1_offer is not None:
-                    logger.warning(f"Player 2 already responded to Player 1's offer")
-                    return False
-                current_round.player_2_response_to_p1_offer = response
-            else:
-                logger.warning(f"Invalid response from {fp} to {target_player}")
+            current_round = self.state.record_response(fp, target_player, response)
+            if current_round is None:
                 return False
+            self.log_event(RESPONSE, current_round.round_number, self.state.player_number(fp), response)
 
-            current_round.save()
             logger.info(f"Response {response} processed for player {fp} responding to {target_player}")
             return True
         except Exception as e:
             logger.error(f"Error processing response: {e}")
             return False
 
-    @database_sync_to_async
-    def check_round_complete(self):
-        try:
-            current_round = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id
-            ).order_by('-round_number').first()
-            
-            if not current_round:
-                return False
-                
-            is_complete = current_round.is_round_complete()
-            
-            if is_complete:
-                logger.info(f"Round {current_round.round_number} complete in match {self.match_id}")
-            
-            return is_complete
-        except Exception as e:
-            logger.error(f"Error checking round complete: {e}")
-            return False
+    async def settle_round_if_complete(self):
+        """
+        Settle the current round once all offers and responses are in and
+        open the next one. Returns the round_results event, the
+        game_state_update events of the settled and the next round (None
+        after the last) and the settled round's game state for the socket
+        that settled it, None for everyone else. The events are numbered
+        here, so they go out in this order.
+        """
+        current_round = self.state.current_round
+        if (self.state.deleted or not current_round.is_round_complete()
+                or current_round.round_end):
+            return None
 
-    @database_sync_to_async
-    def calculate_round_results(self):
-        try:
-            current_round = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id
-            ).order_by('-round_number').first()
+        logger.info(f"Round complete in match {self.match_id}, calculating results...")
+        if not await self.calculate_round_results(current_round):
+            return None
+        self.log_event(ROUND_SETTLED, current_round.round_number,
+                       current_round.player_1_coins_made_in_round,
+                       current_round.player_2_coins_made_in_round)
+
+        summary = {
+            "round_number": current_round.round_number,
+            "p1_offer":    current_round.player_1_coins_to_offer,
+            "p2_offer":    current_round.player_2_coins_to_offer,
+            "p1_response": current_round.player_2_response_to_p1_offer,
+            "p2_response": current_round.player_1_response_to_p2_offer,
+            "p1_earned":   current_round.player_1_coins_made_in_round,
+            "p2_earned":   current_round.player_2_coins_made_in_round,
+        }
+        summary_event = {
+            "type": "round_results",
+            "summary": summary,
+            "seq": self.actor.next_sequence(),
+        }
+        gs = self.state.snapshot()
+        update = self.version_state(gs)
 
-            if not current_round:
-                return False
+        next_update = None
+        if not gs.get("gameOver"):
+            logger.info(f"Creating next round for match {self.match_id}")
+            if await self.create_next_round():
+                next_update = self.version_state(self.state.snapshot())
+        return summary_event, update, next_update, gs
 
-            # 1) write the numbers
-            update_game_stats(self.match_id, current_round.round_number)
-
-            # 🔥 2) pull the fresh values so p1_earned / p2_earned aren’t 0
-            current_round.refresh_from_db()          #  ← add this line
-
-            summary = {
-                "round_number": current_round.round_number,
-                "p1_offer":    current_round.player_1_coins_to_offer,
-                "p2_offer":    current_round.player_2_coins_to_offer,
-                "p1_response": current_round.player_2_response_to_p1_offer,
-                "p2_response": current_round.player_1_response_to_p2_offer,
-                "p1_earned":   current_round.player_1_coins_made_in_round,
-                "p2_earned":   current_round.player_2_coins_made_in_round,
-            }
-
-            # send to **every** socket in the match
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name,
-                {
-                    "type": "round_results",   # custom handler ↓
-                    "summary": summary,
-                },
-            )
+    async def calculate_round_results(self, current_round):
+        try:
+            await self.repository.settle_round(self.state.match, current_round, self.state.rounds)
             return True
         except Exception as e:
             logger.error(f"Error calculating round results: {e}")
             return False
+
+    def round_results_frame(self, event):
+        return {"round_results": event["summary"]}
+
     async def round_results(self, event):
         """Handle round results broadcast"""
         try:
-            # Add a small delay to ensure the client is ready
-            await asyncio.sleep(0.5)
-            
-            await self.send(text_data=json.dumps({
-                "round_results": event["summary"]
-            }))
-            logger.info(f"Sent round results for round {event['summary']['round_number']} to player {self.player_fingerprint}")
+            await self.forward_frame(event)
+            logger.info(f"Sent round results to player {self.player_fingerprint}")
         except Exception as e:
             logger.error(f"Error sending round results: {e}")
-    # @database_sync_to_async
-    # def calculate_round_results(self):
-    #     try:
-    #         current_round = UltimatumGameRound.objects.filter(
-    #             game_match_uuid=self.match_id
-    #         ).order_by('-round_number').first()
-            
-    #         if current_round:
-    #             update_game_stats(self.match_id, current_round.round_number)
-                
-    #             logger.info(f"Round results calculated for round {current_round.round_number} in match {self.match_id}")
-    #             return True
-    #         return False
-    #     except Exception as e:
-    #         logger.error(f"Error calculating round results: {e}")
-    #         return False
-
-    @database_sync_to_async
-    def create_next_round(self):
+
+    async def create_next_round(self):
         try:
-            current_round = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id
-            ).order_by('-round_number').first()
-            
-            if not current_round:
-                logger.error(f"No current round found for match {self.match_id}")
-                return False
+            current_round = self.state.current_round
                 
             if current_round.round_number >= 25:
                 logger.info(f"Match {self.match_id} complete - 25 rounds reached")
                 return False
-            
-            first_round = UltimatumGameRound.objects.get(
-                game_match_uuid=self.match_id, 
-                round_number=1
-            )
-            
-            next_round_num = current_round.round_number + 1
-            existing_next_round = UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id,
-                round_number=next_round_num
-            ).first()
-            
-            if existing_next_round:
-                logger.info(f"Round {next_round_num} already exists for match {self.match_id}")
-                return True
-            
-            next_round = UltimatumGameRound.objects.create(
-                game_match_uuid=self.match_id,
-                round_number=next_round_num,
-                game_mode=first_round.game_mode,
-                player_1_fingerprint=first_round.player_1_fingerprint,
-                player_2_fingerprint=first_round.player_2_fingerprint,
-                player_1_country=first_round.player_1_country,
-                player_1_city=first_round.player_1_city,
-                player_2_country=first_round.player_2_country,
-                player_2_city=first_round.player_2_city,
-                player_1_ip_address=first_round.player_1_ip_address,  # Copy IP addresses
-                player_2_ip_address=first_round.player_2_ip_address,
-            )
+
+            next_round, is_new = self.state.advance()
+            if is_new:
+                await self.repository.save_round(next_round)
             logger.info(f"Created round {next_round.round_number} for match {self.match_id}")
             return True
             
@@ -798,134 +669,116 @@ class UltimatumGameConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error creating next round: {e}")
             return False
 
-    @database_sync_to_async
-    def get_game_state(self):
+    async def get_game_state(self):
+        return await self.actor.call(self._snapshot)
+
+    async def _snapshot(self):
         try:
-            rounds = list(UltimatumGameRound.objects.filter(
-                game_match_uuid=self.match_id
-            ).order_by('round_number'))
-            
-            if not rounds:
+            if self.state.deleted:
                 return {"error": "No rounds found"}
-            
-            first_round = rounds[0]
-            current_round = rounds[-1]
-            
-            # Calculate totals from completed rounds
-            completed_rounds = [r for r in rounds if r.is_round_complete()]
-            
-            total_p1_score = sum(r.player_1_coins_made_in_round for r in completed_rounds)
-            total_p2_score = sum(r.player_2_coins_made_in_round for r in completed_rounds)
-            
-            # Build history with new fields
-            history = []
-            for r in completed_rounds:
-                history.append({
-                    "roundNumber": r.round_number,
-                    "player1CoinsToKeep": r.player_1_coins_to_keep,
-                    "player1CoinsToOffer": r.player_1_coins_to_offer,
-                    "player2CoinsToKeep": r.player_2_coins_to_keep,
-                    "player2CoinsToOffer": r.player_2_coins_to_offer,
-                    "player1ResponseToP2": r.player_1_response_to_p2_offer,
-                    "player2ResponseToP1": r.player_2_response_to_p1_offer,
-                    "player1Earned": r.player_1_coins_made_in_round,
-                    "player2Earned": r.player_2_coins_made_in_round,
-                })
-            
-            next_round = len(completed_rounds) + 1
-            game_over = current_round.match_complete or next_round > 25
-            waiting_for_opponent = (first_round.player_2_fingerprint is None and 
-                                  first_round.game_mode == "online")
-            
-            return {
-                "currentRound": min(next_round, 25),
-                "maxRounds": 25,
-                "player1Score": total_p1_score,
-                "player2Score": total_p2_score,
-                "roundHistory": history,
-                "waitingForOpponent": waiting_for_opponent,
-                "gameOver": game_over,
-                "gameMode": first_round.game_mode,
-                "player1Fingerprint": first_round.player_1_fingerprint,
-                "player2Fingerprint": first_round.player_2_fingerprint,
-                "currentRoundState": {
-                    "roundNumber": current_round.round_number,
-                    "player1OfferMade": current_round.player_1_coins_to_offer is not None,
-                    "player2OfferMade": current_round.player_2_coins_to_offer is not None,
-                    "player1ResponseMade": current_round.player_1_response_to_p2_offer is not None,
-                    "player2ResponseMade": current_round.player_2_response_to_p1_offer is not None,
-                    "player1CoinsToKeep": current_round.player_1_coins_to_keep,
-                    "player1CoinsToOffer": current_round.player_1_coins_to_offer,
-                    "player2CoinsToKeep": current_round.player_2_coins_to_keep,
-                    "player2CoinsToOffer": current_round.player_2_coins_to_offer,
-                    "player1Response": current_round.player_1_response_to_p2_offer,
-                    "player2Response": current_round.player_2_response_to_p1_offer,
-                }
-            }
+            return self.state.snapshot()
         except Exception as e:
             logger.error(f"Error getting game state: {e}")
             return {"error": f"Failed to get game state: {str(e)}"}
 
     # Bot helpers
-    async def handle_bot_offer_if_needed(self):
+    async def bot_owes_offer(self):
+        state = self.state
+        return (not state.deleted and state.match.game_mode == "bot" and
+                state.match.player_2_fingerprint == "bot" and
+                state.current_round.player_2_coins_to_offer is None)
+
+    async def offer_awaiting_bot(self):
+        """Player 1's offer the bot still has to answer, or None."""
+        state = self.state
+        current_round = state.current_round
+        if (not state.deleted and state.match.game_mode == "bot" and
+                state.match.player_2_fingerprint == "bot" and
+                current_round.player_1_coins_to_offer is not None and
+                current_round.player_2_response_to_p1_offer is None):
+            return current_round.player_1_coins_to_offer
+        return None
+
+    async def make_bot_offer(self):
+        """Record the bot's offer if it still owes one; returns (keep, offer) or None."""
+        if not await self.bot_owes_offer():
+            return None
+        coins_to_offer = random.randint(20, 50)
+        coins_to_keep = 100 - coins_to_offer
+        if not await self.process_offer("bot", {
+            "coins_to_keep": coins_to_keep,
+            "coins_to_offer": coins_to_offer
+        }):
+            return None
+        return coins_to_keep, coins_to_offer
+
+    async def make_bot_response(self):
+        """Answer player 1's offer if the bot still owes that; returns (offer, response) or None."""
+        player_1_offer = await self.offer_awaiting_bot()
+        if player_1_offer is None:
+            return None
+        # decided from the offer held in memory
+        response = "accept" if player_1_offer >= 30 else "reject"
+        if not await self.process_response("bot", "player_1", response):
+            return None
+        return player_1_offer, response
+
+    # Bot turns run from the timer wheel after BOT_THINKING_TIME, off the
+    # receive path, so the socket's next frames don't wait for the bot
+    def bot_turn_key(self, phase):
+        return (f"ultimatum:{self.match_id}", phase, None)
+
+    async def schedule_bot_offer(self):
+        if await self.actor.call(self.bot_owes_offer):
+            self.timers.schedule(self.bot_turn_key("bot_offer"), BOT_THINKING_TIME, self._bot_offer_turn)
+
+    async def schedule_bot_response(self):
+        if await self.actor.call(self.offer_awaiting_bot) is not None:
+            self.timers.schedule(self.bot_turn_key("bot_response"), BOT_THINKING_TIME,
+                                 self._bot_response_turn)
+
+    def cancel_bot_turns(self):
+        self.timers.cancel(self.bot_turn_key("bot_offer"))
+        self.timers.cancel(self.bot_turn_key("bot_response"))
+
+    async def _bot_offer_turn(self):
         try:
-            current_round = await self.get_current_round()
-            if (current_round and current_round.game_mode == "bot" and 
-                current_round.player_2_fingerprint == "bot" and 
-                current_round.player_2_coins_to_offer is None):
-                
-                await asyncio.sleep(1.0)  # Bot thinking time
-                coins_to_offer = random.randint(20, 50)
-                coins_to_keep = 100 - coins_to_offer
-                
-                offer_data = {
-                    "coins_to_keep": coins_to_keep,
-                    "coins_to_offer": coins_to_offer
-                }
-                
-                if await self.process_offer("bot", offer_data):
-                    await self.channel_layer.group_send(self.room_group_name, {
-                        "type": "game_action",
-                        "player_fingerprint": "bot",
-                        "action": "make_offer",
-                        "coins_to_keep": coins_to_keep,
-                        "coins_to_offer": coins_to_offer,
-                    })
-                    logger.info(f"Bot made offer: keep={coins_to_keep}, offer={coins_to_offer}")
-                    
-                    # Check if both offers are now made (human + bot)
-                    updated_round = await self.get_current_round()
-                    if (updated_round and 
-                        updated_round.player_1_coins_to_offer is not None and 
-                        updated_round.player_2_coins_to_offer is not None):
-                        logger.info(f"Both offers made (including bot) in match {self.match_id}, starting response timeout")
-                        await self.start_response_timeout()
-                        
+            made = await self.actor.call(self.make_bot_offer)
+            if made is None:
+                return
+            coins_to_keep, coins_to_offer = made
+            await self.group_publish({
+                "type": "game_action",
+                "player_fingerprint": "bot",
+                "action": "make_offer",
+                "coins_to_keep": coins_to_keep,
+                "coins_to_offer": coins_to_offer,
+            })
+            logger.info(f"Bot made offer: keep={coins_to_keep}, offer={coins_to_offer}")
+
+            # Check if both offers are now made (human + bot)
+            if await self.actor.call(self.both_offers_made):
+                logger.info(f"Both offers made (including bot) in match {self.match_id}, starting response timeout")
+                await self.start_response_timeout()
         except Exception as e:
             logger.error(f"Error making bot offer: {e}")
 
-    async def handle_bot_response_if_needed(self):
+    async def _bot_response_turn(self):
         try:
-            current_round = await self.get_current_round()
-            if (current_round and current_round.game_mode == "bot" and 
-                current_round.player_2_fingerprint == "bot"):
-                
-                # Bot responds to player 1's offer
-                if (current_round.player_1_coins_to_offer is not None and 
-                    current_round.player_2_response_to_p1_offer is None):
-                    
-                    await asyncio.sleep(1.0)  # Bot thinking time
-                    response = "accept" if current_round.player_1_coins_to_offer >= 30 else "reject"
-                    
-                    if await self.process_response("bot", "player_1", response):
-                        await self.cancel_response_timeout()
-                        await self.channel_layer.group_send(self.room_group_name, {
-                            "type": "game_action",
-                            "player_fingerprint": "bot",
-                            "action": "respond_to_offer",
-                            "target_player": "player_1",
-                            "response": response,
-                        })
-                        logger.info(f"Bot responded {response} to player 1's offer {current_round.player_1_coins_to_offer}")
+            made = await self.actor.call(self.make_bot_response)
+            if made is None:
+                return
+            player_1_offer, response = made
+            await self.group_publish({
+                "type": "game_action",
+                "player_fingerprint": "bot",
+                "action": "respond_to_offer",
+                "target_player": "player_1",
+                "response": response,
+            })
+            logger.info(f"Bot responded {response} to player 1's offer {player_1_offer}")
+
+            # the human may have answered first, then the bot completes the round
+            await self.settle_and_broadcast()
         except Exception as e:
-            logger.error(f"Error making bot response: {e}")
\ No newline at end of file
+            logger.error(f"Error making bot response: {e}")
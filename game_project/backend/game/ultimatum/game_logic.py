@@ -1,5 +1,9 @@
-from .models import UltimatumGameRound
+import logging
+from .models import UltimatumGameRound, UltimatumMatch, UltimatumMatchSummary
 from django.utils import timezone
+from game.event_log import MOVE, RESPONSE
+
+logger = logging.getLogger(__name__)
 
 def calculate_simultaneous_payoff(p1_coins_to_keep, p1_coins_to_offer, p2_coins_to_keep, p2_coins_to_offer, p1_response, p2_response):
 
@@ -38,21 +42,44 @@ def calculate_simultaneous_payoff(p1_coins_to_keep, p1_coins_to_offer, p2_coins_
 #     p2_total = p2_keep + p2_extra
 
     return p1_total, p2_total, p1_total + p2_total
-def calculate_match_statistics(match_uuid, current_round_number):
-    """Calculate acceptance rates and average offers for the match"""
-    completed_rounds = UltimatumGameRound.objects.filter(
-        game_match_uuid=match_uuid,
-        round_number__lte=current_round_number,
-        player_1_coins_to_offer__isnull=False,
-        player_2_coins_to_offer__isnull=False,
-        player_1_response_to_p2_offer__isnull=False,
-        player_2_response_to_p1_offer__isnull=False
-    ).order_by('round_number')
-    
-    if not completed_rounds.exists():
+MATCH_RESULT_FIELDS = [
+    'match_complete',
+    'match_completed_at',
+    'player_1_final_score',
+    'player_2_final_score',
+    'match_acceptance_rate',
+    'match_average_offer',
+]
+
+MATCH_TOTALS_FIELDS = [
+    'stats_through_round',
+    'completed_rounds',
+    'accepted_responses',
+    'offered_coins',
+    'player_1_coins',
+    'player_2_coins',
+]
+
+def initialize_rounds(game_matches):
+    """
+    Insert all 25 (empty) round rows of the given matches in one statement,
+    so playing a round only ever updates its row.
+    """
+    UltimatumGameRound.objects.bulk_create([
+        UltimatumGameRound(match=game_match, round_number=round_number)
+        for game_match in game_matches
+        for round_number in range(1, 26)
+    ], batch_size=1000)
+
+def summarize_rounds(completed_rounds, current_round_number):
+    """
+    Acceptance rates and average offers counted over all the given rounds
+    (the ones with both offers and responses, up to the current round).
+    """
+    if not completed_rounds:
         return 0, 0, 0, 0
     
-    total_rounds = completed_rounds.count()
+    total_rounds = len(completed_rounds)
     total_possible_accepts = total_rounds * 2
     
     # Count actual acceptances
@@ -70,7 +97,9 @@ def calculate_match_statistics(match_uuid, current_round_number):
     match_average_offer = total_offers / (total_rounds * 2) if total_rounds > 0 else 0
     
     # Current round stats
-    current_round = completed_rounds.filter(round_number=current_round_number).first()
+    current_round = next(
+        (r for r in completed_rounds if r.round_number == current_round_number), None
+    )
     if current_round:
         current_accepts = 0
         if current_round.player_1_response_to_p2_offer == 'accept':
@@ -86,19 +115,82 @@ def calculate_match_statistics(match_uuid, current_round_number):
     
     return round_acceptance, match_acceptance_rate, round_offer, match_average_offer
 
-def update_game_stats(match_uuid, round_number):
-    """Update game statistics after each completed round"""
-    try:
-        current_round = UltimatumGameRound.objects.get(
-            game_match_uuid=match_uuid,
-            round_number=round_number
-        )
-    except UltimatumGameRound.DoesNotExist:
-        return
+def reset_match_totals(game_match):
+    for field in MATCH_TOTALS_FIELDS:
+        setattr(game_match, field, 0)
+
+def accumulate_round(game_match, round_obj):
+    """Fold a settled round into the running totals of its match (in memory)."""
+    game_match.stats_through_round = round_obj.round_number
+    game_match.player_1_coins += round_obj.player_1_coins_made_in_round
+    game_match.player_2_coins += round_obj.player_2_coins_made_in_round
+
+    if round_obj.is_round_complete():
+        game_match.completed_rounds += 1
+        if round_obj.player_1_response_to_p2_offer == 'accept':
+            game_match.accepted_responses += 1
+        if round_obj.player_2_response_to_p1_offer == 'accept':
+            game_match.accepted_responses += 1
+        game_match.offered_coins += round_obj.player_1_coins_to_offer + round_obj.player_2_coins_to_offer
+
+def rebuild_match_totals(game_match, previous_rounds):
+    """Recompute the running totals from the rows, for when they are not current"""
+    reset_match_totals(game_match)
+    for round_obj in sorted(previous_rounds, key=lambda r: r.round_number):
+        accumulate_round(game_match, round_obj)
+
+def round_statistics(game_match, round_obj):
+    """
+    The statistics of summarize_rounds, from the running totals once
+    round_obj has been folded in – constant time at any round.
+    """
+    if not game_match.completed_rounds:
+        return 0, 0, 0, 0
+
+    total_possible_accepts = game_match.completed_rounds * 2
+    match_acceptance_rate = (game_match.accepted_responses / total_possible_accepts) * 100
+    match_average_offer = game_match.offered_coins / total_possible_accepts
+
+    current_accepts = 0
+    if round_obj.player_1_response_to_p2_offer == 'accept':
+        current_accepts += 1
+    if round_obj.player_2_response_to_p1_offer == 'accept':
+        current_accepts += 1
+    round_acceptance = (current_accepts / 2) * 100
+    round_offer = (round_obj.player_1_coins_to_offer + round_obj.player_2_coins_to_offer) / 2
+
+    return round_acceptance, match_acceptance_rate, round_offer, match_average_offer
+
+def settle_round_stats(game_match, round_number, rounds=None):
+    """
+    Compute the payoffs and statistics of a completed round onto its row
+    and the match's running totals, in memory. Returns the row, None if
+    the round is missing or not complete.
+
+    Round N's statistics come from the match's running totals through
+    round N-1, so nothing is summed over the earlier rounds. The totals
+    are only recomputed from the rows when they are not current (the
+    match was just loaded or a round is settled again).
+
+    `rounds` are the match's rows as held in memory by the consumer; with
+    them nothing is read back.
+    """
+    if rounds is None:
+        try:
+            current_round = UltimatumGameRound.objects.get(
+                match=game_match,
+                round_number=round_number
+            )
+        except UltimatumGameRound.DoesNotExist:
+            return
+    else:
+        current_round = next((r for r in rounds if r.round_number == round_number), None)
+        if current_round is None:
+            return None
     
     # Check if round is complete
     if not current_round.is_round_complete():
-        return
+        return None
     
     p1_coins, p2_coins, total_coins = calculate_simultaneous_payoff(
         current_round.player_1_coins_to_keep,
@@ -109,67 +201,109 @@ def update_game_stats(match_uuid, round_number):
         current_round.player_2_response_to_p1_offer
     )
     
-    # Log the payoff calculation for debugging
-    print(f"[update_game_stats] Round {round_number} payoff calculation:")
-    print(f"  P1: keep={current_round.player_1_coins_to_keep}, offer={current_round.player_1_coins_to_offer}, response_to_p2={current_round.player_1_response_to_p2_offer}")
-    print(f"  P2: keep={current_round.player_2_coins_to_keep}, offer={current_round.player_2_coins_to_offer}, response_to_p1={current_round.player_2_response_to_p1_offer}")
-    print(f"  Result: P1 gets {p1_coins}, P2 gets {p2_coins}, Total: {total_coins}")
+    logger.debug(
+        "Round %s of %s: P1 keep=%s offer=%s response=%s, P2 keep=%s offer=%s response=%s "
+        "-> P1 %s, P2 %s, total %s", round_number, game_match.game_match_uuid,
+        current_round.player_1_coins_to_keep, current_round.player_1_coins_to_offer,
+        current_round.player_1_response_to_p2_offer, current_round.player_2_coins_to_keep,
+        current_round.player_2_coins_to_offer, current_round.player_2_response_to_p1_offer,
+        p1_coins, p2_coins, total_coins,
+    )
     
     current_round.player_1_coins_made_in_round = p1_coins
     current_round.player_2_coins_made_in_round = p2_coins
     current_round.players_sum_coins_in_round = total_coins
     current_round.round_end = timezone.now().strftime('%Y-%m-%d %H:%M')
     
+    if game_match.stats_through_round != round_number - 1:
+        if rounds is None:
+            previous_rounds = UltimatumGameRound.objects.filter(
+                match=game_match,
+                round_number__lt=round_number
+            )
+        else:
+            previous_rounds = [r for r in rounds if r.round_number < round_number]
+        rebuild_match_totals(game_match, previous_rounds)
+    accumulate_round(game_match, current_round)
+
     # Calculate cumulative scores
-    previous_rounds = UltimatumGameRound.objects.filter(
-        game_match_uuid=match_uuid,
-        round_number__lt=round_number
-    )
-    
-    p1_cumulative = sum(r.player_1_coins_made_in_round for r in previous_rounds) + p1_coins
-    p2_cumulative = sum(r.player_2_coins_made_in_round for r in previous_rounds) + p2_coins
+    p1_cumulative = game_match.player_1_coins
+    p2_cumulative = game_match.player_2_coins
     total_cumulative = p1_cumulative + p2_cumulative
-    
+
     current_round.round_player_1_cumulative_score = p1_cumulative
     current_round.round_player_2_cumulative_score = p2_cumulative
     current_round.players_sum_coins_total = total_cumulative
-    
+
     # Calculate statistics
-    (round_acceptance, match_acceptance, 
-     round_offer, match_offer) = calculate_match_statistics(match_uuid, round_number)
+    round_acceptance, match_acceptance, round_offer, match_offer = round_statistics(
+        game_match, current_round
+    )
     
     current_round.round_acceptance_rate = round_acceptance
     current_round.match_acceptance_rate = match_acceptance
     current_round.round_average_offer = round_offer
     current_round.match_average_offer = match_offer
-    
+
+    logger.debug("Round %s of %s settled, cumulative P1=%s P2=%s",
+                 round_number, game_match.game_match_uuid, p1_cumulative, p2_cumulative)
+    return current_round
+
+def update_game_stats(game_match, round_number, rounds=None):
+    """
+    Update game statistics after each completed round (settle_round_stats)
+    and write them: the settled round in a single UPDATE, offers and
+    responses included. The match row is only written with the last round.
+    """
+    current_round = settle_round_stats(game_match, round_number, rounds)
+    if current_round is None:
+        return
+
+    current_round.save()
+
     # Check if game is complete
     if round_number >= 25:
-        current_round.match_complete = True
-        current_round.match_completed_at = timezone.now().strftime('%Y-%m-%d %H:%M')
-        current_round.player_1_final_score = p1_cumulative
-        current_round.player_2_final_score = p2_cumulative
-        
-        UltimatumGameRound.objects.filter(game_match_uuid=match_uuid).update(
-            match_complete=True,
-            match_completed_at=current_round.match_completed_at,
-            player_1_final_score=p1_cumulative,
-            player_2_final_score=p2_cumulative,
-            match_acceptance_rate=match_acceptance,
-            match_average_offer=match_offer
-        )
-    
-    current_round.save()
-    
-    print(f"[update_game_stats] Round {round_number} completed. Cumulative scores: P1={p1_cumulative}, P2={p2_cumulative}")
+        game_match.match_complete = True
+        game_match.match_completed_at = timezone.now().strftime('%Y-%m-%d %H:%M')
+        game_match.player_1_final_score = game_match.player_1_coins
+        game_match.player_2_final_score = game_match.player_2_coins
+        game_match.match_acceptance_rate = current_round.match_acceptance_rate
+        game_match.match_average_offer = current_round.match_average_offer
+        game_match.save(update_fields=MATCH_RESULT_FIELDS + MATCH_TOTALS_FIELDS)
+        # a finished match never changes again, match_stats serves this row
+        UltimatumMatchSummary.store(game_match)
+
+def rounds_from_events(events):
+    """
+    The rounds of a match rebuilt from its event log (UltimatumMatchEvent.history),
+    with the payoffs and statistics of every completed round. Nothing is saved.
+    """
+    rounds = {}
+    for event in events:
+        if event.kind not in (MOVE, RESPONSE):
+            continue
+        values = event.values
+        round_obj = rounds.setdefault(values['round'], UltimatumGameRound(round_number=values['round']))
+        player = values['player']
+        if event.kind == MOVE:
+            setattr(round_obj, f'player_{player}_coins_to_keep', values['coins_to_keep'])
+            setattr(round_obj, f'player_{player}_coins_to_offer', values['coins_to_offer'])
+        else:
+            other = 2 if player == 1 else 1
+            setattr(round_obj, f'player_{player}_response_to_p{other}_offer', values['response'])
+
+    rebuilt = [rounds[round_number] for round_number in sorted(rounds)]
+    game_match = UltimatumMatch()     # running totals only
+    for round_obj in rebuilt:
+        settle_round_stats(game_match, round_obj.round_number, rebuilt)
+    return rebuilt
 
 def cleanup_incomplete_matches():
     """Clean up incomplete matches"""
-    match_uuids = UltimatumGameRound.objects.values_list('game_match_uuid', flat=True).distinct()
     deleted_count = 0
     
-    for match_uuid in match_uuids:
-        if UltimatumGameRound.delete_incomplete_match(match_uuid):
+    for game_match in UltimatumMatch.objects.filter(match_complete=False):
+        if game_match.delete_if_incomplete():
             deleted_count += 1
     
     return deleted_count
\ No newline at end of file
@@ -0,0 +1,119 @@
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ultimatum.game_logic import calculate_simultaneous_payoff, summarize_rounds
+from ultimatum.models import UltimatumMatch
+
+STATISTICS = ['round_acceptance_rate', 'match_acceptance_rate',
+              'round_average_offer', 'match_average_offer']
+
+
+def counts_for_statistics(round_obj):
+    """The rows summarize_rounds counts: both offers and both responses made"""
+    return (round_obj.player_1_coins_to_offer is not None and
+            round_obj.player_2_coins_to_offer is not None and
+            round_obj.player_1_response_to_p2_offer is not None and
+            round_obj.player_2_response_to_p1_offer is not None)
+
+
+class Command(BaseCommand):
+    help = ("Check the statistics stored with every settled Ultimatum round, and "
+            "the totals of finished matches, against a full recomputation")
+
+    def add_arguments(self, parser):
+        parser.add_argument('match_ids', nargs='*', help='Only verify these match uuids')
+        parser.add_argument('--complete-only', action='store_true',
+                            help='Skip matches that are still in progress')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Print at most this many mismatches (default 20)')
+
+    def handle(self, *args, **options):
+        matches = UltimatumMatch.objects.all().order_by('id')
+        if options['match_ids']:
+            matches = matches.filter(game_match_uuid__in=options['match_ids'])
+        if options['complete_only']:
+            matches = matches.filter(match_complete=True)
+
+        match_count = round_count = 0
+        mismatches = []
+        for game_match in matches.iterator(chunk_size=500):
+            rounds, problems = self.verify_match(game_match)
+            match_count += 1
+            round_count += rounds
+            mismatches.extend(problems)
+
+        for problem in mismatches[:options['show']]:
+            self.stdout.write(problem)
+        if len(mismatches) > options['show']:
+            self.stdout.write(f"... and {len(mismatches) - options['show']} more")
+
+        summary = f"Verified {round_count} rounds across {match_count} matches"
+        if mismatches:
+            raise CommandError(f"{summary}: {len(mismatches)} mismatches")
+        self.stdout.write(self.style.SUCCESS(f"{summary}: no mismatches"))
+
+    @staticmethod
+    def compare(label, stored, recomputed, problems):
+        for name, value in recomputed.items():
+            if not math.isclose(stored[name], value, abs_tol=1e-9):
+                problems.append(f"{label}: stored {name}={stored[name]} recomputed={value}")
+
+    def verify_match(self, game_match):
+        """
+        Recompute every settled round of one match from its moves and compare
+        with the values the live path stored; returns (rounds checked,
+        mismatch descriptions).
+        """
+        rounds = list(game_match.rounds.order_by('round_number'))
+        problems = []
+        checked = accepted = offered = p1_total = p2_total = 0
+        last_settled = recomputed = None
+
+        for index, round_obj in enumerate(rounds):
+            if not (round_obj.round_end and round_obj.is_round_complete()):
+                continue
+            checked += 1
+            last_settled = round_obj
+            p1_coins, p2_coins, coins = calculate_simultaneous_payoff(
+                round_obj.player_1_coins_to_keep, round_obj.player_1_coins_to_offer,
+                round_obj.player_2_coins_to_keep, round_obj.player_2_coins_to_offer,
+                round_obj.player_1_response_to_p2_offer, round_obj.player_2_response_to_p1_offer,
+            )
+            p1_total += p1_coins
+            p2_total += p2_coins
+            accepted += [round_obj.player_1_response_to_p2_offer,
+                         round_obj.player_2_response_to_p1_offer].count('accept')
+            offered += round_obj.player_1_coins_to_offer + round_obj.player_2_coins_to_offer
+
+            # what update_game_stats used to do: sum and re-count everything so far
+            recomputed = dict(zip(STATISTICS, summarize_rounds(
+                [r for r in rounds[:index + 1] if counts_for_statistics(r)],
+                round_obj.round_number,
+            )))
+            recomputed.update(
+                player_1_coins_made_in_round=p1_coins,
+                player_2_coins_made_in_round=p2_coins,
+                players_sum_coins_in_round=coins,
+                round_player_1_cumulative_score=p1_total,
+                round_player_2_cumulative_score=p2_total,
+                players_sum_coins_total=p1_total + p2_total,
+            )
+            self.compare(f"{game_match.game_match_uuid} round {round_obj.round_number}",
+                         vars(round_obj), recomputed, problems)
+
+        # a finished match stores its totals and results with the last round
+        if game_match.match_complete and last_settled is not None:
+            self.compare(game_match.game_match_uuid, vars(game_match), {
+                'stats_through_round': last_settled.round_number,
+                'completed_rounds': checked,
+                'accepted_responses': accepted,
+                'offered_coins': offered,
+                'player_1_coins': p1_total,
+                'player_2_coins': p2_total,
+                'player_1_final_score': p1_total,
+                'player_2_final_score': p2_total,
+                'match_acceptance_rate': recomputed['match_acceptance_rate'],
+                'match_average_offer': recomputed['match_average_offer'],
+            }, problems)
+        return checked, problems
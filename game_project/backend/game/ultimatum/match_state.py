@@ -0,0 +1,211 @@
+import logging
+from django.utils import timezone
+from .models import UltimatumGameRound
+
+logger = logging.getLogger(__name__)
+
+MAX_ROUNDS = 25
+
+
+class UltimatumMatchState:
+    """
+    In-memory view of a live Ultimatum match, owned by its match actor.
+
+    Holds the match and its round rows read once at load time. Offers,
+    responses and the checks behind timeouts and bot turns are answered
+    from here; a round is written back once, when it settles. All 25 rounds
+    are inserted with the match (game_logic.initialize_rounds), so moving
+    on to the next round is only a pointer bump.
+    """
+
+    def __init__(self, game_match, rounds):
+        self.match = game_match
+        self.rounds = rounds                # UltimatumGameRound by round_number
+        self.deleted = False
+        # the open round: the first one not settled yet, the last once all are
+        self.current_index = next(
+            (i for i, r in enumerate(rounds) if not r.round_end), len(rounds) - 1
+        )
+        if rounds and not self.current_round.round_start:
+            self.current_round.round_start = timezone.now().strftime('%Y-%m-%d %H:%M')
+
+    @property
+    def match_id(self):
+        return self.match.game_match_uuid
+
+    @property
+    def match_pk(self):
+        return self.match.pk
+
+    @property
+    def current_round(self):
+        return self.rounds[self.current_index]
+
+    def completed_rounds(self):
+        return [r for r in self.rounds if r.is_round_complete()]
+
+    def is_complete(self):
+        return (self.match.match_complete
+                or len(self.completed_rounds()) >= MAX_ROUNDS)
+
+    def player_number(self, fp):
+        if fp == self.match.player_1_fingerprint:
+            return 1
+        if fp == self.match.player_2_fingerprint:
+            return 2
+        return None
+
+    def both_offers_made(self):
+        rnd = self.current_round
+        return (rnd.player_1_coins_to_offer is not None and
+                rnd.player_2_coins_to_offer is not None)
+
+    def owes_offer(self, fp):
+        rnd = self.current_round
+        number = self.player_number(fp)
+        return ((number == 1 and rnd.player_1_coins_to_offer is None) or
+                (number == 2 and rnd.player_2_coins_to_offer is None))
+
+    def owes_response(self, fp):
+        if not self.both_offers_made():
+            return False
+        rnd = self.current_round
+        number = self.player_number(fp)
+        return ((number == 1 and rnd.player_1_response_to_p2_offer is None) or
+                (number == 2 and rnd.player_2_response_to_p1_offer is None))
+
+    # ──────────────────────── mutations ─────────────────────────
+    def record_offer(self, fp, coins_to_keep, coins_to_offer):
+        """Store an offer on the current round. Returns the touched round or None."""
+        rnd = self.current_round
+        number = self.player_number(fp)
+        if number == 1:
+            if rnd.player_1_coins_to_offer is not None:
+                logger.warning(f"Player 1 already made offer in round {rnd.round_number}")
+                return None
+            rnd.player_1_coins_to_keep = coins_to_keep
+            rnd.player_1_coins_to_offer = coins_to_offer
+        elif number == 2:
+            if rnd.player_2_coins_to_offer is not None:
+                logger.warning(f"Player 2 already made offer in round {rnd.round_number}")
+                return None
+            rnd.player_2_coins_to_keep = coins_to_keep
+            rnd.player_2_coins_to_offer = coins_to_offer
+        else:
+            logger.warning(f"Unknown player {fp} trying to make offer")
+            return None
+        return rnd
+
+    def record_response(self, fp, target_player, response):
+        """Store a response on the current round. Returns the touched round or None."""
+        rnd = self.current_round
+        number = self.player_number(fp)
+
+        # Player 1 responding to Player 2's offer
+        if number == 1 and target_player == "player_2":
+            if rnd.player_2_coins_to_offer is None:
+                logger.warning(f"Player 2 hasn't made offer yet")
+                return None
+            if rnd.player_1_response_to_p2_offer is not None:
+                logger.warning(f"Player 1 already responded to Player 2's offer")
+                return None
+            rnd.player_1_response_to_p2_offer = response
+
+        # Player 2 responding to Player 1's offer
+        elif number == 2 and target_player == "player_1":
+            if rnd.player_1_coins_to_offer is None:
+                logger.warning(f"Player 1 hasn't made offer yet")
+                return None
+            if rnd.player_2_response_to_p1_offer is not None:
+                logger.warning(f"Player 2 already responded to Player 1's offer")
+                return None
+            rnd.player_2_response_to_p1_offer = response
+        else:
+            logger.warning(f"Invalid response from {fp} to {target_player}")
+            return None
+        return rnd
+
+    def build_round(self, round_number):
+        """Build (unsaved) a round of this match."""
+        return UltimatumGameRound(match=self.match, round_number=round_number)
+
+    def advance(self):
+        """
+        Open the round after the current one. Returns (round, is_new); a new
+        round (matches from before the rounds were pre-allocated) still
+        needs its INSERT.
+        """
+        is_new = self.current_index + 1 >= len(self.rounds)
+        if is_new:
+            self.rounds.append(self.build_round(self.current_round.round_number + 1))
+        self.current_index += 1
+        rnd = self.current_round
+        if not rnd.round_start:
+            rnd.round_start = timezone.now().strftime('%Y-%m-%d %H:%M')
+        return rnd, is_new
+
+    # ─────────────── assemble state for the client ───────────────
+    def snapshot(self):
+        game_match = self.match
+        current_round = self.current_round
+
+        # Calculate totals from completed rounds
+        completed_rounds = self.completed_rounds()
+
+        total_p1_score = sum(r.player_1_coins_made_in_round for r in completed_rounds)
+        total_p2_score = sum(r.player_2_coins_made_in_round for r in completed_rounds)
+
+        history = []
+        for r in completed_rounds:
+            history.append({
+                "roundNumber": r.round_number,
+                "player1CoinsToKeep": r.player_1_coins_to_keep,
+                "player1CoinsToOffer": r.player_1_coins_to_offer,
+                "player2CoinsToKeep": r.player_2_coins_to_keep,
+                "player2CoinsToOffer": r.player_2_coins_to_offer,
+                "player1ResponseToP2": r.player_1_response_to_p2_offer,
+                "player2ResponseToP1": r.player_2_response_to_p1_offer,
+                "player1Earned": r.player_1_coins_made_in_round,
+                "player2Earned": r.player_2_coins_made_in_round,
+            })
+
+        next_round = len(completed_rounds) + 1
+        game_over = game_match.match_complete or next_round > MAX_ROUNDS
+        waiting_for_opponent = (game_match.player_2_fingerprint is None and
+                                game_match.game_mode == "online")
+
+        return {
+            "currentRound": min(next_round, MAX_ROUNDS),
+            "maxRounds": MAX_ROUNDS,
+            "player1Score": total_p1_score,
+            "player2Score": total_p2_score,
+            "roundHistory": history,
+            "waitingForOpponent": waiting_for_opponent,
+            "gameOver": game_over,
+            "gameMode": game_match.game_mode,
+            "player1Fingerprint": game_match.player_1_fingerprint,
+            "player2Fingerprint": game_match.player_2_fingerprint,
+            "currentRoundState": {
+                "roundNumber": current_round.round_number,
+                "player1OfferMade": current_round.player_1_coins_to_offer is not None,
+                "player2OfferMade": current_round.player_2_coins_to_offer is not None,
+                "player1ResponseMade": current_round.player_1_response_to_p2_offer is not None,
+                "player2ResponseMade": current_round.player_2_response_to_p1_offer is not None,
+                "player1CoinsToKeep": current_round.player_1_coins_to_keep,
+                "player1CoinsToOffer": current_round.player_1_coins_to_offer,
+                "player2CoinsToKeep": current_round.player_2_coins_to_keep,
+                "player2CoinsToOffer": current_round.player_2_coins_to_offer,
+                "player1Response": current_round.player_1_response_to_p2_offer,
+                "player2Response": current_round.player_2_response_to_p1_offer,
+            }
+        }
+
+
+async def load_match_state(repository, match_id):
+    """Read a match and its rounds once; None if the match does not exist."""
+    game_match, rounds = await repository.load_match(match_id)
+    if game_match is None or not rounds:
+        return None
+    for r in rounds:
+        r.match = game_match        # share one match instance, no lazy FK reads
+    return UltimatumMatchState(game_match, rounds)
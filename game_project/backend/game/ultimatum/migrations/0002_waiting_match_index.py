@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ultimatumgameround',
+            index=models.Index(condition=models.Q(('match_complete', False), ('player_2_fingerprint__isnull', True), ('round_number', 1)), fields=['game_mode', 'row_number'], name='ultimatum_waiting_idx'),
+        ),
+    ]
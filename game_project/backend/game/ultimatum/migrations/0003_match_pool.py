@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0002_waiting_match_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ultimatumgameround',
+            name='ultimatum_waiting_idx',
+        ),
+        migrations.AddField(
+            model_name='ultimatumgameround',
+            name='is_pooled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='ultimatumgameround',
+            index=models.Index(condition=models.Q(('is_pooled', False), ('match_complete', False), ('player_2_fingerprint__isnull', True), ('round_number', 1)), fields=['game_mode', 'row_number'], name='ultimatum_waiting_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ultimatumgameround',
+            index=models.Index(condition=models.Q(('is_pooled', True)), fields=['game_mode', 'row_number'], name='ultimatum_pooled_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0003_match_pool'),
+    ]
+
+    operations = [
+        # rounds are unique per match from 0006 on
+        migrations.AlterUniqueTogether(
+            name='ultimatumgameround',
+            unique_together=set(),
+        ),
+        migrations.RemoveIndex(
+            model_name='ultimatumgameround',
+            name='ultimatum_waiting_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ultimatumgameround',
+            name='ultimatum_pooled_idx',
+        ),
+        migrations.CreateModel(
+            name='UltimatumMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_match_uuid', models.CharField(max_length=8, unique=True)),
+                ('game_mode', models.CharField(choices=[('online', 'Online'), ('bot', 'Bot')], default='online', max_length=10)),
+                ('player_1_fingerprint', models.CharField(max_length=255)),
+                ('player_2_fingerprint', models.CharField(blank=True, max_length=255, null=True)),
+                ('player_1_country', models.CharField(default='Unknown', max_length=100)),
+                ('player_1_city', models.CharField(default='Unknown', max_length=100)),
+                ('player_2_country', models.CharField(blank=True, default='Unknown', max_length=100, null=True)),
+                ('player_2_city', models.CharField(blank=True, default='Unknown', max_length=100, null=True)),
+                ('player_1_ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('player_2_ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('player_1_final_score', models.IntegerField(default=0)),
+                ('player_2_final_score', models.IntegerField(default=0)),
+                ('match_acceptance_rate', models.FloatField(default=0)),
+                ('match_average_offer', models.FloatField(default=0)),
+                ('created_at', models.CharField(blank=True, max_length=50, null=True)),
+                ('match_completed_at', models.CharField(blank=True, max_length=50, null=True)),
+                ('match_complete', models.BooleanField(default=False)),
+                ('is_pooled', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ultimatummatch',
+            index=models.Index(condition=models.Q(('is_pooled', False), ('match_complete', False), ('player_2_fingerprint__isnull', True)), fields=['game_mode', 'id'], name='ultimatum_waiting_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ultimatummatch',
+            index=models.Index(condition=models.Q(('is_pooled', True)), fields=['game_mode', 'id'], name='ultimatum_pooled_idx'),
+        ),
+        # moving to the match in 0005; nullable so 0006 can be reversed
+        migrations.AlterField(
+            model_name='ultimatumgameround',
+            name='game_match_uuid',
+            field=models.CharField(db_index=True, max_length=8, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ultimatumgameround',
+            name='player_1_fingerprint',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='ultimatumgameround',
+            name='match',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rounds', to='ultimatum.ultimatummatch'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:10
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# columns that move from every round row to the match
+IDENTITY_COLUMNS = [
+    'game_mode',
+    'player_1_fingerprint', 'player_2_fingerprint',
+    'player_1_country', 'player_1_city',
+    'player_2_country', 'player_2_city',
+    'player_1_ip_address', 'player_2_ip_address',
+    'is_pooled',
+]
+RESULT_COLUMNS = [
+    'player_1_final_score', 'player_2_final_score',
+    'match_complete', 'match_completed_at',
+]
+BATCH_SIZE = 1000       # matches inserted at a time
+
+
+def move_match_data(apps, schema_editor):
+    """
+    One UltimatumMatch per game_match_uuid: who played from its first
+    round, the results from its last one (they were copied to every row
+    when the match ended), then point all rounds at their match. The
+    rows are read in match order, so matches are inserted BATCH_SIZE at a
+    time as they are complete instead of all held in memory.
+    """
+    UltimatumGameRound = apps.get_model('ultimatum', 'UltimatumGameRound')
+    UltimatumMatch = apps.get_model('ultimatum', 'UltimatumMatch')
+
+    rows = UltimatumGameRound.objects.order_by('game_match_uuid', 'round_number').values(
+        'game_match_uuid', 'round_start', 'match_acceptance_rate', 'match_average_offer',
+        *IDENTITY_COLUMNS, *RESULT_COLUMNS
+    )
+    matches = []
+    for row in rows.iterator(chunk_size=2000):
+        if not matches or matches[-1].game_match_uuid != row['game_match_uuid']:
+            if len(matches) >= BATCH_SIZE:
+                UltimatumMatch.objects.bulk_create(matches, batch_size=BATCH_SIZE)
+                matches = []
+            matches.append(UltimatumMatch(
+                game_match_uuid=row['game_match_uuid'],
+                created_at=row['round_start'],
+                **{column: row[column] for column in IDENTITY_COLUMNS},
+            ))
+        game_match = matches[-1]
+        for column in RESULT_COLUMNS + ['match_acceptance_rate', 'match_average_offer']:
+            setattr(game_match, column, row[column])
+
+    UltimatumMatch.objects.bulk_create(matches, batch_size=BATCH_SIZE)
+    UltimatumGameRound.objects.update(match=Subquery(
+        UltimatumMatch.objects.filter(
+            game_match_uuid=OuterRef('game_match_uuid')
+        ).values('pk')[:1]
+    ))
+
+
+def restore_match_columns(apps, schema_editor):
+    UltimatumGameRound = apps.get_model('ultimatum', 'UltimatumGameRound')
+    UltimatumMatch = apps.get_model('ultimatum', 'UltimatumMatch')
+
+    def from_match(column):
+        return Subquery(UltimatumMatch.objects.filter(pk=OuterRef('match_id')).values(column)[:1])
+
+    UltimatumGameRound.objects.update(
+        game_match_uuid=from_match('game_match_uuid'),
+        **{column: from_match(column) for column in IDENTITY_COLUMNS + RESULT_COLUMNS},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0004_ultimatummatch'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_match_data, restore_match_columns),
+    ]
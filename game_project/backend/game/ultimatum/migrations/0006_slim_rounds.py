@@ -0,0 +1,87 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0005_move_match_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ultimatumgameround',
+            name='match',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rounds', to='ultimatum.ultimatummatch'),
+        ),
+        migrations.AlterModelOptions(
+            name='ultimatumgameround',
+            options={'ordering': ['match', 'round_number']},
+        ),
+        migrations.AlterUniqueTogether(
+            name='ultimatumgameround',
+            unique_together={('match', 'round_number')},
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='game_match_uuid',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='game_mode',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='is_pooled',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='match_complete',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='match_completed_at',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_1_city',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_1_country',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_1_final_score',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_1_fingerprint',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_1_ip_address',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_2_city',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_2_country',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_2_final_score',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_2_fingerprint',
+        ),
+        migrations.RemoveField(
+            model_name='ultimatumgameround',
+            name='player_2_ip_address',
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+TOTALS_FIELDS = [
+    'stats_through_round', 'completed_rounds', 'accepted_responses',
+    'offered_coins', 'player_1_coins', 'player_2_coins',
+]
+MOVE_COLUMNS = [
+    'player_1_coins_to_keep', 'player_1_coins_to_offer',
+    'player_2_coins_to_keep', 'player_2_coins_to_offer',
+    'player_1_response_to_p2_offer', 'player_2_response_to_p1_offer',
+]
+
+
+def backfill_match_totals(apps, schema_editor):
+    """Fold the settled rounds of existing matches into their new running totals."""
+    UltimatumGameRound = apps.get_model('ultimatum', 'UltimatumGameRound')
+    UltimatumMatch = apps.get_model('ultimatum', 'UltimatumMatch')
+
+    rows = UltimatumGameRound.objects.filter(round_end__isnull=False).order_by(
+        'match_id', 'round_number'
+    ).values(
+        'match_id', 'round_number',
+        'player_1_coins_made_in_round', 'player_2_coins_made_in_round',
+        *MOVE_COLUMNS
+    )
+    totals = {}
+    for row in rows.iterator(chunk_size=2000):
+        game_match = totals.get(row['match_id'])
+        if game_match is None:
+            game_match = totals[row['match_id']] = UltimatumMatch(
+                pk=row['match_id'], **{field: 0 for field in TOTALS_FIELDS}
+            )
+        game_match.stats_through_round = row['round_number']
+        game_match.player_1_coins += row['player_1_coins_made_in_round']
+        game_match.player_2_coins += row['player_2_coins_made_in_round']
+        if all(row[column] is not None for column in MOVE_COLUMNS):
+            game_match.completed_rounds += 1
+            game_match.accepted_responses += [
+                row['player_1_response_to_p2_offer'], row['player_2_response_to_p1_offer']
+            ].count('accept')
+            game_match.offered_coins += row['player_1_coins_to_offer'] + row['player_2_coins_to_offer']
+
+    UltimatumMatch.objects.bulk_update(totals.values(), TOTALS_FIELDS, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0006_slim_rounds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ultimatummatch',
+            name='accepted_responses',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ultimatummatch',
+            name='completed_rounds',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ultimatummatch',
+            name='offered_coins',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ultimatummatch',
+            name='player_1_coins',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ultimatummatch',
+            name='player_2_coins',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ultimatummatch',
+            name='stats_through_round',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_match_totals, migrations.RunPython.noop),
+    ]
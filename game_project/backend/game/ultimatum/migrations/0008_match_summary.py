@@ -0,0 +1,82 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_summaries(apps, schema_editor):
+    """
+    A summary row for every match finished before summaries were kept,
+    from one grouped aggregate over their completed rounds (the
+    statistics of UltimatumMatch.round_stats, as of this migration).
+    """
+    UltimatumGameRound = apps.get_model('ultimatum', 'UltimatumGameRound')
+    UltimatumMatchSummary = apps.get_model('ultimatum', 'UltimatumMatchSummary')
+
+    totals = UltimatumGameRound.objects.filter(
+        match__match_complete=True,
+        player_1_coins_to_keep__isnull=False,
+        player_1_coins_to_offer__isnull=False,
+        player_2_coins_to_keep__isnull=False,
+        player_2_coins_to_offer__isnull=False,
+        player_1_response_to_p2_offer__isnull=False,
+        player_2_response_to_p1_offer__isnull=False,
+    ).values('match').annotate(
+        completed_rounds=models.Count('pk'),
+        p1_accepts=models.Count('pk', filter=models.Q(player_1_response_to_p2_offer='accept')),
+        p2_accepts=models.Count('pk', filter=models.Q(player_2_response_to_p1_offer='accept')),
+        p1_offer_sum=models.Sum('player_1_coins_to_offer'),
+        p2_offer_sum=models.Sum('player_2_coins_to_offer'),
+        p1_min_offer=models.Min('player_1_coins_to_offer'),
+        p2_min_offer=models.Min('player_2_coins_to_offer'),
+        p1_max_offer=models.Max('player_1_coins_to_offer'),
+        p2_max_offer=models.Max('player_2_coins_to_offer'),
+    ).order_by('match')
+
+    summaries = []
+    for row in totals.iterator(chunk_size=2000):
+        rounds = row['completed_rounds']
+        accepts = row['p1_accepts'] + row['p2_accepts']
+        summaries.append(UltimatumMatchSummary(
+            match_id=row['match'],
+            completed_rounds=rounds,
+            accepted_responses=accepts,
+            rejected_responses=rounds * 2 - accepts,
+            overall_acceptance_rate=accepts / (rounds * 2) * 100,
+            overall_average_offer=(row['p1_offer_sum'] + row['p2_offer_sum']) / (rounds * 2),
+            min_offer=min(row['p1_min_offer'], row['p2_min_offer']),
+            max_offer=max(row['p1_max_offer'], row['p2_max_offer']),
+            player_1_acceptance_rate=row['p2_accepts'] / rounds * 100,
+            player_2_acceptance_rate=row['p1_accepts'] / rounds * 100,
+            player_1_average_offer=row['p1_offer_sum'] / rounds,
+            player_2_average_offer=row['p2_offer_sum'] / rounds,
+        ))
+    UltimatumMatchSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0007_match_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UltimatumMatchSummary',
+            fields=[
+                ('match', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='ultimatum.ultimatummatch')),
+                ('completed_rounds', models.IntegerField(default=0)),
+                ('accepted_responses', models.IntegerField(default=0)),
+                ('rejected_responses', models.IntegerField(default=0)),
+                ('overall_acceptance_rate', models.FloatField(default=0)),
+                ('overall_average_offer', models.FloatField(default=0)),
+                ('min_offer', models.IntegerField(default=0)),
+                ('max_offer', models.IntegerField(default=0)),
+                ('player_1_acceptance_rate', models.FloatField(default=0)),
+                ('player_2_acceptance_rate', models.FloatField(default=0)),
+                ('player_1_average_offer', models.FloatField(default=0)),
+                ('player_2_average_offer', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0008_match_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ultimatummatch',
+            index=models.Index(condition=models.Q(('is_pooled', False), ('match_complete', False)), fields=['id'], name='ultimatum_active_idx'),
+        ),
+    ]
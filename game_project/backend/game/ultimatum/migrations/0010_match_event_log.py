@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0009_active_match_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UltimatumMatchEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('match_id', models.CharField(max_length=255)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Join'), (2, 'Move'), (3, 'Response'), (4, 'Round settled'), (5, 'Abort')])),
+                ('at', models.FloatField()),
+                ('data', models.BinaryField()),
+            ],
+            options={
+                'ordering': ['id'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ultimatummatchevent',
+            index=models.Index(fields=['match_id', 'id'], name='ultimatum_u_match_i_e524a1_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0010_match_event_log'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ultimatummatch',
+            index=models.Index(condition=models.Q(('match_complete', True)), fields=['match_completed_at', 'id'], name='ultimatum_completed_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultimatum', '0011_completed_match_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ultimatummatchevent',
+            name='ultimatum_u_match_i_e524a1_idx',
+        ),
+        migrations.AddField(
+            model_name='ultimatummatchevent',
+            name='match_pk',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ultimatummatchevent',
+            index=models.Index(fields=['match_id', 'match_pk', 'id'], name='ultimatum_u_match_i_704326_idx'),
+        ),
+    ]
@@ -1,22 +1,36 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from game.event_log import ABORT, JOIN, MOVE, RESPONSE, ROUND_SETTLED, MatchEvent
 import uuid
 
-class UltimatumGameRound(models.Model):
+# a round both players made their offer in and responded to
+COMPLETED_ROUND = models.Q(
+    player_1_coins_to_keep__isnull=False,
+    player_1_coins_to_offer__isnull=False,
+    player_2_coins_to_keep__isnull=False,
+    player_2_coins_to_offer__isnull=False,
+    player_1_response_to_p2_offer__isnull=False,
+    player_2_response_to_p1_offer__isnull=False,
+)
+
+class PlayableMatchManager(models.Manager):
+    """Hides the pre-provisioned matches still sitting in the warm pool"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_pooled=False)
+
+
+class UltimatumMatch(models.Model):
+    """Who plays and how it ended – everything that is the same for all rounds"""
     GAME_MODES = [
         ('online', 'Online'),
         ('bot', 'Bot'),
     ]
-    
-    RESPONSE_CHOICES = [
-        ('accept', 'Accept'),
-        ('reject', 'Reject'),
-    ]
-    
-    row_number = models.AutoField(primary_key=True)
-    game_match_uuid = models.CharField(max_length=8, db_index=True)
-    round_number = models.IntegerField()
-    
+
+    game_match_uuid = models.CharField(max_length=8, unique=True)
+    game_mode = models.CharField(max_length=10, choices=GAME_MODES, default='online')
+
     # Player information
     player_1_fingerprint = models.CharField(max_length=255)
     player_2_fingerprint = models.CharField(max_length=255, blank=True, null=True)
@@ -24,13 +38,233 @@ class UltimatumGameRound(models.Model):
     player_1_city = models.CharField(max_length=100, default='Unknown')
     player_2_country = models.CharField(max_length=100, blank=True, null=True, default='Unknown')
     player_2_city = models.CharField(max_length=100, blank=True, null=True, default='Unknown')
-    
-  
     player_1_ip_address = models.GenericIPAddressField(null=True, blank=True)
     player_2_ip_address = models.GenericIPAddressField(null=True, blank=True)
 
-    # Game mode
-    game_mode = models.CharField(max_length=10, choices=GAME_MODES, default='online')
+    # Final results, written with the last round
+    player_1_final_score = models.IntegerField(default=0)
+    player_2_final_score = models.IntegerField(default=0)
+    match_acceptance_rate = models.FloatField(default=0)
+    match_average_offer = models.FloatField(default=0)
+
+    # Running totals over the settled rounds, kept up to date in memory
+    # while the match is played and written with the last round
+    stats_through_round = models.IntegerField(default=0)    # last round folded in
+    completed_rounds = models.IntegerField(default=0)
+    accepted_responses = models.IntegerField(default=0)
+    offered_coins = models.IntegerField(default=0)
+    player_1_coins = models.IntegerField(default=0)
+    player_2_coins = models.IntegerField(default=0)
+
+    created_at = models.CharField(max_length=50, blank=True, null=True)
+    match_completed_at = models.CharField(max_length=50, blank=True, null=True)
+    match_complete = models.BooleanField(default=False)
+    is_pooled = models.BooleanField(default=False)  # created ahead, no player yet
+
+    objects = PlayableMatchManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # online matches still waiting for player 2
+            models.Index(
+                fields=['game_mode', 'id'],
+                name='ultimatum_waiting_idx',
+                condition=models.Q(player_2_fingerprint__isnull=True,
+                                   match_complete=False, is_pooled=False),
+            ),
+            models.Index(
+                fields=['game_mode', 'id'],
+                name='ultimatum_pooled_idx',
+                condition=models.Q(is_pooled=True),
+            ),
+            # active_matches pages through these newest first
+            models.Index(
+                fields=['id'],
+                name='ultimatum_active_idx',
+                condition=models.Q(match_complete=False, is_pooled=False),
+            ),
+            # incremental exports walk completed matches in completion order
+            models.Index(
+                fields=['match_completed_at', 'id'],
+                name='ultimatum_completed_idx',
+                condition=models.Q(match_complete=True),
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.created_at:
+            self.created_at = timezone.now().strftime('%Y-%m-%d %H:%M')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Match {self.game_match_uuid} - Player 1: {self.player_1_fingerprint} vs Player 2: {self.player_2_fingerprint or 'waiting'}"
+
+    @classmethod
+    def provision_pool(cls, game_mode, count):
+        """Insert `count` unassigned matches, and their rounds, into the warm pool"""
+        from .game_logic import initialize_rounds
+
+        bot = game_mode == 'bot'
+        with transaction.atomic():
+            pooled = cls.all_objects.bulk_create([
+                cls(
+                    game_match_uuid=str(uuid.uuid4())[:8],
+                    game_mode=game_mode,
+                    player_1_fingerprint='',
+                    player_2_fingerprint='bot' if bot else None,
+                    player_2_country='Bot' if bot else 'Unknown',
+                    player_2_city='Bot' if bot else 'Unknown',
+                    is_pooled=True,
+                )
+                for _ in range(count)
+            ])
+            if pooled and pooled[0].pk is None:
+                # bulk_create only returns primary keys on Postgres
+                pooled = cls.all_objects.filter(
+                    game_match_uuid__in=[m.game_match_uuid for m in pooled])
+            initialize_rounds(pooled)
+
+    @classmethod
+    def pool_size(cls, game_mode):
+        return cls.all_objects.filter(is_pooled=True, game_mode=game_mode).count()
+
+    @classmethod
+    def claim_from_pool(cls, game_mode, player_fingerprint, ip_address):
+        """
+        Hand a pooled match to player 1, or None if the pool is empty.
+        SKIP LOCKED lets concurrent requests each take a different one.
+        """
+        with transaction.atomic():
+            game_match = (cls.all_objects
+                          .filter(is_pooled=True, game_mode=game_mode)
+                          .order_by('id')
+                          .select_for_update(skip_locked=True)
+                          .first())
+            if game_match is None:
+                return None
+            game_match.is_pooled = False
+            game_match.player_1_fingerprint = player_fingerprint
+            game_match.player_1_ip_address = ip_address
+            # the match starts now, not when it was provisioned
+            game_match.created_at = timezone.now().strftime('%Y-%m-%d %H:%M')
+            game_match.save(update_fields=['is_pooled', 'player_1_fingerprint',
+                                           'player_1_ip_address', 'created_at'])
+        return game_match
+
+    @classmethod
+    def waiting_matches(cls):
+        """Online matches with a free second seat, oldest first"""
+        return cls.objects.filter(
+            game_mode='online',
+            player_2_fingerprint__isnull=True,
+            match_complete=False,
+        ).order_by('id')
+
+    @classmethod
+    def claim_waiting_match(cls, player_fingerprint, ip_address, match_id=None):
+        """
+        Seat a player in the oldest waiting match and return it, or None.
+        Uses FOR UPDATE SKIP LOCKED so concurrent joiners each get a
+        different match without waiting on each other. With match_id, only
+        that match is claimed (the lobby already picked it).
+        """
+        waiting = cls.waiting_matches()
+        if match_id is not None:
+            waiting = waiting.filter(game_match_uuid=match_id)
+        with transaction.atomic():
+            game_match = (waiting
+                          .select_for_update(skip_locked=True)
+                          .exclude(player_1_fingerprint=player_fingerprint)
+                          .first())
+            if game_match is None:
+                return None
+            game_match.player_2_fingerprint = player_fingerprint
+            game_match.player_2_country = 'Unknown'
+            game_match.player_2_city = 'Unknown'
+            game_match.player_2_ip_address = ip_address
+            game_match.save(update_fields=['player_2_fingerprint', 'player_2_country',
+                                           'player_2_city', 'player_2_ip_address'])
+        return game_match
+
+    @classmethod
+    def active_page(cls, before=None, limit=50):
+        """
+        One page of unfinished matches, newest first, each annotated with
+        its completed_rounds_count – a single query however many there are.
+        Keyset pagination: pass the last id of a page as `before` to get the
+        next one.
+        """
+        completed_rounds = UltimatumGameRound.objects.filter(
+            COMPLETED_ROUND,
+            match=models.OuterRef('pk'),
+        ).order_by().values('match').annotate(count=models.Count('pk')).values('count')
+
+        matches = cls.objects.filter(match_complete=False)
+        if before is not None:
+            matches = matches.filter(id__lt=before)
+        return matches.annotate(
+            completed_rounds_count=Coalesce(models.Subquery(completed_rounds), 0)
+        ).order_by('-id')[:limit]
+
+    def get_completed_rounds_count(self):
+        """Get count of completed rounds for this match"""
+        return self.rounds.filter(COMPLETED_ROUND).count()
+
+    def round_stats(self):
+        """
+        The statistics match_stats reports, from one aggregate query over
+        the completed rounds.
+        """
+        totals = self.rounds.filter(COMPLETED_ROUND).aggregate(
+            completed_rounds=models.Count('pk'),
+            p1_accepts=models.Count('pk', filter=models.Q(player_1_response_to_p2_offer='accept')),
+            p2_accepts=models.Count('pk', filter=models.Q(player_2_response_to_p1_offer='accept')),
+            p1_offer_sum=models.Sum('player_1_coins_to_offer'),
+            p2_offer_sum=models.Sum('player_2_coins_to_offer'),
+            p1_min_offer=models.Min('player_1_coins_to_offer'),
+            p2_min_offer=models.Min('player_2_coins_to_offer'),
+            p1_max_offer=models.Max('player_1_coins_to_offer'),
+            p2_max_offer=models.Max('player_2_coins_to_offer'),
+        )
+        rounds_count = totals['completed_rounds']
+        if not rounds_count:
+            return {'completed_rounds': 0}
+
+        # both players respond in every counted round
+        total_accepts = totals['p1_accepts'] + totals['p2_accepts']
+        return {
+            'completed_rounds': rounds_count,
+            'accepted_responses': total_accepts,
+            'rejected_responses': rounds_count * 2 - total_accepts,
+            'overall_acceptance_rate': total_accepts / (rounds_count * 2) * 100,
+            'overall_average_offer': (totals['p1_offer_sum'] + totals['p2_offer_sum']) / (rounds_count * 2),
+            'min_offer': min(totals['p1_min_offer'], totals['p2_min_offer']),
+            'max_offer': max(totals['p1_max_offer'], totals['p2_max_offer']),
+            # how often each player's offers were accepted
+            'player_1_acceptance_rate': totals['p2_accepts'] / rounds_count * 100,
+            'player_2_acceptance_rate': totals['p1_accepts'] / rounds_count * 100,
+            'player_1_average_offer': totals['p1_offer_sum'] / rounds_count,
+            'player_2_average_offer': totals['p2_offer_sum'] / rounds_count,
+        }
+
+    def delete_if_incomplete(self):
+        """Delete the match if less than 25 rounds completed"""
+        if not self.match_complete and self.get_completed_rounds_count() < 25:
+            self.delete()
+            return True
+        return False
+
+
+class UltimatumGameRound(models.Model):
+    RESPONSE_CHOICES = [
+        ('accept', 'Accept'),
+        ('reject', 'Reject'),
+    ]
+    
+    row_number = models.AutoField(primary_key=True)
+    match = models.ForeignKey(UltimatumMatch, related_name='rounds', on_delete=models.CASCADE)
+    round_number = models.IntegerField()
     
     # NEW FIELDS: What each player keeps vs offers
     player_1_coins_to_keep = models.IntegerField(null=True, blank=True)
@@ -52,9 +286,7 @@ class UltimatumGameRound(models.Model):
     round_player_2_cumulative_score = models.IntegerField(default=0)
     players_sum_coins_total = models.IntegerField(default=0)
     
-    player_1_final_score = models.IntegerField(default=0)
-    player_2_final_score = models.IntegerField(default=0)
-    
+    # Running statistics as of this round
     round_acceptance_rate = models.FloatField(default=0)
     match_acceptance_rate = models.FloatField(default=0)
     
@@ -65,14 +297,10 @@ class UltimatumGameRound(models.Model):
     # Timestamps
     round_start = models.CharField(max_length=50, blank=True, null=True)
     round_end = models.CharField(max_length=50, blank=True, null=True)
-    match_completed_at = models.CharField(max_length=50, blank=True, null=True)
-    
-    # Match status
-    match_complete = models.BooleanField(default=False)
     
     class Meta:
-        unique_together = ['game_match_uuid', 'round_number']
-        ordering = ['game_match_uuid', 'round_number']
+        unique_together = ['match', 'round_number']
+        ordering = ['match', 'round_number']
     
     def save(self, *args, **kwargs):
         if not self.round_start:
@@ -80,7 +308,7 @@ class UltimatumGameRound(models.Model):
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"Round {self.round_number} of Match {self.game_match_uuid}"
+        return f"Round {self.round_number} of Match {self.match_id}"
 
     def is_round_complete(self):
         """Check if all actions for this round are complete"""
@@ -96,26 +324,57 @@ class UltimatumGameRound(models.Model):
     @classmethod
     def get_match_rounds(cls, match_uuid):
         """Get all rounds for a specific match"""
-        return cls.objects.filter(game_match_uuid=match_uuid).order_by('round_number')
-    
-    @classmethod
-    def get_completed_rounds_count(cls, match_uuid):
-        """Get count of completed rounds for a match"""
-        return cls.objects.filter(
-            game_match_uuid=match_uuid,
-            player_1_coins_to_keep__isnull=False,
-            player_1_coins_to_offer__isnull=False,
-            player_2_coins_to_keep__isnull=False,
-            player_2_coins_to_offer__isnull=False,
-            player_1_response_to_p2_offer__isnull=False,
-            player_2_response_to_p1_offer__isnull=False
-        ).count()
-    
+        return cls.objects.filter(match__game_match_uuid=match_uuid).order_by('round_number')
+
+class UltimatumMatchSummary(models.Model):
+    """
+    match_stats of a finished match, computed once when it ends. A
+    finished match never changes, so the endpoint reads this row
+    instead of aggregating the rounds again.
+    """
+    match = models.OneToOneField(UltimatumMatch, primary_key=True, related_name='summary',
+                                 on_delete=models.CASCADE)
+    completed_rounds = models.IntegerField(default=0)
+    accepted_responses = models.IntegerField(default=0)
+    rejected_responses = models.IntegerField(default=0)
+    overall_acceptance_rate = models.FloatField(default=0)
+    overall_average_offer = models.FloatField(default=0)
+    min_offer = models.IntegerField(default=0)
+    max_offer = models.IntegerField(default=0)
+    player_1_acceptance_rate = models.FloatField(default=0)
+    player_2_acceptance_rate = models.FloatField(default=0)
+    player_1_average_offer = models.FloatField(default=0)
+    player_2_average_offer = models.FloatField(default=0)
+
+    STATS_FIELDS = [
+        'completed_rounds', 'accepted_responses', 'rejected_responses',
+        'overall_acceptance_rate', 'overall_average_offer', 'min_offer', 'max_offer',
+        'player_1_acceptance_rate', 'player_2_acceptance_rate',
+        'player_1_average_offer', 'player_2_average_offer',
+    ]
+
+    def __str__(self):
+        return f"Summary of Match {self.match_id}"
+
     @classmethod
-    def delete_incomplete_match(cls, match_uuid):
-        """Delete incomplete match if less than 25 rounds completed"""
-        completed_count = cls.get_completed_rounds_count(match_uuid)
-        if completed_count < 25:
-            cls.objects.filter(game_match_uuid=match_uuid).delete()
-            return True
-        return False
\ No newline at end of file
+    def store(cls, game_match):
+        """Aggregate the rounds of a finished match into its summary row"""
+        summary, _ = cls.objects.update_or_create(match=game_match, defaults=game_match.round_stats())
+        return summary
+
+    def round_stats(self):
+        if not self.completed_rounds:
+            return {'completed_rounds': 0}
+        return {field: getattr(self, field) for field in self.STATS_FIELDS}
+
+
+class UltimatumMatchEvent(MatchEvent):
+    """Event log of an Ultimatum match (see game/event_log.py)"""
+
+    EVENT_FIELDS = {
+        JOIN: ('player', 'fingerprint'),
+        MOVE: ('round', 'player', 'coins_to_keep', 'coins_to_offer'),
+        RESPONSE: ('round', 'player', 'response'),
+        ROUND_SETTLED: ('round', 'player_1_coins', 'player_2_coins'),
+        ABORT: ('reason',),
+    }
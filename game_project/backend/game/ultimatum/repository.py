@@ -0,0 +1,143 @@
+"""
+Database access of the Ultimatum consumer.
+
+Same split as the_game.repository: SyncRoundRepository hops plain ORM
+calls onto the DB executor, AsyncRoundRepository uses the native async
+ORM. get_round_repository() picks one from GAME_REPOSITORY_BACKEND, and
+wraps it in HotStateRoundRepository when live rounds are kept in Redis.
+"""
+from game.db_executor import db_sync_to_async, repository_backend
+from game.hot_state import get_hot_state
+from .game_logic import settle_round_stats, update_game_stats
+from .models import UltimatumMatch
+
+
+def _load_match(match_id):
+    try:
+        game_match = UltimatumMatch.objects.get(game_match_uuid=match_id)
+    except UltimatumMatch.DoesNotExist:
+        return None, []
+    return game_match, list(game_match.rounds.order_by("round_number"))
+
+
+def _delete_match(match_id):
+    deleted_count, _ = UltimatumMatch.objects.filter(game_match_uuid=match_id).delete()
+    return deleted_count
+
+
+class SyncRoundRepository:
+    """Every method is one hop onto the executor running the sync ORM."""
+
+    backend = "sync"
+
+    def __init__(self, executor=None):
+        # an explicit DBExecutor wins over DB_EXECUTOR_MODE (used by benchmarks)
+        self.executor = executor
+
+    async def _run(self, func, *args, **kwargs):
+        if self.executor is not None:
+            return await self.executor.run(func, *args, **kwargs)
+        return await db_sync_to_async(func)(*args, **kwargs)
+
+    async def load_match(self, match_id):
+        """(match, rounds by round_number); (None, []) if it does not exist."""
+        return await self._run(_load_match, match_id)
+
+    async def refresh_match(self, game_match, fields):
+        await self._run(game_match.refresh_from_db, fields=fields)
+
+    async def save_match(self, game_match, fields):
+        await self._run(game_match.save, update_fields=fields)
+
+    async def save_round(self, round_obj):
+        """Insert a round that wasn't pre-allocated."""
+        await self._run(round_obj.save)
+
+    async def settle_round(self, game_match, round_obj, rounds):
+        """Write the round with its moves, payoffs and match statistics."""
+        await self._run(update_game_stats, game_match, round_obj.round_number, rounds)
+
+    async def delete_match(self, match_id):
+        """Delete the match and its rounds; returns the number of rows."""
+        return await self._run(_delete_match, match_id)
+
+
+class AsyncRoundRepository:
+    """The same operations through the async ORM API."""
+
+    backend = "async"
+
+    async def load_match(self, match_id):
+        try:
+            game_match = await UltimatumMatch.objects.aget(game_match_uuid=match_id)
+        except UltimatumMatch.DoesNotExist:
+            return None, []
+        rounds = [r async for r in game_match.rounds.order_by("round_number")]
+        return game_match, rounds
+
+    async def refresh_match(self, game_match, fields):
+        await game_match.arefresh_from_db(fields=fields)
+
+    async def save_match(self, game_match, fields):
+        await game_match.asave(update_fields=fields)
+
+    async def save_round(self, round_obj):
+        await round_obj.asave()
+
+    async def settle_round(self, game_match, round_obj, rounds):
+        # update_game_stats works on the rows in memory, its writes go
+        # through the sync ORM as a single hop onto the DB executor
+        await db_sync_to_async(update_game_stats)(game_match, round_obj.round_number, rounds)
+
+    async def delete_match(self, match_id):
+        deleted_count, _ = await UltimatumMatch.objects.filter(
+            game_match_uuid=match_id
+        ).adelete()
+        return deleted_count
+
+
+class HotStateRoundRepository:
+    """
+    Like the_game.repository.HotStateMatchRepository: rounds 1-24 go to the
+    Redis hot state, round 25 flushes them and is written with the match.
+    """
+
+    game = "ultimatum"
+
+    def __init__(self, repository, hot_state):
+        self.repository = repository
+        self.hot_state = hot_state
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    async def load_match(self, match_id):
+        game_match, rounds = await self.repository.load_match(match_id)
+        if game_match is not None:
+            # the match totals are rebuilt from these rows on the next round
+            await self.hot_state.overlay(self.game, match_id, rounds)
+        return game_match, rounds
+
+    async def settle_round(self, game_match, round_obj, rounds):
+        if round_obj.pk is None or round_obj.round_number >= 25:
+            await self.hot_state.flush_match(self.game, game_match.game_match_uuid)
+            await self.repository.settle_round(game_match, round_obj, rounds)
+            return
+        # rows in memory, no query
+        if settle_round_stats(game_match, round_obj.round_number, rounds) is not None:
+            await self.hot_state.write_round(self.game, game_match.game_match_uuid, round_obj)
+
+    async def delete_match(self, match_id):
+        await self.hot_state.discard(self.game, match_id)
+        return await self.repository.delete_match(match_id)
+
+
+def get_round_repository():
+    if repository_backend() == "async":
+        repository = AsyncRoundRepository()
+    else:
+        repository = SyncRoundRepository()
+    hot_state = get_hot_state()
+    if hot_state is not None:
+        return HotStateRoundRepository(repository, hot_state)
+    return repository
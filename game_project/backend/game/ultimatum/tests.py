@@ -1,3 +1,412 @@
-from django.test import TestCase
+from importlib import import_module
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+
+from game import event_log
+from game.db_executor import ASYNC_ORM_AVAILABLE, db_sync_to_async
+from game.event_log import MOVE, RESPONSE, ROUND_SETTLED, EventLog, EventLogMixin
+from . import repository
+from .game_logic import (calculate_simultaneous_payoff, initialize_rounds, rounds_from_events,
+                         summarize_rounds, update_game_stats)
+from .match_state import UltimatumMatchState
+from .models import UltimatumGameRound, UltimatumMatch, UltimatumMatchEvent, UltimatumMatchSummary
+from .repository import AsyncRoundRepository
+
+# what both players keep, offer and answer in each of 25 rounds
+MOVES = [
+    (10 - p1_offer, p1_offer, 10 - p2_offer, p2_offer,
+     'reject' if n % 3 == 0 else 'accept', 'reject' if n % 4 == 1 else 'accept')
+    for n, (p1_offer, p2_offer) in enumerate((n % 6 + 1, n * 3 % 7 + 1) for n in range(25))
+]
+
+
+MOVE_FIELDS = [
+    'player_1_coins_to_keep', 'player_1_coins_to_offer',
+    'player_2_coins_to_keep', 'player_2_coins_to_offer',
+    'player_1_response_to_p2_offer', 'player_2_response_to_p1_offer',
+]
+
+
+def make_match(match_id, **fields):
+    game_match = UltimatumMatch.objects.create(
+        game_match_uuid=match_id, player_1_fingerprint='p1', player_2_fingerprint='p2', **fields)
+    initialize_rounds([game_match])
+    return game_match
+
+
+def make_moves(round_obj, moves):
+    for field, value in zip(MOVE_FIELDS, moves):
+        setattr(round_obj, field, value)
+
+
+def play(game_match, moves):
+    """Settle the rounds one at a time, the rows held in memory as the consumer does"""
+    rounds = list(game_match.rounds.order_by('round_number'))
+    for round_obj, round_moves in zip(rounds, moves):
+        make_moves(round_obj, round_moves)
+        update_game_stats(game_match, round_obj.round_number, rounds)
+    return rounds
+
+
+class AsyncRoundRepositoryTests(TestCase):
+
+    def setUp(self):
+        self.game_match = make_match('async-1')
+        self.rounds = list(self.game_match.rounds.order_by('round_number'))
+
+    async def test_settle_round_goes_through_the_db_executor(self):
+        repo = AsyncRoundRepository()
+        with mock.patch.object(repository, 'db_sync_to_async', wraps=db_sync_to_async) as hop:
+            for round_obj, round_moves in zip(self.rounds, MOVES):
+                make_moves(round_obj, round_moves)
+                await repo.settle_round(self.game_match, round_obj, self.rounds)
+        self.assertEqual(hop.call_count, 25)
+        self.assertEqual(hop.call_args[0][0], update_game_stats)
+
+        game_match = await database_sync_to_async(UltimatumMatch.objects.get)(pk=self.game_match.pk)
+        self.assertTrue(game_match.match_complete)
+        self.assertEqual(game_match.completed_rounds, 25)
+        self.assertEqual(game_match.player_1_final_score, self.rounds[-1].round_player_1_cumulative_score)
+        self.assertTrue(await database_sync_to_async(
+            UltimatumMatchSummary.objects.filter(match=self.game_match).exists)())
+
+    @skipUnless(ASYNC_ORM_AVAILABLE, "the async ORM needs Django 5.0")
+    async def test_async_orm_operations(self):
+        repo = AsyncRoundRepository()
+        game_match, rounds = await repo.load_match('async-1')
+        self.assertEqual([r.round_number for r in rounds], list(range(1, 26)))
+        self.assertEqual(await repo.load_match('missing'), (None, []))
+
+        game_match.player_2_city = 'Rabat'
+        await repo.save_match(game_match, ['player_2_city'])
+        game_match.player_2_city = None
+        await repo.refresh_match(game_match, ['player_2_city'])
+        self.assertEqual(game_match.player_2_city, 'Rabat')
+
+        self.assertEqual(await repo.delete_match('async-1'), 26)
+        self.assertEqual(await repo.load_match('async-1'), (None, []))
+
+
+class VerifyMatchStatsTests(TestCase):
+
+    def setUp(self):
+        self.finished = make_match('done-1')
+        play(self.finished, MOVES)
+        self.playing = make_match('live-1')
+        play(self.playing, MOVES[:10])
+
+    def verify(self):
+        call_command('verify_match_stats', stdout=StringIO())
+
+    def test_settled_rounds_agree(self):
+        out = StringIO()
+        call_command('verify_match_stats', stdout=out)
+        self.assertIn('Verified 35 rounds across 2 matches: no mismatches', out.getvalue())
+
+    def test_stale_round_statistics_are_reported(self):
+        UltimatumGameRound.objects.filter(match=self.playing, round_number=7).update(
+            match_average_offer=0)
+        with self.assertRaisesMessage(CommandError, '1 mismatches'):
+            self.verify()
+
+    def test_wrong_cumulative_score_is_reported(self):
+        UltimatumGameRound.objects.filter(match=self.finished, round_number=25).update(
+            round_player_1_cumulative_score=1)
+        with self.assertRaisesMessage(CommandError, '1 mismatches'):
+            self.verify()
+
+    def test_wrong_match_totals_are_reported(self):
+        UltimatumMatch.objects.filter(pk=self.finished.pk).update(
+            stats_through_round=24, player_2_final_score=0)
+        with self.assertRaisesMessage(CommandError, '2 mismatches'):
+            self.verify()
+
+
+class MatchSplitMigrationTests(TransactionTestCase):
+    """0005-0008 on rows of the old one-table layout, every round carrying its match"""
+
+    before = [('ultimatum', '0003_match_pool')]
+    after = [('ultimatum', '0008_match_summary')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def old_rounds(self, old_apps, match_id, moves, complete):
+        """The rows the old game_logic wrote, results copied to every row of a finished match"""
+        OldRound = old_apps.get_model('ultimatum', 'UltimatumGameRound')
+        rows, p1_total, p2_total = [], 0, 0
+        for round_number, round_moves in enumerate(moves, 1):
+            p1_coins, p2_coins, coins = calculate_simultaneous_payoff(*round_moves)
+            p1_total, p2_total = p1_total + p1_coins, p2_total + p2_coins
+            row = OldRound(
+                game_match_uuid=match_id, round_number=round_number, game_mode='online',
+                player_1_fingerprint='p1', player_2_fingerprint='p2', player_1_city='Fes',
+                player_1_ip_address='10.0.0.1', round_start=f'2024-01-01 10:{round_number:02}',
+                round_end=f'2024-01-01 10:{round_number:02}',
+                player_1_coins_made_in_round=p1_coins, player_2_coins_made_in_round=p2_coins,
+                players_sum_coins_in_round=coins, match_acceptance_rate=round_number,
+            )
+            make_moves(row, round_moves)
+            rows.append(row)
+        if complete:
+            for row in rows:
+                row.match_complete, row.match_completed_at = True, '2024-01-01 10:30'
+                row.player_1_final_score, row.player_2_final_score = p1_total, p2_total
+        else:
+            # a round with both offers made, no answers yet
+            rows.append(OldRound(game_match_uuid=match_id, round_number=len(moves) + 1,
+                                 player_1_fingerprint='p1', player_1_coins_to_keep=5,
+                                 player_1_coins_to_offer=5, player_2_coins_to_keep=5,
+                                 player_2_coins_to_offer=5))
+        OldRound.objects.bulk_create(rows)
+        return p1_total, p2_total
+
+    def test_rounds_move_to_their_matches_with_totals_and_summaries(self):
+        old_apps = self.migrate(self.before)
+        finished = self.old_rounds(old_apps, 'done-1', MOVES, complete=True)
+        playing = self.old_rounds(old_apps, 'live-1', MOVES[:10], complete=False)
+        self.old_rounds(old_apps, 'done-2', MOVES[5:], complete=True)
+
+        # one match per insert, to go through the batches
+        move_match_data = import_module(f'{__package__}.migrations.0005_move_match_data')
+        with mock.patch.object(move_match_data, 'BATCH_SIZE', 1):
+            new_apps = self.migrate(self.after)
+        Match = new_apps.get_model('ultimatum', 'UltimatumMatch')
+        Round = new_apps.get_model('ultimatum', 'UltimatumGameRound')
+        Summary = new_apps.get_model('ultimatum', 'UltimatumMatchSummary')
+
+        self.assertEqual(Match.objects.count(), 3)
+        self.assertEqual(Round.objects.count(), 25 + 11 + 20)
+        self.assertFalse(Round.objects.filter(match__isnull=True).exists())
+
+        for match_id, moves, (p1_total, p2_total), complete in [
+                ('done-1', MOVES, finished, True), ('live-1', MOVES[:10], playing, False)]:
+            game_match = Match.objects.get(game_match_uuid=match_id)
+            self.assertEqual(game_match.rounds.count(), len(moves) + (not complete))
+            self.assertEqual((game_match.player_1_fingerprint, game_match.player_1_city,
+                              game_match.created_at), ('p1', 'Fes', '2024-01-01 10:01'))
+            self.assertEqual(game_match.match_complete, complete)
+            self.assertEqual(game_match.player_1_final_score, p1_total if complete else 0)
+
+            # 0007: the running totals over the settled rounds
+            accepts = sum([m[4], m[5]].count('accept') for m in moves)
+            offers = sum(m[1] + m[3] for m in moves)
+            self.assertEqual(
+                (game_match.stats_through_round, game_match.completed_rounds,
+                 game_match.accepted_responses, game_match.offered_coins,
+                 game_match.player_1_coins, game_match.player_2_coins),
+                (len(moves), len(moves), accepts, offers, p1_total, p2_total))
+
+            # 0008: summaries of the finished matches only
+            if not complete:
+                self.assertFalse(Summary.objects.filter(match=game_match).exists())
+                continue
+            summary = Summary.objects.get(match=game_match)
+            self.assertEqual((summary.completed_rounds, summary.accepted_responses,
+                              summary.rejected_responses), (25, accepts, 50 - accepts))
+            self.assertAlmostEqual(summary.overall_average_offer, offers / 50)
+            self.assertEqual(summary.min_offer, min(min(m[1], m[3]) for m in moves))
+            self.assertAlmostEqual(summary.player_1_average_offer, sum(m[1] for m in moves) / 25)
+            self.assertAlmostEqual(summary.player_2_acceptance_rate,
+                                   sum(m[4] == 'accept' for m in moves) / 25 * 100)
+        self.assertEqual(Summary.objects.count(), 2)
+
+
+def old_match_stats(moves):
+    """The statistics match_stats counted in Python over the completed rounds, before 0008"""
+    _, acceptance_rate, _, average_offer = summarize_rounds(
+        [UltimatumGameRound(round_number=n, **dict(zip(MOVE_FIELDS, m))) for n, m in enumerate(moves, 1)],
+        len(moves))
+    accepts = sum([m[4], m[5]].count('accept') for m in moves)
+    p1_offers, p2_offers = [m[1] for m in moves], [m[3] for m in moves]
+    return {
+        'completed_rounds': len(moves),
+        'accepted_responses': accepts,
+        'rejected_responses': len(moves) * 2 - accepts,
+        'overall_acceptance_rate': acceptance_rate,
+        'overall_average_offer': average_offer,
+        'min_offer': min(p1_offers + p2_offers),
+        'max_offer': max(p1_offers + p2_offers),
+        'player_1_acceptance_rate': sum(m[5] == 'accept' for m in moves) / len(moves) * 100,
+        'player_2_acceptance_rate': sum(m[4] == 'accept' for m in moves) / len(moves) * 100,
+        'player_1_average_offer': sum(p1_offers) / len(moves),
+        'player_2_average_offer': sum(p2_offers) / len(moves),
+    }
+
+
+class MatchStatsViewTests(TestCase):
+
+    def get_stats(self, match_id):
+        response = self.client.get(f'/api/ultimatum/match-stats/{match_id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertStats(self, data, expected):
+        for field, value in expected.items():
+            self.assertAlmostEqual(data[field], value, msg=field)
+
+    def test_finished_match_is_served_from_its_summary(self):
+        game_match = make_match('done-1')
+        play(game_match, MOVES)
+        self.assertTrue(UltimatumMatchSummary.objects.filter(match=game_match).exists())
+        # the summary row alone: rounds changed behind its back don't show
+        game_match.rounds.update(player_1_coins_to_offer=0)
+        data = self.get_stats('done-1')
+        self.assertTrue(data['match_complete'])
+        self.assertStats(data, old_match_stats(MOVES))
+        game_match.refresh_from_db()
+        self.assertEqual(data['player_1_final_score'], game_match.player_1_coins)
+
+    def test_finished_match_without_summary_is_aggregated(self):
+        game_match = make_match('done-1')
+        play(game_match, MOVES)
+        UltimatumMatchSummary.objects.all().delete()
+        self.assertStats(self.get_stats('done-1'), old_match_stats(MOVES))
+        self.assertFalse(UltimatumMatchSummary.objects.exists())
+
+    def test_match_in_progress_is_aggregated(self):
+        game_match = make_match('live-1')
+        play(game_match, MOVES[:9])
+        data = self.get_stats('live-1')
+        self.assertFalse(data['match_complete'])
+        self.assertStats(data, old_match_stats(MOVES[:9]))
+        self.assertFalse(UltimatumMatchSummary.objects.exists())
+
+    def test_match_without_completed_rounds(self):
+        make_match('new-1')
+        data = self.get_stats('new-1')
+        self.assertEqual(data['completed_rounds'], 0)
+        self.assertNotIn('overall_acceptance_rate', data)
+
+    def test_unknown_match(self):
+        self.assertEqual(self.client.get('/api/ultimatum/match-stats/nope/').status_code, 404)
+
+
+class ActivePageTests(TestCase):
+
+    def setUp(self):
+        # newest first: live-4 .. live-0, with 4 .. 0 completed rounds
+        self.live = []
+        for n in range(5):
+            game_match = make_match(f'live-{n}')
+            play(game_match, MOVES[:n])
+            self.live.append(game_match)
+        done = make_match('done-1')
+        play(done, MOVES)
+        pooled = make_match('pool-1', is_pooled=True)
+        self.assertTrue(done.match_complete and pooled.is_pooled)
+
+    def test_unfinished_matches_newest_first_with_their_round_count(self):
+        page = list(UltimatumMatch.active_page())
+        self.assertEqual([m.game_match_uuid for m in page], [f'live-{n}' for n in range(4, -1, -1)])
+        self.assertEqual([m.completed_rounds_count for m in page], [4, 3, 2, 1, 0])
+
+    def test_half_played_round_is_not_counted(self):
+        round_obj = self.live[2].rounds.get(round_number=3)
+        make_moves(round_obj, MOVES[2][:4] + (None, None))
+        round_obj.save()
+        self.assertEqual(UltimatumMatch.active_page()[2].completed_rounds_count, 2)
+
+    def test_pages_follow_the_before_cursor(self):
+        first = list(UltimatumMatch.active_page(limit=2))
+        second = list(UltimatumMatch.active_page(before=first[-1].id, limit=2))
+        last = list(UltimatumMatch.active_page(before=second[-1].id, limit=2))
+        self.assertEqual([m.game_match_uuid for m in first + second + last],
+                         [f'live-{n}' for n in range(4, -1, -1)])
+        self.assertEqual(len(last), 1)
+        self.assertEqual(list(UltimatumMatch.active_page(before=last[-1].id)), [])
+
+    def test_view_pages_through_everything(self):
+        seen, cursor = [], ''
+        while True:
+            data = self.client.get('/api/ultimatum/active-matches/',
+                                   {'limit': 2, 'before': cursor}).json()
+            seen += [(m['match_id'], m['completed_rounds']) for m in data['active_matches']]
+            if not data['has_more']:
+                self.assertIsNone(data['next_cursor'])
+                break
+            cursor = data['next_cursor']
+        self.assertEqual(seen, [(f'live-{n}', n) for n in range(4, -1, -1)])
+
+    def test_view_with_an_exact_last_page(self):
+        data = self.client.get('/api/ultimatum/active-matches/', {'limit': 5}).json()
+        self.assertEqual(len(data['active_matches']), 5)
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.client.get('/api/ultimatum/active-matches/',
+                                         {'before': 'x'}).status_code, 400)
+
+
+class MatchLogger(EventLogMixin):
+    """log_event of the consumer, for the match in `state`"""
+
+    event_model = 'ultimatum.UltimatumMatchEvent'
+
+    def __init__(self, state):
+        self.state, self.match_id = state, state.match_id
+
+
+class EventLogReplayTests(TestCase):
+
+    def setUp(self):
+        self.log = EventLog(interval=1)
+        for patcher in (mock.patch.object(EventLog, 'start'),
+                        mock.patch.object(event_log, 'get_event_log', return_value=self.log)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def play_logged(self, match_id, moves):
+        """A match played the consumer's way: log offers and responses, settle, log it"""
+        game_match = make_match(match_id)
+        rounds = list(game_match.rounds.order_by('round_number'))
+        logger = MatchLogger(UltimatumMatchState(game_match, rounds))
+        for round_obj, round_moves in zip(rounds, moves):
+            p1_keep, p1_offer, p2_keep, p2_offer, p1_response, p2_response = round_moves
+            logger.log_event(MOVE, round_obj.round_number, 2, p2_keep, p2_offer)
+            logger.log_event(MOVE, round_obj.round_number, 1, p1_keep, p1_offer)
+            logger.log_event(RESPONSE, round_obj.round_number, 1, p1_response)
+            logger.log_event(RESPONSE, round_obj.round_number, 2, p2_response)
+            make_moves(round_obj, round_moves)
+            update_game_stats(game_match, round_obj.round_number, rounds)
+            logger.log_event(ROUND_SETTLED, round_obj.round_number,
+                             round_obj.player_1_coins_made_in_round,
+                             round_obj.player_2_coins_made_in_round)
+        self.log.flush()
+        return game_match
+
+    def test_rounds_rebuilt_from_the_log_match_the_settled_rounds(self):
+        game_match = self.play_logged('ev-1', MOVES)
+        rebuilt = rounds_from_events(UltimatumMatchEvent.history('ev-1'))
+        stored = list(game_match.rounds.order_by('round_number'))
+        self.assertEqual(len(rebuilt), 25)
+        fields = MOVE_FIELDS + [
+            'player_1_coins_made_in_round', 'player_2_coins_made_in_round',
+            'players_sum_coins_in_round', 'round_player_1_cumulative_score',
+            'round_player_2_cumulative_score', 'players_sum_coins_total',
+            'round_acceptance_rate', 'match_acceptance_rate',
+            'round_average_offer', 'match_average_offer',
+        ]
+        for replayed, row in zip(rebuilt, stored):
+            for field in fields:
+                self.assertEqual(getattr(replayed, field), getattr(row, field),
+                                 f"round {row.round_number} {field}")
+        call_command('replay_match_events', 'ultimatum', 'ev-1', stdout=StringIO())
+
+    def test_reused_match_id_keeps_its_own_log(self):
+        self.play_logged('ev-1', MOVES[:4]).delete()
+        game_match = self.play_logged('ev-1', MOVES[:2])
+        self.assertEqual({e.match_pk for e in UltimatumMatchEvent.history('ev-1')}, {game_match.pk})
+        self.assertEqual(len(rounds_from_events(UltimatumMatchEvent.history('ev-1'))), 2)
+        call_command('replay_match_events', 'ultimatum', 'ev-1', stdout=StringIO())
@@ -11,6 +11,7 @@ urlpatterns = [
     path('match-history/<str:match_id>/', views.match_history, name='match_history'),
     path('match-stats/<str:match_id>/', views.match_stats, name='match_stats'),
     path('active-matches/', views.active_matches, name='active_matches'),
+    path('export/', views.export_rounds, name='export_rounds'),
     
     # Admin endpoints
     path('cleanup-matches/', views.cleanup_matches, name='cleanup_matches'),
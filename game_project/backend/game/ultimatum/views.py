@@ -1,3 +1,6 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render
@@ -5,7 +8,14 @@ import json
 import uuid
 import traceback
 
-from .models import UltimatumGameRound
+from game.exports import export_response
+from game.lobby import get_lobby, notify_matched
+from game.match_pool import get_match_pool
+from .game_logic import initialize_rounds
+from .models import UltimatumGameRound, UltimatumMatch, UltimatumMatchSummary
+
+ACTIVE_MATCHES_PAGE_SIZE = 50
+ACTIVE_MATCHES_MAX_PAGE_SIZE = 200
 
 def get_client_ip(request):
     """Helper function to get the real client IP address"""
@@ -16,6 +26,30 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
+def start_match(game_mode, player_fingerprint, ip_address):
+    """A new match holding player 1, from the warm pool when it has one"""
+    pool = get_match_pool()
+    if pool is not None:
+        game_match = pool.claim('ultimatum', game_mode, player_fingerprint, ip_address)
+        if game_match is not None:
+            return game_match
+    bot = game_mode == 'bot'
+    with transaction.atomic():
+        game_match = UltimatumMatch.objects.create(
+            game_match_uuid=str(uuid.uuid4())[:8],
+            game_mode=game_mode,
+            player_1_fingerprint=player_fingerprint,
+            player_1_country='Unknown',
+            player_1_city='Unknown',
+            player_1_ip_address=ip_address,  # Store IP for player 1
+            player_2_fingerprint='bot' if bot else None,
+            player_2_country='Bot' if bot else 'Unknown',
+            player_2_city='Bot' if bot else 'Unknown',
+            player_2_ip_address=None  # Bot doesn't have an IP
+        )
+        initialize_rounds([game_match])
+    return game_match
+
 @csrf_exempt
 def create_match(request):
     """Create or join an Ultimatum Game match"""
@@ -39,85 +73,62 @@ def create_match(request):
 
     try:
         if game_mode == 'online':
-            existing_round = UltimatumGameRound.objects.filter(
-                game_mode='online',
-                player_2_fingerprint__isnull=True,
-                match_complete=False,
-                round_number=1
-            ).first()
-
-            # if existing_round and existing_round.player_1_fingerprint == player_fingerprint:
-            #     return JsonResponse({
-            #         "status": "error",
-            #         "message": "You are already registered in this match."
-            #     }, status=400)
-            if existing_round and existing_round.player_1_fingerprint == player_fingerprint:
-                # old abandoned search – wipe and start a new one
-                UltimatumGameRound.objects.filter(
-                    game_match_uuid = existing_round.game_match_uuid
-                ).delete()
-                existing_round = None
-            if existing_round:
-                # Join the existing match
-                existing_round.player_2_fingerprint = player_fingerprint
-                existing_round.player_2_country = 'Unknown'
-                existing_round.player_2_city = 'Unknown'
-                existing_round.player_2_ip_address = ip_address  # Store IP for player 2
-                existing_round.save()
-
-                match_id = existing_round.game_match_uuid
-                print(f"[create_match] joined existing match {match_id}")
-                return JsonResponse({
-                    'status': 'joined_existing_match',
-                    'match_id': match_id,
-                    'game_mode': existing_round.game_mode,
-                    'player_1_fingerprint': existing_round.player_1_fingerprint,
-                    'player_2_fingerprint': existing_round.player_2_fingerprint,
-                })
+            lobby = get_lobby()
 
-            else:
-                # Create a brand-new match
-                match_id = str(uuid.uuid4())[:8]
-                new_round = UltimatumGameRound.objects.create(
-                    game_match_uuid=match_id,
-                    round_number=1,
-                    game_mode=game_mode,
-                    player_1_fingerprint=player_fingerprint,
-                    player_1_country='Unknown',
-                    player_1_city='Unknown',
-                    player_1_ip_address=ip_address  # Store IP for player 1
+            if lobby is not None:
+                stale_id = lobby.waiting_match('ultimatum', player_fingerprint)
+                if stale_id:
+                    # old abandoned search – wipe and start a new one
+                    UltimatumMatch.objects.filter(game_match_uuid=stale_id).delete()
+                    lobby.leave('ultimatum', player_fingerprint, stale_id)
+
+                def create():
+                    own = start_match('online', player_fingerprint, ip_address)
+                    return own, own.game_match_uuid
+
+                game_match, joined = lobby.find_or_queue(
+                    'ultimatum', player_fingerprint,
+                    claim=lambda partner_id: UltimatumMatch.claim_waiting_match(
+                        player_fingerprint, ip_address, match_id=partner_id),
+                    create=create,
+                    discard=lambda own_id: UltimatumMatch.objects.filter(
+                        game_match_uuid=own_id).delete(),
                 )
+            else:
+                game_match = UltimatumMatch.claim_waiting_match(player_fingerprint, ip_address)
+                joined = game_match is not None
+                if not joined:
+                    # old abandoned search of this player – wipe it and start a new one
+                    UltimatumMatch.waiting_matches().filter(
+                        player_1_fingerprint=player_fingerprint
+                    ).delete()
+                    game_match = start_match('online', player_fingerprint, ip_address)
+
+            match_id = game_match.game_match_uuid
+            if joined:
+                print(f"[create_match] joined existing match {match_id}")
+                notify_matched(f"ultimatum_game_{match_id}",
+                               player_2_fingerprint=player_fingerprint)
+            else:
                 print(f"[create_match] created new match {match_id}")
-                return JsonResponse({
-                    'status': 'created_new_match',
-                    'match_id': match_id,
-                    'game_mode': new_round.game_mode,
-                    'player_1_fingerprint': new_round.player_1_fingerprint,
-                    'player_2_fingerprint': new_round.player_2_fingerprint,
-                })
+            return JsonResponse({
+                'status': 'joined_existing_match' if joined else 'created_new_match',
+                'match_id': match_id,
+                'game_mode': game_match.game_mode,
+                'player_1_fingerprint': game_match.player_1_fingerprint,
+                'player_2_fingerprint': game_match.player_2_fingerprint,
+            })
 
         elif game_mode == 'bot':
-            match_id = str(uuid.uuid4())[:8]
-            new_round = UltimatumGameRound.objects.create(
-                game_match_uuid=match_id,
-                round_number=1,
-                game_mode=game_mode,
-                player_1_fingerprint=player_fingerprint,
-                player_1_country='Unknown',
-                player_1_city='Unknown',
-                player_1_ip_address=ip_address,  # Store IP for player 1
-                player_2_fingerprint='bot',
-                player_2_country='Bot',
-                player_2_city='Bot',
-                player_2_ip_address=None  # Bot doesn't have an IP
-            )
+            game_match = start_match('bot', player_fingerprint, ip_address)
+            match_id = game_match.game_match_uuid
             print(f"[create_match] created bot match {match_id}")
             return JsonResponse({
                 'status': 'created_bot_match',
                 'match_id': match_id,
-                'game_mode': new_round.game_mode,
-                'player_1_fingerprint': new_round.player_1_fingerprint,
-                'player_2_fingerprint': new_round.player_2_fingerprint,
+                'game_mode': game_match.game_mode,
+                'player_1_fingerprint': game_match.player_1_fingerprint,
+                'player_2_fingerprint': game_match.player_2_fingerprint,
             })
 
         else:
@@ -132,25 +143,16 @@ def create_match(request):
 def game_page(request, match_id):
     """Render the game page for a specific match"""
     try:
-        # Check if match exists
-        match_exists = UltimatumGameRound.objects.filter(
-            game_match_uuid=match_id
-        ).exists()
+        game_match = UltimatumMatch.objects.filter(game_match_uuid=match_id).first()
         
-        if not match_exists:
+        if game_match is None:
             return render(request, 'ultimatum_game/error.html', {
                 'error_message': 'Match not found'
             })
         
-        # Get match info
-        first_round = UltimatumGameRound.objects.filter(
-            game_match_uuid=match_id,
-            round_number=1
-        ).first()
-        
         context = {
             'match_id': match_id,
-            'game_mode': first_round.game_mode if first_round else 'online',
+            'game_mode': game_match.game_mode,
             'websocket_url': f'ws://localhost:8000/ws/ultimatum-game/{match_id}/',
         }
         
@@ -166,12 +168,12 @@ def match_history(request, match_id):
     try:
         # Updated to use new field names
         rounds = UltimatumGameRound.objects.filter(
-            game_match_uuid=match_id,
+            match__game_match_uuid=match_id,
             player_1_coins_to_offer__isnull=False,
             player_2_coins_to_offer__isnull=False,
             player_1_response_to_p2_offer__isnull=False,
             player_2_response_to_p1_offer__isnull=False
-        ).order_by('round_number')
+        ).select_related('match').order_by('round_number')
         
         if not rounds.exists():
             return JsonResponse({
@@ -199,15 +201,16 @@ def match_history(request, match_id):
         
         # Get final match statistics
         last_round = rounds.last()
+        game_match = last_round.match
         
         return JsonResponse({
             'status': 'success',
             'match_id': match_id,
-            'game_mode': last_round.game_mode,
+            'game_mode': game_match.game_mode,
             'total_rounds': rounds.count(),
-            'match_complete': last_round.match_complete,
-            'player_1_final_score': last_round.player_1_final_score,
-            'player_2_final_score': last_round.player_2_final_score,
+            'match_complete': game_match.match_complete,
+            'player_1_final_score': game_match.player_1_final_score,
+            'player_2_final_score': game_match.player_2_final_score,
             'match_acceptance_rate': last_round.match_acceptance_rate,
             'match_average_offer': last_round.match_average_offer,
             'history': history
@@ -222,13 +225,13 @@ def match_history(request, match_id):
 def match_stats(request, match_id):
     """Get statistics for a specific match - handles both active and completed matches"""
     try:
-        # Get the first round to get basic match info
-        first_round = UltimatumGameRound.objects.filter(
-            game_match_uuid=match_id,
-            round_number=1
-        ).first()
+        # a finished match comes with its summary row in the same query
+        game_match = (UltimatumMatch.objects
+                      .select_related('summary')
+                      .filter(game_match_uuid=match_id)
+                      .first())
         
-        if not first_round:
+        if not game_match:
             return JsonResponse({
                 'status': 'error',
                 'message': 'Match not found'
@@ -236,103 +239,47 @@ def match_stats(request, match_id):
         
         # Count players
         players_count = 1  # Player 1 always exists
-        if first_round.player_2_fingerprint:
+        if game_match.player_2_fingerprint:
             players_count = 2
         
         # Check if match is ready (has 2 players or is bot mode)
         is_ready = (
             players_count == 2 or 
-            first_round.game_mode == 'bot'
+            game_match.game_mode == 'bot'
         )
         
-        # Get completed rounds using new field names
-        completed_rounds = UltimatumGameRound.objects.filter(
-            game_match_uuid=match_id,
-            player_1_coins_to_offer__isnull=False,
-            player_2_coins_to_offer__isnull=False,
-            player_1_response_to_p2_offer__isnull=False,
-            player_2_response_to_p1_offer__isnull=False
-        ).order_by('round_number')
-        
-        completed_count = completed_rounds.count()
+        if game_match.match_complete:
+            try:
+                round_stats = game_match.summary.round_stats()
+            except UltimatumMatchSummary.DoesNotExist:
+                # no summary row (not backfilled yet): aggregate, don't write on a GET
+                round_stats = game_match.round_stats()
+        else:
+            round_stats = game_match.round_stats()
+        completed_count = round_stats['completed_rounds']
         
         # Basic response for active matches
         response_data = {
             'status': 'success',
             'match_id': match_id,
-            'game_mode': first_round.game_mode,
+            'game_mode': game_match.game_mode,
             'players_count': players_count,
             'is_ready': is_ready,
-            'waiting_for_player_2': first_round.player_2_fingerprint is None and first_round.game_mode == 'online',
-            'match_complete': first_round.match_complete,
+            'waiting_for_player_2': game_match.player_2_fingerprint is None and game_match.game_mode == 'online',
+            'match_complete': game_match.match_complete,
             'completed_rounds': completed_count,
             'total_rounds': 25,
-            'player_1_fingerprint': first_round.player_1_fingerprint,
-            'player_2_fingerprint': first_round.player_2_fingerprint,
+            'player_1_fingerprint': game_match.player_1_fingerprint,
+            'player_2_fingerprint': game_match.player_2_fingerprint,
         }
         
-        if completed_rounds.exists():
-            last_round = completed_rounds.last()
-            
-            total_responses = 0
-            total_accepts = 0
-            
-            for round_obj in completed_rounds:
-                if round_obj.player_1_response_to_p2_offer:
-                    total_responses += 1
-                    if round_obj.player_1_response_to_p2_offer == 'accept':
-                        total_accepts += 1
-                
-                if round_obj.player_2_response_to_p1_offer:
-                    total_responses += 1
-                    if round_obj.player_2_response_to_p1_offer == 'accept':
-                        total_accepts += 1
-            
-            acceptance_rate = (total_accepts / total_responses * 100) if total_responses > 0 else 0
-            
-            # Calculate offer statistics using new field names
-            all_offers = []
-            for round_obj in completed_rounds:
-                if round_obj.player_1_coins_to_offer is not None:
-                    all_offers.append(round_obj.player_1_coins_to_offer)
-                if round_obj.player_2_coins_to_offer is not None:
-                    all_offers.append(round_obj.player_2_coins_to_offer)
-            
-            min_offer = min(all_offers) if all_offers else 0
-            max_offer = max(all_offers) if all_offers else 0
-            avg_offer = sum(all_offers) / len(all_offers) if all_offers else 0
-            
-            # Player-specific statistics using new field names
-            p1_offers = [r.player_1_coins_to_offer for r in completed_rounds if r.player_1_coins_to_offer is not None]
-            p2_offers = [r.player_2_coins_to_offer for r in completed_rounds if r.player_2_coins_to_offer is not None]
-            
-            p1_average_offer = sum(p1_offers) / len(p1_offers) if p1_offers else 0
-            p2_average_offer = sum(p2_offers) / len(p2_offers) if p2_offers else 0
-            
-            # Player response rates (how often their offers are accepted)
-            p1_offers_accepted = sum(1 for r in completed_rounds 
-                                   if r.player_1_coins_to_offer is not None and r.player_2_response_to_p1_offer == 'accept')
-            p2_offers_accepted = sum(1 for r in completed_rounds 
-                                   if r.player_2_coins_to_offer is not None and r.player_1_response_to_p2_offer == 'accept')
-            
-            p1_acceptance_rate = (p1_offers_accepted / len(p1_offers) * 100) if p1_offers else 0
-            p2_acceptance_rate = (p2_offers_accepted / len(p2_offers) * 100) if p2_offers else 0
-            
+        if completed_count:
             # Add detailed stats to response
+            response_data.update(round_stats)
             response_data.update({
-                'accepted_responses': total_accepts,
-                'rejected_responses': total_responses - total_accepts,
-                'overall_acceptance_rate': acceptance_rate,
-                'overall_average_offer': avg_offer,
-                'min_offer': min_offer,
-                'max_offer': max_offer,
-                'player_1_final_score': last_round.player_1_final_score,
-                'player_2_final_score': last_round.player_2_final_score,
-                'player_1_acceptance_rate': p1_acceptance_rate,
-                'player_2_acceptance_rate': p2_acceptance_rate,
-                'player_1_average_offer': p1_average_offer,
-                'player_2_average_offer': p2_average_offer,
-                'match_completed_at': last_round.match_completed_at,
+                'player_1_final_score': game_match.player_1_final_score,
+                'player_2_final_score': game_match.player_2_final_score,
+                'match_completed_at': game_match.match_completed_at,
             })
         
         return JsonResponse(response_data)
@@ -346,32 +293,59 @@ def match_stats(request, match_id):
         }, status=500)
 
 def active_matches(request):
-    """Get list of active (incomplete) matches"""
+    """
+    Get list of active (incomplete) matches, newest first.
+
+    Paginated by keyset: ?limit= (default 50, at most 200) and ?before=<the
+    next_cursor of the previous page>. With ACTIVE_MATCHES_CACHE_TTL set,
+    a page may be up to that many seconds old.
+    """
     try:
-        active_matches = UltimatumGameRound.objects.filter(
-            match_complete=False,
-            round_number=1
-        ).order_by('-row_number')
-        
+        try:
+            limit = min(max(int(request.GET.get('limit', ACTIVE_MATCHES_PAGE_SIZE)), 1),
+                        ACTIVE_MATCHES_MAX_PAGE_SIZE)
+            before = request.GET.get('before')
+            before = int(before) if before else None
+        except ValueError:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'limit and before must be integers'
+            }, status=400)
+
+        ttl = getattr(settings, 'ACTIVE_MATCHES_CACHE_TTL', 0)
+        cache_key = f'ultimatum:active_matches:{before}:{limit}'
+        if ttl:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return JsonResponse(cached)
+
+        # one more than asked for tells whether there is a next page
+        page = list(UltimatumMatch.active_page(before=before, limit=limit + 1))
+        has_more = len(page) > limit
+        page = page[:limit]
+
         matches_data = []
-        for match in active_matches:
-            completed_rounds = UltimatumGameRound.get_completed_rounds_count(match.game_match_uuid)
-            
+        for match in page:
             matches_data.append({
                 'match_id': match.game_match_uuid,
                 'game_mode': match.game_mode,
                 'player_1_fingerprint': match.player_1_fingerprint,
                 'player_2_fingerprint': match.player_2_fingerprint,
                 'waiting_for_player_2': match.player_2_fingerprint is None,
-                'completed_rounds': completed_rounds,
-                'created_at': match.round_start,
+                'completed_rounds': match.completed_rounds_count,
+                'created_at': match.created_at,
             })
         
-        return JsonResponse({
+        response_data = {
             'status': 'success',
             'active_matches': matches_data,
-            'total_active': len(matches_data)
-        })
+            'total_active': len(matches_data),
+            'has_more': has_more,
+            'next_cursor': page[-1].id if has_more else None,
+        }
+        if ttl:
+            cache.set(cache_key, response_data, ttl)
+        return JsonResponse(response_data)
         
     except Exception as e:
         return JsonResponse({
@@ -379,6 +353,10 @@ def active_matches(request):
             'message': f'Error retrieving active matches: {str(e)}'
         }, status=500)
 
+def export_rounds(request):
+    """CSV of every settled round, for staff (filters: see game/exports.py)"""
+    return export_response(request, 'ultimatum')
+
 def home(request):
     """Home page for the Ultimatum Game"""
     return render(request, 'ultimatum_game/home.html')
@@ -427,17 +405,14 @@ def cancel_match(request):
     if not match_id or not fp:
         return JsonResponse({"detail": "missing fields"}, status=400)
 
-    first = UltimatumGameRound.objects.filter(
+    first = UltimatumMatch.objects.filter(
         game_match_uuid        = match_id,
-        round_number           = 1,
         match_complete         = False,
         player_2_fingerprint__isnull = True,
     ).first()
 
     if first and first.player_1_fingerprint == fp:
-        deleted, _ = UltimatumGameRound.objects.filter(
-            game_match_uuid = match_id
-        ).delete()
+        deleted, _ = first.delete()
         return JsonResponse({"status": "cancelled", "deleted_rows": deleted})
 
     # someone already joined (or wrong fingerprint) → ignore
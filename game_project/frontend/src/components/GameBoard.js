@@ -6,6 +6,7 @@ import "./GameBoard.css"
 import Modal from "./Modal"
 import PayoffsTable from "./PayoffsTable"
 import GameTimer from "./GameTimer"
+import { STATE_PROTOCOL, receiveState } from "../services/stateSync"
 function GameBoard({ playerFingerprint }) {
   const { matchId } = useParams()
   const navigate = useNavigate()
@@ -36,6 +37,7 @@ function GameBoard({ playerFingerprint }) {
   const [waitingForMyAction, setWaitingForMyAction] = useState(false)
   const [myFingerprint, setMyFingerprint] = useState("")
   const socketRef = useRef(null)
+  const syncRef = useRef({ version: null, state: null })
   const timedOutRef = useRef(false)
   const [modal, setModal] = useState({ open: false, title: "", msg: "", redirectTo: "/prisoners" })
   const [roundPhase, setRoundPhase] = useState("choosing") // 'choosing', 'results', 'transition'
@@ -62,8 +64,8 @@ function GameBoard({ playerFingerprint }) {
     // Dynamic WebSocket URL
     const isLocalhost = window.location.hostname === 'localhost';
     const wsUrl = isLocalhost 
-      ? `ws://localhost:8001/ws/game/${matchId}/`  // Use backend port in development
-      : `${window.location.protocol === "https:" ? "wss:" : "ws:"}//${window.location.host}/ws/game/${matchId}/`;
+      ? `ws://localhost:8001/ws/game/${matchId}/?protocol=${STATE_PROTOCOL}`  // Use backend port in development
+      : `${window.location.protocol === "https:" ? "wss:" : "ws:"}//${window.location.host}/ws/game/${matchId}/?protocol=${STATE_PROTOCOL}`;
     
     const socket = new WebSocket(wsUrl)
     socketRef.current = socket
@@ -83,9 +85,11 @@ function GameBoard({ playerFingerprint }) {
       const data = JSON.parse(event.data)
       console.log("WebSocket message received:", data)
 
-      if (data.game_state) {
-        console.log("Game state update:", data.game_state)
-        updateGameState(data.game_state, fingerprint)
+      // full snapshots and per-round deltas
+      const fullState = receiveState(syncRef, data, socket)
+      if (fullState) {
+        console.log("Game state update:", fullState)
+        updateGameState(fullState, fingerprint)
       }
       
       if (data.game_aborted) {
@@ -1,4 +1,5 @@
 import { useState, useEffect, useRef, useCallback } from "react"
+import { STATE_PROTOCOL, receiveState } from "../services/stateSync"
 
 const PORT = 8001;
 
@@ -16,6 +17,7 @@ export const useWebSocket = (matchId, playerFingerprint) => {
   const reconnectTimeoutRef = useRef(null)
   const reconnectAttemptsRef = useRef(0)
   const connectionRef = useRef(null)
+  const syncRef = useRef({ version: null, state: null })
   const maxReconnectAttempts = 5
   const OFFER_TIME_LIMIT = 15;
   const [terminationReason, setTerminationReason]   = useState(null);  // NEW
@@ -45,7 +47,7 @@ export const useWebSocket = (matchId, playerFingerprint) => {
 
     try {
       // const wsUrl = `ws://localhost:8001/ws/ultimatum-game/${matchId}/`
-      const wsUrl = `${WS_BASE_URL}/ws/ultimatum-game/${matchId}/`;
+      const wsUrl = `${WS_BASE_URL}/ws/ultimatum-game/${matchId}/?protocol=${STATE_PROTOCOL}`;
       console.log("🔌 Connecting to WebSocket:", wsUrl)
       console.log("👤 Player fingerprint:", playerFingerprint)
 
@@ -94,11 +96,13 @@ export const useWebSocket = (matchId, playerFingerprint) => {
             return
           }
 
-          if (data.game_state) {
-            console.log("🎮 Game state update:", data.game_state)
-            setGameState(data.game_state)
+          // full snapshots and per-round deltas
+          const fullState = receiveState(syncRef, data, ws)
+          if (fullState) {
+            console.log("🎮 Game state update:", fullState)
+            setGameState(fullState)
             
-            if (data.game_state && !data.game_state.error) {
+            if (!fullState.error) {
               setError(null)
             }
           }
@@ -0,0 +1,37 @@
+// Versioned game state from the match sockets (protocol 2, see the
+// backend's game/state_sync.py): one full snapshot when the socket
+// connects, then only what changed each time the state moves on.
+export const STATE_PROTOCOL = 2
+
+export const applyStateDelta = (state, delta) => {
+  const next = { ...state, ...(delta.set || {}) }
+  Object.entries(delta.append || {}).forEach(([key, entries]) => {
+    next[key] = [...(next[key] || []), ...entries]
+  })
+  ;(delta.unset || []).forEach((key) => {
+    delete next[key]
+  })
+  return next
+}
+
+// Fold a socket message into the state kept in `syncRef` ({ version, state }).
+// Returns the full game state the message brings, or null. A delta that
+// doesn't follow the version we have asks the server for a fresh snapshot.
+export const receiveState = (syncRef, data, socket) => {
+  if (data.game_state) {
+    syncRef.current = { version: data.state_version, state: data.game_state }
+    return data.game_state
+  }
+  if (data.state_delta) {
+    const { version, state } = syncRef.current
+    if (!state || data.base_version !== version) {
+      console.log("🔄 Missed state version, asking for a snapshot")
+      socket.send(JSON.stringify({ action: "resync" }))
+      return null
+    }
+    const next = applyStateDelta(state, data.state_delta)
+    syncRef.current = { version: data.state_version, state: next }
+    return next
+  }
+  return null
+}